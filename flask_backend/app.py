@@ -42,12 +42,22 @@ logging.basicConfig(level=logging.DEBUG)
 app.logger.setLevel(logging.DEBUG)
 
 # 启动自动采集调度器（若已安装 APScheduler）
+# 后台训练任务的工作进程（spawn）会重新导入本模块，子进程中不启动调度器
 try:
-    from services.collector import DataCollector
-    DataCollector.instance().start()
+    import multiprocessing
+    if multiprocessing.parent_process() is None:
+        from services.collector import DataCollector
+        DataCollector.instance().start()
 except Exception as _:
     print('[WARN] 自动采集调度器未启动（可能未安装 APScheduler），不影响主功能')
 
+# 启动时建立一次 CSV 数据文件目录（表名 -> 路径/表头），之后按上传与目录修改时间增量维护
+try:
+    from services.csv_catalog import CsvCatalog
+    CsvCatalog.instance().rebuild()
+except Exception as e:
+    print(f'[WARN] CSV 目录初始化失败，将在首次查询时重试: {e}')
+
 @app.errorhandler(Exception)
 def handle_exception(e):
     """全局异常捕获，避免未处理异常导致服务器崩溃。"""
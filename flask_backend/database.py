@@ -6,8 +6,12 @@
 - 从 .env 或环境变量读取连接配置
 
 注意：
-- 本模块不持久化连接，每次操作新建与关闭（简单可靠，适合中小项目）
-- 生产环境可引入连接池（如 mysql-connector pooling）
+- 各 CRUD 辅助函数通过进程内连接池复用连接，调用方无需关心连接生命周期
+- 连接池容量/空闲回收/借出超时均可通过环境变量配置（见 ConnectionPool）
+- get_connection() 仍返回一个独立的新连接，供脚本等需要自行管理连接的场景使用
+- iter_batches() 用非缓冲游标分批读取大结果集（如导出），内存占用与表大小无关
+- BulkLoader / bulk_load() 批量写入：优先把数据暂存为 TSV 后用 LOAD DATA LOCAL INFILE 导入，
+  服务端未开启 local_infile 时回退为多行 INSERT ... VALUES (...),(...)，并统计每秒写入行数
 """
 
 # flask_backend/database.py
@@ -24,6 +28,12 @@ except Exception as e:
     print("[WARN] mysql-connector-python 未安装或导入失败，将以降级模式运行（优先使用 CSV 数据）。")
     print("       建议安装: pip install mysql-connector-python")
 import os
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import date, datetime
+from contextlib import contextmanager
 from pathlib import Path
 
 # 尝试加载环境变量（如果安装了 python-dotenv）
@@ -49,10 +59,11 @@ except ImportError:
     print("  建议运行: pip install python-dotenv")
 
 
-def get_connection():
+def get_connection(**options):
     """建立并返回一个新的数据库连接。
 
     优先从环境变量读取：DB_HOST, DB_USER, DB_PASSWORD, DB_NAME。
+    options 为额外的 mysql.connector.connect 参数（如 allow_local_infile=True）。
     注意：不要将生产密码写入代码；当前默认值仅用于开发便捷。
     """
     host = os.getenv('DB_HOST', 'localhost')
@@ -78,7 +89,8 @@ def get_connection():
             database=database,
             charset='utf8mb4',
             use_unicode=True,
-            collation='utf8mb4_unicode_ci'
+            collation='utf8mb4_unicode_ci',
+            **options
         )
     except Error as e:
         # 提供更友好的错误信息
@@ -92,99 +104,540 @@ def get_connection():
         ) from e
 
 
+class ConnectionPool:
+    """线程安全的 MySQL 连接池。
+
+    - min_size: 预热/保底的空闲连接数（空闲回收不会低于该值）
+    - max_size: 同时存在的连接上限（借出 + 空闲），超过时借出方等待
+    - idle_timeout: 空闲超过该秒数的连接会被回收（保留 min_size 个）
+    - acquire_timeout: 连接耗尽时的最长等待秒数，超时抛出 ConnectionError
+    - ping_interval: 空闲超过该秒数的连接在借出时先做健康检查（ping），失败则丢弃重建
+
+    配置来自环境变量：DB_POOL_MIN / DB_POOL_MAX / DB_POOL_IDLE_TIMEOUT /
+    DB_POOL_ACQUIRE_TIMEOUT / DB_POOL_PING_INTERVAL。
+    """
+
+    def __init__(self, min_size=1, max_size=10, idle_timeout=300.0, acquire_timeout=10.0, ping_interval=30.0):
+        self.min_size = max(0, int(min_size))
+        self.max_size = max(1, int(max_size), self.min_size)
+        self.idle_timeout = float(idle_timeout)
+        self.acquire_timeout = float(acquire_timeout)
+        self.ping_interval = float(ping_interval)
+        self._cond = threading.Condition(threading.Lock())
+        # 空闲连接队列：(conn, 最近一次归还时间)，右端为最近归还
+        self._idle = deque()
+        self._in_use = 0
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'closed': 0,
+            'evicted_idle': 0,
+            'failed_health_checks': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            min_size=int(os.getenv('DB_POOL_MIN', '1')),
+            max_size=int(os.getenv('DB_POOL_MAX', '10')),
+            idle_timeout=float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            acquire_timeout=float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT', '10')),
+            ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', '30')),
+        )
+
+    def _total(self):
+        return self._in_use + len(self._idle)
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats['closed'] += 1
+
+    def _evict_idle_locked(self, now):
+        """回收空闲过久的连接（从最久未用的左端开始），保留 min_size 个。返回待关闭连接。"""
+        expired = []
+        while self._idle and len(self._idle) > self.min_size:
+            conn, last_used = self._idle[0]
+            if now - last_used < self.idle_timeout:
+                break
+            self._idle.popleft()
+            expired.append(conn)
+        self._stats['evicted_idle'] += len(expired)
+        return expired
+
+    def _is_healthy(self, conn, idle_for):
+        """借出前的健康检查：刚归还的连接只看本地状态，空闲较久的连接再 ping 服务端。"""
+        try:
+            if idle_for < self.ping_interval:
+                return conn.is_connected() if hasattr(conn, 'is_connected') else True
+            conn.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def acquire(self):
+        """借出一个连接；池内无空闲且已达上限时等待其他线程归还。"""
+        deadline = time.monotonic() + self.acquire_timeout
+        while True:
+            expired = []
+            candidate = None
+            create = False
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    expired.extend(self._evict_idle_locked(now))
+                    if self._idle:
+                        # 优先复用最近归还的连接（LIFO），让最久未用的自然老化回收
+                        candidate = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._total() < self.max_size:
+                        self._in_use += 1
+                        create = True
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise ConnectionError(
+                            f"数据库连接池已耗尽（max_size={self.max_size}），等待 {self.acquire_timeout} 秒后仍无可用连接"
+                        )
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+            for conn in expired:
+                self._close_quietly(conn)
+
+            if create:
+                try:
+                    conn = get_connection()
+                except Exception:
+                    with self._cond:
+                        self._in_use -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+                return conn
+
+            conn, last_used = candidate
+            if self._is_healthy(conn, time.monotonic() - last_used):
+                with self._cond:
+                    self._stats['reused'] += 1
+                return conn
+            # 健康检查失败：丢弃该连接，释放名额后重新借出
+            with self._cond:
+                self._in_use -= 1
+                self._stats['failed_health_checks'] += 1
+                self._cond.notify()
+            self._close_quietly(conn)
+
+    def release(self, conn, discard=False):
+        """归还连接。discard=True（如执行中出现连接级错误）时直接关闭而不放回池中。"""
+        if conn is None:
+            return
+        if not discard:
+            try:
+                # 结束只读事务，避免 InnoDB 一致性快照在复用时读到旧数据
+                conn.rollback()
+            except Exception:
+                discard = True
+        with self._cond:
+            self._in_use -= 1
+            if not discard:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+        if discard:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        discard = False
+        try:
+            yield conn
+        except Error:
+            # 数据库错误后连接状态不确定，若已断开则不再复用
+            try:
+                discard = not conn.is_connected()
+            except Exception:
+                discard = True
+            raise
+        finally:
+            self.release(conn, discard=discard)
+
+    def close_all(self):
+        """关闭所有空闲连接（借出中的连接在归还后仍会正常入池）。"""
+        with self._cond:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+        for conn in idle:
+            self._close_quietly(conn)
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'total': self._total(),
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+            })
+        return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """返回进程级连接池（惰性创建）。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool.from_env()
+    return _pool
+
+
+def get_pool_stats():
+    """连接池统计：创建/复用/回收次数、等待与超时次数、当前借出/空闲连接数。"""
+    return get_pool().stats()
+
+
 def execute_query(query, params=None):
     """执行写操作（INSERT/UPDATE/DELETE）。"""
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params or ())
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params or ())
+            conn.commit()
+        finally:
+            cur.close()
 
 
 def execute_many(query, seq_params):
     """批量执行写操作（INSERT/UPDATE/DELETE）。"""
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.executemany(query, seq_params or [])
-        conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.executemany(query, seq_params or [])
+            conn.commit()
+        finally:
+            cur.close()
 
 
 def execute_insert_return_id(query, params=None):
     """执行INSERT并返回自增ID。"""
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute(query, params or ())
-        conn.commit()
-        return cur.lastrowid
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params or ())
+            conn.commit()
+            return cur.lastrowid
+        finally:
+            cur.close()
 
 
 def fetch_one(query, params=None):
     """查询一条记录，返回 dict。"""
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
-    try:
-        cur.execute(query, params or ())
-        r = cur.fetchone()
-        return r
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(query, params or ())
+            r = cur.fetchone()
+            return r
+        finally:
+            cur.close()
 
 
 def fetch_all(query, params=None):
     """查询多条记录，返回 list[dict]。"""
-    conn = get_connection()
-    cur = conn.cursor(dictionary=True)
+    with get_pool().connection() as conn:
+        cur = conn.cursor(dictionary=True)
+        try:
+            cur.execute(query, params or ())
+            r = cur.fetchall()
+            return r
+        finally:
+            cur.close()
+
+
+def iter_batches(query, params=None, batch_size=1000):
+    """以非缓冲（服务端）游标分批读取查询结果，逐批产出 (列名列表, 行元组列表)。
+
+    结果集不会整体载入内存，每次只保留一批行；空结果也会产出一次 (列名列表, [])。
+    生成器未读完就被关闭（如客户端中途断开下载）时，连接上仍有未读结果，直接关闭而不放回池中。
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    cur = None
+    finished = False
     try:
+        cur = conn.cursor(buffered=False)
         cur.execute(query, params or ())
-        r = cur.fetchall()
-        return r
+        columns = [d[0] for d in (cur.description or [])]
+        emitted = False
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            emitted = True
+            yield columns, rows
+        if not emitted:
+            yield columns, []
+        finished = True
     finally:
-        cur.close()
-        conn.close()
+        if cur is not None:
+            try:
+                cur.close()
+            except Exception:
+                pass
+        pool.release(conn, discard=not finished)
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _tsv_field(v):
+    """单个值转为 LOAD DATA 默认格式（制表符分隔、反斜杠转义）的字段文本，None 写为 \\N。"""
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return '1' if v else '0'
+    if isinstance(v, float):
+        if v != v or v in (float('inf'), float('-inf')):
+            return '\\N'
+        return repr(v)
+    if isinstance(v, datetime):
+        return v.strftime('%Y-%m-%d %H:%M:%S.%f')
+    if isinstance(v, date):
+        return v.isoformat()
+    if isinstance(v, (bytes, bytearray)):
+        v = bytes(v).decode('utf-8', errors='replace')
+    s = str(v)
+    if ('\\' in s) or ('\t' in s) or ('\n' in s) or ('\r' in s) or ('\0' in s):
+        s = (s.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+              .replace('\r', '\\r').replace('\0', '\\0'))
+    return s
+
+
+class BulkLoader:
+    """批量写入器：一个专用连接 + 每次 load() 一个事务。
+
+    - 优先 LOAD DATA LOCAL INFILE：把本批行写入临时 TSV 文件后由服务端一次性导入
+    - 服务端 local_infile=OFF、客户端关闭（DB_LOCAL_INFILE=false）或导入失败时，
+      回退为多行 INSERT，每条语句 BULK_INSERT_BATCH_ROWS 行（默认 1000）
+    - upsert=True 时主键/唯一键冲突改为更新（ON DUPLICATE KEY UPDATE）：
+      LOAD DATA 先导入同结构的临时表，再 INSERT ... SELECT 合并到目标表
+
+    注意：LOAD DATA LOCAL 下数据转换问题只产生警告（与 IGNORE 相同），不会像 INSERT 那样报错；
+    允许 local_infile 的连接只在此处单独创建，不放入连接池。
+    """
+
+    def __init__(self, table, columns, upsert=False, batch_rows=None):
+        self.table = table
+        self.columns = list(columns)
+        self.upsert = bool(upsert)
+        if batch_rows is None:
+            try:
+                batch_rows = int(os.getenv('BULK_INSERT_BATCH_ROWS', '1000'))
+            except Exception:
+                batch_rows = 1000
+        self.batch_rows = max(1, int(batch_rows))
+        self.use_local_infile = _env_flag('DB_LOCAL_INFILE', 'true')
+        self.method = None
+        self.rows = 0
+        self.seconds = 0.0
+        self._conn = None
+        self._staging = None
+
+    # ---- 连接 ----
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def open(self):
+        if self._conn is not None:
+            return
+        if self.use_local_infile:
+            try:
+                self._conn = get_connection(allow_local_infile=True)
+                cur = self._conn.cursor()
+                try:
+                    cur.execute("SELECT @@GLOBAL.local_infile")
+                    row = cur.fetchone()
+                finally:
+                    cur.close()
+                if not (row and str(row[0]).lower() in ('1', 'on')):
+                    self.use_local_infile = False
+            except Exception as e:
+                print(f"[BulkLoader] 无法启用 LOAD DATA LOCAL INFILE，改用多行 INSERT: {e}")
+                self.use_local_infile = False
+        if self._conn is None:
+            self._conn = get_connection()
+        self.method = 'load_data' if self.use_local_infile else 'insert'
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    # ---- 写入 ----
+    def _cols_sql(self):
+        return ", ".join(f"`{c}`" for c in self.columns)
+
+    def _update_sql(self):
+        return ", ".join(f"`{c}`=VALUES(`{c}`)" for c in self.columns)
+
+    def _load_data(self, cur, rows):
+        target = self.table
+        if self.upsert:
+            if self._staging is None:
+                self._staging = f"_bulk_{os.getpid()}_{threading.get_ident()}"
+                cur.execute(f"CREATE TEMPORARY TABLE `{self._staging}` LIKE `{self.table}`")
+            cur.execute(f"DELETE FROM `{self._staging}`")
+            target = self._staging
+        fd, path = tempfile.mkstemp(prefix='bulk_', suffix='.tsv')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='\n') as f:
+                for row in rows:
+                    f.write('\t'.join(_tsv_field(v) for v in row))
+                    f.write('\n')
+            local_path = path.replace('\\', '/').replace("'", "\\'")
+            cur.execute(
+                f"LOAD DATA LOCAL INFILE '{local_path}' INTO TABLE `{target}` CHARACTER SET utf8mb4 "
+                "FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({self._cols_sql()})"
+            )
+        finally:
+            try:
+                os.remove(path)
+            except Exception:
+                pass
+        if self.upsert:
+            cur.execute(
+                f"INSERT INTO `{self.table}` ({self._cols_sql()}) SELECT {self._cols_sql()} FROM `{target}` "
+                f"ON DUPLICATE KEY UPDATE {self._update_sql()}"
+            )
+
+    def _multi_insert(self, cur, rows):
+        one = "(" + ", ".join(["%s"] * len(self.columns)) + ")"
+        head = f"INSERT INTO `{self.table}` ({self._cols_sql()}) VALUES "
+        tail = f" ON DUPLICATE KEY UPDATE {self._update_sql()}" if self.upsert else ""
+        for start in range(0, len(rows), self.batch_rows):
+            batch = rows[start:start + self.batch_rows]
+            params = [v for row in batch for v in row]
+            cur.execute(head + ", ".join([one] * len(batch)) + tail, params)
+
+    def load(self, rows):
+        """在一个事务中写入 rows（行元组序列，顺序与 columns 一致），返回行数；失败时回滚并抛出异常。"""
+        rows = rows if isinstance(rows, list) else list(rows)
+        if not rows:
+            return 0
+        self.open()
+        started = time.perf_counter()
+        cur = self._conn.cursor()
+        try:
+            if self.use_local_infile:
+                try:
+                    self._load_data(cur, rows)
+                except Error as e:
+                    # 服务端拒绝本地文件等情况：本批回滚后改用多行 INSERT，后续批次不再尝试
+                    print(f"[BulkLoader] LOAD DATA 失败，改用多行 INSERT: {e}")
+                    self._conn.rollback()
+                    self.use_local_infile = False
+                    self.method = 'insert'
+                    self._multi_insert(cur, rows)
+            else:
+                self._multi_insert(cur, rows)
+            self._conn.commit()
+        except Exception:
+            try:
+                self._conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            cur.close()
+        self.rows += len(rows)
+        self.seconds += time.perf_counter() - started
+        return len(rows)
+
+    def stats(self):
+        return {
+            'method': self.method,
+            'rows': self.rows,
+            'seconds': round(self.seconds, 3),
+            'rows_per_sec': round(self.rows / self.seconds, 1) if self.seconds > 0 else None,
+        }
+
+
+def bulk_load(table, columns, rows, upsert=False, batch_rows=None):
+    """一次性批量写入（单个事务），返回 BulkLoader.stats()：写入方式、行数、耗时与每秒行数。"""
+    with BulkLoader(table, columns, upsert=upsert, batch_rows=batch_rows) as loader:
+        loader.load(rows)
+        return loader.stats()
 
 
 def get_tables():
     """获取数据库中的所有表名。"""
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        cur.execute("SHOW TABLES")
-        tables = [table[0] for table in cur.fetchall()]
-        return tables
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute("SHOW TABLES")
+            tables = [table[0] for table in cur.fetchall()]
+            return tables
+        finally:
+            cur.close()
 
 
 def get_columns(table_name: str):
     """获取指定表的所有列名。"""
-    conn = get_connection()
-    cur = conn.cursor()
-    try:
-        # 使用 INFORMATION_SCHEMA 查询当前数据库的列
-        cur.execute(
-            """
-            SELECT COLUMN_NAME
-            FROM INFORMATION_SCHEMA.COLUMNS
-            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
-            ORDER BY ORDINAL_POSITION
-            """,
-            (table_name,)
-        )
-        cols = [row[0] for row in cur.fetchall()]
-        return cols
-    finally:
-        cur.close()
-        conn.close()
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            # 使用 INFORMATION_SCHEMA 查询当前数据库的列
+            cur.execute(
+                """
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+                ORDER BY ORDINAL_POSITION
+                """,
+                (table_name,)
+            )
+            cols = [row[0] for row in cur.fetchall()]
+            return cols
+        finally:
+            cur.close()
+
+
+def get_primary_key(table_name: str):
+    """获取指定表的主键列名列表（按主键内顺序），无主键时返回空列表。"""
+    with get_pool().connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(
+                """
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.KEY_COLUMN_USAGE
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND CONSTRAINT_NAME = 'PRIMARY'
+                ORDER BY ORDINAL_POSITION
+                """,
+                (table_name,)
+            )
+            return [row[0] for row in cur.fetchall()]
+        finally:
+            cur.close()
@@ -10,27 +10,40 @@
 """
 
 from flask import Blueprint, request, jsonify
-from flask import Response, send_file
+from flask import Response, stream_with_context
 import pandas as pd
 import numpy as np
 import traceback, sys
-from database import fetch_all, get_tables, execute_query, fetch_one, get_columns, execute_insert_return_id, execute_many
+from database import fetch_all, get_tables, execute_query, fetch_one, get_columns, get_primary_key, execute_insert_return_id, execute_many, iter_batches
 import os
 import io
+import csv
 import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 from pathlib import Path
 from datetime import datetime
 from werkzeug.utils import secure_filename
 from services.preprocessing import preprocess_df
+from services.table_cache import TableCache, share_frame
+from services.table_pager import TablePager
+from services.serialization import table_page_records, frame_to_columns
+from services.ingest import iter_file_chunks, infer_schema, insert_chunks, estimate_rows, detect_text_encoding, IngestCancelled
+from services.ingest_workers import IngestWorkers
+from services.upload_sessions import UploadSessionStore, UploadSessionError, save_stream
+from services.csv_catalog import CsvCatalog
+from services.table_snapshots import TableSnapshotStore, file_version
+from services.single_flight import SingleFlight
+from services.table_state import TableState
+from services.shared_tables import SharedTableStore
 import re
 
 analysis_bp = Blueprint('analysis_bp', __name__)
 
-# 用于存储处理后的数据的内存缓存
-global_data = {}
-global_data['dirty_tables'] = set()
-global_data['column_labels'] = {}
+# 跨请求共享的状态（当前表、列显示名缓存），线程安全；表数据缓存见 TableCache
+table_state = TableState.instance()
+# 表数据加载的单飞协调（合并同一张表的并发未命中）
+_table_loads = SingleFlight()
 
 # 计算可用数据表（DB + CSV）
 def _list_available_tables():
@@ -47,26 +60,9 @@ def _list_available_tables():
             if t: tables.add(str(t))
     except Exception:
         pass
-    # CSV tables (fallback)
+    # CSV tables (fallback)：database_datasets 与 uploads（递归）中的 CSV，由 CsvCatalog 增量维护
     try:
-        base1 = Path(__file__).parent.parent / 'database_datasets'
-        base2 = Path(__file__).parent.parent.parent / 'database_datasets'
-        uploads_dir = Path(__file__).parent.parent / 'uploads'
-        for base in (base1, base2):
-            if base.exists() and base.is_dir():
-                for p in base.glob('*.csv'):
-                    name = p.stem
-                    if name:
-                        tables.add(name)
-        # 递归扫描 uploads 下的所有 csv
-        if uploads_dir.exists() and uploads_dir.is_dir():
-            for p in uploads_dir.rglob('*.csv'):
-                try:
-                    name = p.stem
-                    if name:
-                        tables.add(name)
-                except Exception:
-                    continue
+        tables.update(CsvCatalog.instance().tables())
     except Exception:
         pass
     return sorted(tables)
@@ -81,29 +77,13 @@ def _get_table_columns_any(table_name: str):
             return [str(c) for c in cols]
     except Exception:
         pass
-    # Fallback to CSV header
-    csv_candidates = [
-        Path(__file__).parent.parent / 'database_datasets' / f'{table_name}.csv',
-        Path(__file__).parent.parent.parent / 'database_datasets' / f'{table_name}.csv'
-    ]
-    # 在 uploads 目录中递归查找匹配文件名的 CSV
+    # Fallback to CSV header（CsvCatalog 缓存了表头，文件未变化时不再读取）
     try:
-        uploads_dir = Path(__file__).parent.parent / 'uploads'
-        if uploads_dir.exists() and uploads_dir.is_dir():
-            for p in uploads_dir.rglob('*.csv'):
-                if p.stem == table_name:
-                    csv_candidates.insert(0, p)
-                    break
+        entry = CsvCatalog.instance().lookup(table_name)
+        if entry is not None:
+            return list(entry.header)
     except Exception:
         pass
-    for p in csv_candidates:
-        try:
-            if p.exists():
-                cols = _read_csv_header_with_fallbacks(p)
-                if cols is not None:
-                    return cols
-        except Exception:
-            continue
     return []
 
 # 读取 CSV 表头，尝试多编码与分隔符自动嗅探
@@ -136,6 +116,24 @@ def _read_csv_full_with_fallbacks(path: Path):
         else:
             raise Exception(f'无法读取CSV: {path}')
 
+def _read_catalog_csv(table_name):
+    """按 CsvCatalog 缓存的编码与分隔符读取该表优先级最高的 CSV，返回 (DataFrame, 路径)。
+
+    目录中没有该表或按缓存格式读取失败时返回 (None, None)，由调用方退回逐个编码尝试的读取方式。
+    """
+    try:
+        entry = CsvCatalog.instance().lookup(table_name)
+    except Exception as e:
+        print(f"[CsvCatalog] 查询 CSV 失败: {e}")
+        return None, None
+    if entry is None or not entry.encoding:
+        return None, None
+    try:
+        return pd.read_csv(entry.path, encoding=entry.encoding, sep=entry.delimiter or ','), entry.path
+    except Exception as e:
+        print(f"[CsvCatalog] 按缓存格式读取 {entry.path} 失败，改为逐个编码尝试: {e}")
+        return None, None
+
 # 通用：将空字符串/特殊字样转为 None，避免写入数值列失败
 def _normalize_empty_values(value):
     try:
@@ -164,15 +162,98 @@ def mark_table_dirty(table_name: str):
     try:
         if not isinstance(table_name, str) or not table_name:
             return
-        ds = global_data.get('dirty_tables')
-        if isinstance(ds, set):
-            ds.add(table_name)
-        else:
-            global_data['dirty_tables'] = {table_name}
+        # 原子地移除缓存条目并递增代数（O(1)）：进行中的加载完成后不会把旧数据写回缓存；
+        # 同时让分页的 COUNT(*)/行偏移索引失效
+        TableCache.instance().invalidate(table_name)
+        TablePager.instance().invalidate(table_name)
+        # 删除持久化快照，重启后不会读到旧数据
+        TableSnapshotStore.instance().invalidate(table_name)
+        # 多 worker 共享缓存：递增登记表中的代数，其它 worker 下次访问时丢弃本地副本
+        shared = SharedTableStore.instance()
+        if shared.enabled:
+            shared.invalidate(table_name)
     except Exception:
         # 兜底，避免影响主流程
         pass
 
+def _delta_max_rows() -> int:
+    try:
+        return int(os.getenv('TABLE_DELTA_MAX_ROWS', '50000'))
+    except Exception:
+        return 50000
+
+def apply_table_delta(table_name: str, key_column=None, last_max_id=None, updated_column=None,
+                      last_max_updated=None, expected_rows=None) -> bool:
+    """采集器发现新数据后，只拉取增量行并入已缓存的表，而不是整表失效后重新 SELECT *。
+
+    - key_column：拉取 key_column > last_max_id 的行（新增）
+    - updated_column：拉取 updated_column > last_max_updated 的行，按主键覆盖已缓存的旧行（新增 + 修改）
+    表不在缓存中、缺少基线、增量超过 TABLE_DELTA_MAX_ROWS 或并入失败时退化为 mark_table_dirty。
+    返回是否以增量方式完成。
+    """
+    if not isinstance(table_name, str) or not table_name:
+        return False
+    cache = TableCache.instance()
+    enabled = str(os.getenv('TABLE_DELTA_APPLY', 'true')).strip().lower() not in ('0', 'false', 'no', 'off')
+    limit = _delta_max_rows()
+    if not enabled or not cache.contains(table_name) or (expected_rows is not None and int(expected_rows) > limit):
+        mark_table_dirty(table_name)
+        return False
+    try:
+        if key_column and last_max_id is not None:
+            upsert_key = key_column
+            sql = f"SELECT * FROM `{table_name}` WHERE `{key_column}` > %s ORDER BY `{key_column}` LIMIT {limit + 1}"
+            params = [last_max_id]
+        elif updated_column and last_max_updated is not None:
+            pk = get_primary_key(table_name) or []
+            if len(pk) != 1:
+                # 无单列主键时无法按键覆盖被修改的行
+                mark_table_dirty(table_name)
+                return False
+            upsert_key = pk[0]
+            sql = f"SELECT * FROM `{table_name}` WHERE `{updated_column}` > %s LIMIT {limit + 1}"
+            params = [last_max_updated]
+        else:
+            mark_table_dirty(table_name)
+            return False
+        rows = fetch_all(sql, params) or []
+        if len(rows) > limit:
+            mark_table_dirty(table_name)
+            return False
+        result = cache.apply_delta(table_name, pd.DataFrame(rows), upsert_key) if rows else {'appended': 0, 'replaced': 0}
+        if result is None:
+            mark_table_dirty(table_name)
+            return False
+        # 派生数据同步：分页的 COUNT(*) 加上新增行数；持久化快照按新的同步位置重写
+        TablePager.instance().adjust_count(table_name, result['appended'])
+        if result.get('frame') is not None:
+            snapshots = TableSnapshotStore.instance()
+            snapshots.save(table_name, snapshots.db_version(table_name), result['frame'], source='db')
+            # 共享缓存发布新一代数据，其它 worker 直接映射而不必各自并入增量
+            shared = SharedTableStore.instance()
+            if shared.enabled:
+                shared.publish(table_name, result['frame'])
+        print(f"表 {table_name} 增量并入: 新增 {result['appended']} 行, 覆盖 {result['replaced']} 行")
+        return True
+    except Exception as e:
+        print(f"表 {table_name} 增量并入失败，改为整表失效: {e}")
+        mark_table_dirty(table_name)
+        return False
+
+def get_student_rows(df: pd.DataFrame, student_id, column: str = 'student_id') -> pd.DataFrame:
+    """按学号筛选行，语义等同 df[df[column].astype(str) == str(student_id)]。
+
+    df 为 get_table_data 返回的缓存视图时走表缓存的哈希索引（O(命中行数)），
+    否则（已筛选/重排/非缓存数据）退化为整列比较。
+    """
+    try:
+        pos = TableCache.instance().lookup_rows(df, student_id, column)
+    except Exception:
+        pos = None
+    if pos is not None:
+        return df.iloc[pos]
+    return df[df[column].astype(str) == str(student_id)]
+
 # -----------------------------
 # New analytics for new datasets (university_grades, students)
 # -----------------------------
@@ -351,7 +432,8 @@ def ug_calculus_by_factors_bucket():
     try:
         # 支持从前端指定表，默认 university_grades
         table_name = request.args.get('table', 'university_grades')
-        ug = get_table_data(table_name)
+        # 下方会原地改写目标列，显式取独立副本
+        ug = get_table_data(table_name, copy=True)
         if ug is None or ug.empty:
             return jsonify({'status': 'success', 'labels': [], 'series': []}), 200
 
@@ -383,7 +465,7 @@ def ug_calculus_by_factors_bucket():
             try:
                 st = get_table_data('students')
                 if st is not None and not st.empty and 'student_id' in st.columns:
-                    sdf = st[st['student_id'].astype(str) == str(sid)]
+                    sdf = get_student_rows(st, sid)
                     if not sdf.empty:
                         stu_grade = str(sdf.iloc[0].get('grade')) if 'grade' in sdf.columns else None
                         stu_class = str(sdf.iloc[0].get('class')) if 'class' in sdf.columns else None
@@ -486,7 +568,7 @@ def ug_avg_score_by_student_grade():
     """
     try:
         score_col = request.args.get('score_col', 'calculus_avg_score')
-        ug = get_table_data('university_grades')
+        ug = get_table_data('university_grades', copy=True)
         st = get_table_data('students')
         if ug is None or ug.empty or st is None or st.empty:
             return jsonify({'status': 'success', 'labels': [], 'avg': []}), 200
@@ -545,7 +627,7 @@ def get_student_detail():
         # 1. profile: 若有 students 表，优先查 students
         st = get_table_data('students')
         if st is not None and not st.empty and 'student_id' in st.columns:
-            sdf = st[st['student_id'].astype(str) == str(sid)]
+            sdf = get_student_rows(st, sid)
             if not sdf.empty:
                 row = sdf.iloc[0]
                 profile = {
@@ -564,7 +646,7 @@ def get_student_detail():
         grades_table = table if table else 'university_grades'
         ug = get_table_data(grades_table)
         if ug is not None and not ug.empty and 'student_id' in ug.columns:
-            ugf = ug[ug['student_id'].astype(str) == str(sid)]
+            ugf = get_student_rows(ug, sid)
             if not ugf.empty:
                 ur = ugf.iloc[0]
                 def to_float(v):
@@ -724,21 +806,12 @@ def get_table_data(table_name: str):
         return df
     except Exception:
         # Fallback to CSV (including uploads directory)
-        csv_candidates = [
-            Path(__file__).parent.parent / 'database_datasets' / f'{table_name}.csv',
-            Path(__file__).parent.parent.parent / 'database_datasets' / f'{table_name}.csv'
-        ]
-        # 递归查找 uploads 目录，优先匹配 {table_name}.csv
-        try:
-            uploads_dir = Path(__file__).parent.parent / 'uploads'
-            if uploads_dir.exists() and uploads_dir.is_dir():
-                for p in uploads_dir.rglob('*.csv'):
-                    if p.stem == table_name:
-                        csv_candidates.insert(0, p)
-                        break
-        except Exception:
-            pass
-        for p in csv_candidates:
+        df, _ = _read_catalog_csv(table_name)
+        if df is not None:
+            if table_name == 'university_grades' and not df.empty:
+                df = _normalize_university_grades_df(df)
+            return df
+        for p in _table_csv_candidates(table_name):
             try:
                 if p.exists():
                     df = _read_csv_full_with_fallbacks(p)
@@ -863,13 +936,13 @@ def student_feedback():
         students_df = get_table_data(students_table)
         hg_df = get_table_data(grades_table)
         exam_df = get_table_data(exams_table)
-        perf_df = get_table_data(performance_table)
+        perf_df = get_table_data(performance_table, copy=True)
         courses_df = get_table_data(courses_table)
 
         # 学生基本信息
         student_info = None
         if students_df is not None and not students_df.empty:
-            srow = students_df[students_df['student_id'].astype(str) == str(student_id)]
+            srow = get_student_rows(students_df, student_id)
             if not srow.empty:
                 sr = srow.iloc[0]
                 student_info = {
@@ -898,7 +971,7 @@ def student_feedback():
             'by_course': []
         }
         if hg_df is not None and not hg_df.empty:
-            sdf = hg_df[hg_df['student_id'].astype(str) == str(student_id)].copy()
+            sdf = get_student_rows(hg_df, student_id).copy()
             if course_id and 'course_id' in sdf.columns:
                 sdf = sdf[sdf['course_id'].astype(str) == str(course_id)]
             if not sdf.empty:
@@ -947,7 +1020,7 @@ def student_feedback():
         # 最近考试成绩（每门课取最近一次）
         latest_exams = []
         if exam_df is not None and not exam_df.empty:
-            edf = exam_df[exam_df['student_id'].astype(str) == str(student_id)].copy()
+            edf = get_student_rows(exam_df, student_id).copy()
             if course_id and 'course_id' in edf.columns:
                 edf = edf[edf['course_id'].astype(str) == str(course_id)]
             if not edf.empty:
@@ -986,7 +1059,7 @@ def student_feedback():
                 if col in perf_df.columns:
                     perf_df[col] = pd.to_numeric(perf_df[col], errors='coerce')
             # 学生数据
-            pdf = perf_df[perf_df['student_id'].astype(str) == str(student_id)] if 'student_id' in perf_df.columns else pd.DataFrame()
+            pdf = get_student_rows(perf_df, student_id) if 'student_id' in perf_df.columns else pd.DataFrame()
             # 课程过滤
             if course_id and not pdf.empty and 'course_id' in pdf.columns:
                 pdf = pdf[pdf['course_id'].astype(str) == str(course_id)]
@@ -1252,6 +1325,22 @@ def list_student_feedback_history():
         traceback.print_exc(file=sys.stdout)
         return jsonify({'status': 'error', 'message': f'查询历史失败: {str(e)}'}), 500
 
+@analysis_bp.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """返回表数据缓存的占用与命中统计"""
+    try:
+        data = TableCache.instance().stats()
+        data['pager'] = TablePager.instance().stats()
+        data['ingest'] = IngestWorkers.instance().stats()
+        data['csv_catalog'] = CsvCatalog.instance().stats()
+        data['snapshots'] = TableSnapshotStore.instance().stats()
+        data['single_flight'] = _table_loads.stats()
+        data['shared'] = SharedTableStore.instance().stats()
+        return jsonify({'status': 'success', 'data': data}), 200
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
 @analysis_bp.route('/tables', methods=['GET'])
 def list_tables():
     """获取数据库中的所有表名"""
@@ -1442,7 +1531,7 @@ def get_student_trends():
         
         # 如果有学生ID参数，过滤数据
         if student_id and 'student_id' in df.columns:
-            df = df[df['student_id'].astype(str) == str(student_id)]
+            df = get_student_rows(df, student_id)
         
         # 如果没有时间列或数值列，使用默认数据
         if not time_column or not numeric_columns or df.empty:
@@ -1612,7 +1701,7 @@ def get_student_progress():
         if df is not None and not df.empty:
             # 如果指定了学生ID，过滤数据
             if student_id and 'student_id' in df.columns:
-                df = df[df['student_id'].astype(str) == str(student_id)]
+                df = get_student_rows(df, student_id)
             
             # 查找时间列
             time_column = None
@@ -1753,19 +1842,16 @@ def get_friendly_column_name(col):
     key = str(col or '').strip()
     # 优先使用上传时记录的原始/显示列名映射
     try:
-        table_name = global_data.get('current_table')
+        table_name = table_state.current_table
         if isinstance(table_name, str) and table_name:
-            labels_cache = global_data.get('column_labels') or {}
-            labels = labels_cache.get(table_name)
+            labels = table_state.column_labels(table_name)
             if labels is None:
                 rows = fetch_all(
                     "SELECT stored_name, COALESCE(display_name, original_name) AS label FROM table_column_mapping WHERE table_name=%s ORDER BY column_order",
                     [table_name]
                 ) or []
                 labels = {r.get('stored_name'): r.get('label') for r in rows if r.get('stored_name')}
-                if 'column_labels' not in global_data:
-                    global_data['column_labels'] = {}
-                global_data['column_labels'][table_name] = labels
+                table_state.set_column_labels(table_name, labels)
             disp = labels.get(key)
             if isinstance(disp, str) and disp.strip():
                 return disp.strip()
@@ -1795,58 +1881,46 @@ def get_friendly_column_name(col):
     # 若确实找不到映射，直接返回原始列名（中文列名能正常显示）
     return key.replace('_', ' ')
 
-def get_table_data(table_name):
-    """获取表数据，用于相关性分析"""
-    print(f"开始获取表数据 - 表名: {table_name}")
-    
-    # 验证表名是否有效
-    if not isinstance(table_name, str) or not table_name:
-        print(f"错误: 无效的表名 '{table_name}'")
-        return None
-    
-    # 若被标记为脏，强制清理缓存
+def _table_csv_candidates(table_name):
+    """表对应的 CSV 候选路径：uploads 中同名文件优先（最近修改的优先），其次 database_datasets。"""
+    try:
+        return CsvCatalog.instance().paths(table_name)
+    except Exception as e:
+        print(f"[CsvCatalog] 查询 CSV 失败: {e}")
+        return []
+
+def _read_table_source(table_name, generation):
+    """按 快照 -> 数据库 -> CSV 的顺序读取整表（不写内存缓存）；无数据时返回 None。
+
+    从数据库/CSV 读取成功且期间表未被失效（缓存代数仍为 generation）时写入持久化快照。
+    """
+    # 持久化快照：进程重启后优先读取列式快照，版本戳与当前数据源一致时免去全表查询/CSV 解析
+    snapshots = TableSnapshotStore.instance()
+    in_db = False
     try:
-        if table_name in (global_data.get('dirty_tables') or set()):
-            if 'processed_data' in global_data:
-                del global_data['processed_data']
-            if 'current_data' in global_data:
-                del global_data['current_data']
-            # 移除脏标记
-            (global_data.get('dirty_tables') or set()).discard(table_name)
-            # 使 current_table 与传入不同，强制重新加载
-            global_data['current_table'] = None
-            print(f"表 {table_name} 命中脏标记，已清理缓存")
+        in_db = table_name in get_tables()
+    except Exception as e:
+        print(f"从数据库加载失败: {e}")
+    csv_paths = None if in_db else _table_csv_candidates(table_name)
+    version = None
+    try:
+        if in_db:
+            version = snapshots.db_version(table_name)
+        elif csv_paths:
+            version = file_version(csv_paths[0])
     except Exception:
-        pass
+        version = None
+    df = snapshots.load(table_name, version)
+    if df is not None:
+        print(f"从快照加载表 {table_name} 的数据（{len(df)} 行）")
+        return df
 
-    # 清空旧缓存以避免混淆
-    if global_data.get('current_table') != table_name:
-        print(f"切换表，清空旧缓存")
-        if 'processed_data' in global_data:
-            del global_data['processed_data']
-    
-    # 尝试从缓存获取数据
-    if 'processed_data' in global_data and global_data.get('current_table') == table_name:
-        print(f"从缓存获取已处理数据")
-        try:
-            return global_data['processed_data'].copy()
-        except Exception as e:
-            print(f"复制缓存数据时出错: {e}")
-    elif 'current_data' in global_data and global_data.get('current_table') == table_name:
-        print(f"从缓存获取原始数据")
-        try:
-            return global_data['current_data'].copy()
-        except Exception as e:
-            print(f"复制缓存数据时出错: {e}")
-    
     # 从数据库加载
     print(f"从数据库加载表 {table_name} 的数据")
-    df = None
     
     # 尝试从数据库加载
     try:
-        tables = get_tables()
-        if table_name in tables:
+        if in_db:
             table_data = fetch_all(f"SELECT * FROM {table_name}")
             if table_data is not None and table_data:
                 print(f"查询到 {len(table_data)} 条记录")
@@ -1857,37 +1931,111 @@ def get_table_data(table_name):
     # 如果数据库加载失败，尝试从CSV文件加载（包含 uploads 目录）
     if df is None:
         print(f"尝试从CSV文件加载表 {table_name} 的数据")
-        csv_candidates = [
-            Path(__file__).parent.parent / 'database_datasets' / f'{table_name}.csv',
-            Path(__file__).parent.parent.parent / 'database_datasets' / f'{table_name}.csv'
-        ]
-        try:
-            uploads_dir = Path(__file__).parent.parent / 'uploads'
-            if uploads_dir.exists() and uploads_dir.is_dir():
-                for p in uploads_dir.rglob('*.csv'):
-                    if p.stem == table_name:
-                        csv_candidates.insert(0, p)
+        version = None
+        # 优先按目录缓存的编码/分隔符直接解析，失败时才逐个编码尝试
+        df, p = _read_catalog_csv(table_name)
+        if df is not None:
+            version = file_version(p)
+            print("CSV数据加载成功")
+        else:
+            for p in (csv_paths if csv_paths is not None else _table_csv_candidates(table_name)):
+                try:
+                    if p.exists():
+                        df = _read_csv_full_with_fallbacks(p)
+                        version = file_version(p)
+                        print("CSV数据加载成功")
                         break
-        except Exception:
-            pass
-        for p in csv_candidates:
-            try:
-                if p.exists():
-                    df = _read_csv_full_with_fallbacks(p)
-                    print("CSV数据加载成功")
-                    break
-            except Exception:
-                continue
+                except Exception:
+                    continue
     
-    # 如果加载成功，进行数据清理和缓存
+    # 基本数据清理，并保存持久化快照
     if df is not None:
-        # 基本数据清理
         df = df.dropna(axis=1, how='all')
-        
-        # 保存到缓存
-        global_data['current_data'] = df
-        global_data['current_table'] = table_name
-        return df
+        if TableCache.instance().generation(table_name) == generation:
+            snapshots.save(table_name, version, df, source='csv' if (version or '').startswith('file:') else 'db')
+    return df
+
+
+def _load_table_frame(table_name, generation):
+    """缓存未命中时加载整表并写入缓存；无数据时返回 None。
+
+    由 get_table_data 经单飞协调调用：同一张表同一代数的并发未命中只执行一次。
+    generation 为加载前的缓存代数，加载期间表被失效时结果只返回给本轮调用方，不写入缓存与快照。
+    启用跨进程共享缓存（TABLE_CACHE_BACKEND=shared）时优先映射其它 worker 已发布的数据；
+    需要从数据源读取时持有该表的跨进程加载锁，读取后发布并改用映射的共享数据。
+    """
+    cache = TableCache.instance()
+    # 排队期间前一个加载可能刚完成，先复查缓存
+    if cache.contains(table_name):
+        cached = cache.get(table_name)
+        if cached is not None:
+            return cached
+
+    shared = SharedTableStore.instance()
+    if not shared.enabled:
+        df = _read_table_source(table_name, generation)
+    else:
+        df = shared.load(table_name)
+        if df is None:
+            with shared.table_lock(table_name):
+                # 等锁期间其它 worker 可能已完成加载并发布
+                df = shared.load(table_name)
+                if df is None:
+                    shared_generation = shared.generation(table_name)
+                    df = _read_table_source(table_name, generation)
+                    if df is not None and cache.generation(table_name) == generation \
+                            and shared.publish(table_name, df, based_on=shared_generation) is not None:
+                        # 改用映射的共享数据，释放本进程的私有副本
+                        mapped = shared.load(table_name)
+                        if mapped is not None:
+                            df = mapped
+        else:
+            print(f"映射共享缓存中的表 {table_name}（{len(df)} 行）")
+
+    if df is not None:
+        cache.put(table_name, df, generation=generation)
+        if cache.generation(table_name) != generation:
+            print(f"表 {table_name} 在加载期间被标记为已变更，本次结果不写入缓存")
+    return df
+
+
+def get_table_data(table_name, copy=False):
+    """获取表数据（带缓存）。
+
+    默认返回与缓存共享底层数据的视图（Copy-on-Write），只读的筛选/聚合无需复制整表；
+    copy=True 时返回独立的深拷贝，供需要原地改写大量列的调用方使用。
+    """
+    print(f"开始获取表数据 - 表名: {table_name}")
+    
+    # 验证表名是否有效
+    if not isinstance(table_name, str) or not table_name:
+        print(f"错误: 无效的表名 '{table_name}'")
+        return None
+    
+    cache = TableCache.instance()
+
+    # 跨进程共享缓存：其它 worker 失效或重新发布了该表时，丢弃本进程缓存的旧一代数据
+    shared = SharedTableStore.instance()
+    if shared.enabled and not shared.is_current(table_name):
+        cache.invalidate(table_name)
+
+    # 尝试从缓存获取数据（已预处理的结果优先）
+    cached = cache.get(table_name)
+    if cached is not None:
+        print(f"从缓存获取表 {table_name} 的数据")
+        table_state.current_table = table_name
+        try:
+            return cached.copy() if copy else share_frame(cached)
+        except Exception as e:
+            print(f"复制缓存数据时出错: {e}")
+    
+    # 同一张表的并发未命中只由一个请求加载，其余请求等待并共享该结果；
+    # 以 (表名, 代数) 为键，失效之后到达的请求不会共享失效之前开始的加载
+    generation = cache.generation(table_name)
+    df = _table_loads.do((table_name, generation), _load_table_frame, table_name, generation)
+    if df is not None:
+        table_state.current_table = table_name
+        return df.copy() if copy else share_frame(df)
     else:
         print(f"生成表 {table_name} 的示例数据")
         # 生成示例数据，专注于相关性分析所需的数值列
@@ -1921,10 +2069,10 @@ def get_table_data(table_name):
         df = pd.DataFrame(sample_data)
         
         # 保存到缓存
-        global_data['current_data'] = df
-        global_data['current_table'] = table_name
+        cache.put(table_name, df)
+        table_state.current_table = table_name
         
-        return df
+        return df.copy() if copy else share_frame(df)
     
     return None
 
@@ -2022,7 +2170,7 @@ def preprocess_data():
         data = request.get_json()
         missing_value_strategy = data.get('missingValue', 'mean')
         outlier_strategy = data.get('outlier', 'iqr')
-        table_name = data.get('table', global_data.get('current_table', 'students'))
+        table_name = data.get('table', table_state.current('students'))
         
         # 获取表数据
         df = get_table_data(table_name)
@@ -2039,8 +2187,8 @@ def preprocess_data():
         # 预处理数据
         processed_df, encoders = preprocess_df(df, missing_value_strategy, outlier_strategy)
         
-        # 更新全局缓存
-        global_data['processed_data'] = processed_df
+        # 更新表缓存中的预处理结果
+        TableCache.instance().put_processed(table_name, processed_df, based_on=df)
         
         # 记录预处理信息
         processed_rows = len(processed_df)
@@ -2077,7 +2225,7 @@ def feature_engineering():
         
         selection_methods = data.get('selection', [])
         transformations = data.get('transformation', [])
-        table_name = data.get('table', global_data.get('current_table', 'students'))
+        table_name = data.get('table', table_state.current('students'))
         
         # 获取数据
         print(f"正在获取表 {table_name} 的数据")
@@ -2312,7 +2460,7 @@ def get_subject_comparison():
     """获取学科对比数据"""
     try:
         # 获取请求参数
-        table_name = request.args.get('table', global_data.get('current_table', 'students'))
+        table_name = request.args.get('table', table_state.current('students'))
         
         # 获取表数据
         df = get_table_data(table_name)
@@ -2422,84 +2570,96 @@ def get_subject_comparison():
 # 只保留相关性分析功能
 @analysis_bp.route('/table-data', methods=['GET'])
 def get_table_data_api():
-    """获取表的数据，支持分页"""
+    """获取表的数据，支持分页
+
+    表未在缓存中时分页下推到数据源（MySQL 键集/OFFSET 分页、CSV 行偏移索引），只读取当前页；
+    响应中的 next_cursor 可作为下一页请求的 cursor 参数。mode=full 时沿用整表加载后切片。
+    format=columns 时 data 为按列组织的二维数组（与 columns 一一对应），数值保持为数字、缺失为 null。
+    """
     try:
         # 获取请求参数
         table_name = request.args.get('table', 'students')
-        page = int(request.args.get('page', 1))
-        page_size = int(request.args.get('page_size', 1000))  # 默认每页1000条
+        page = max(1, int(request.args.get('page', 1)))
+        page_size = max(1, int(request.args.get('page_size', 1000)))  # 默认每页1000条
+        cursor = request.args.get('cursor')
+        mode = (request.args.get('mode') or 'auto').lower()
+        fmt = 'columns' if (request.args.get('format') or '').lower() == 'columns' else 'records'
         
         print(f"获取表数据: {table_name}, 页码: {page}, 每页: {page_size}")
         
-        # 获取表数据
-        df = get_table_data(table_name)
-        if df is None:
-            return jsonify({
-                'status': 'error',
-                'message': f'没有找到{table_name}表的数据（返回None，可能文件损坏、无表头、编码或分隔符异常）'
-            }), 404
-        if df.empty:
-            return jsonify({
-                'status': 'success',
-                'data': [],
-                'total': 0,
-                'page': page,
-                'page_size': page_size,
-                'has_more': False,
-                'message': f'{table_name}表为空（有表头无数据或无有效数据）'
-            }), 200
-        
-        total_records = len(df)
-        
-        # 分页处理
-        start_idx = (page - 1) * page_size
-        end_idx = start_idx + page_size
-        df_page = df.iloc[start_idx:end_idx]
-        
-        # 将DataFrame转换为字典列表，处理特殊数据类型
-        df_clean = df_page.copy()
-        
-        # 处理可能导致JSON序列化问题的数据类型
-        for col in df_clean.columns:
-            if pd.api.types.is_datetime64_any_dtype(df_clean[col]):
-                # 转换日期为字符串
-                df_clean[col] = df_clean[col].dt.strftime('%Y-%m-%d')
-                df_clean[col] = df_clean[col].replace('NaT', '')
-            elif pd.api.types.is_numeric_dtype(df_clean[col]):
-                # 处理数值类型的NaN
-                df_clean[col] = df_clean[col].fillna(0)
-            else:
-                # 处理文本类型的NaN
-                df_clean[col] = df_clean[col].fillna('')
+        # 表已在缓存中时直接切片更快；否则只读取当前页
+        paged = None
+        if mode != 'full' and not TableCache.instance().contains(table_name):
+            paged = TablePager.instance().fetch_page(table_name, page, page_size, cursor,
+                                                     csv_paths=_table_csv_candidates(table_name))
+        if paged is not None:
+            total_records = paged['total']
+            if total_records == 0:
+                return jsonify({
+                    'status': 'success',
+                    'data': [],
+                    'columns': paged['columns'],
+                    'total': 0,
+                    'page': page,
+                    'page_size': page_size,
+                    'has_more': False,
+                    'next_cursor': None,
+                    'message': f'{table_name}表为空（有表头无数据或无有效数据）'
+                }), 200
+            table_state.current_table = table_name
+            df_page = paged['frame']
+            columns = paged['columns']
+            has_more = paged['has_more']
+            next_cursor = paged['next_cursor']
+        else:
+            # 整表加载后切片（表已在缓存中、mode=full 或数据源无法分页时）
+            df = get_table_data(table_name)
+            if df is None:
+                return jsonify({
+                    'status': 'error',
+                    'message': f'没有找到{table_name}表的数据（返回None，可能文件损坏、无表头、编码或分隔符异常）'
+                }), 404
+            if df.empty:
+                return jsonify({
+                    'status': 'success',
+                    'data': [],
+                    'total': 0,
+                    'page': page,
+                    'page_size': page_size,
+                    'has_more': False,
+                    'message': f'{table_name}表为空（有表头无数据或无有效数据）'
+                }), 200
+            
+            total_records = len(df)
+            
+            # 分页处理
+            start_idx = (page - 1) * page_size
+            end_idx = start_idx + page_size
+            df_page = df.iloc[start_idx:end_idx]
+            columns = list(df.columns)  # 保证顺序与原始CSV一致
+            has_more = end_idx < total_records
+            next_cursor = None
         
-        # 转换为字典列表并进一步处理特殊数据类型
-        data = []
-        for record in df_clean.to_dict('records'):
-            clean_record = {}
-            for key, value in record.items():
-                # 处理各种可能的数据类型
-                if pd.isna(value) or value is None:
-                    clean_record[key] = None
-                elif isinstance(value, (pd.Timestamp, np.datetime64)):
-                    clean_record[key] = str(value)[:10] if not pd.isna(value) else None
-                elif isinstance(value, (np.integer, np.floating)):
-                    clean_record[key] = float(value) if not pd.isna(value) else None
-                elif hasattr(value, 'date'):  # datetime.date对象
-                    clean_record[key] = str(value)
-                else:
-                    clean_record[key] = str(value) if value != 'nan' else None
-            data.append(clean_record)
+        # 按列一次性序列化：默认行格式（兼容原取值规则），format=columns 时返回列格式
+        if fmt == 'columns':
+            data = frame_to_columns(df_page)['data']
+            returned = len(df_page)
+        else:
+            data = table_page_records(df_page)
+            returned = len(data)
         
-        print(f"返回数据: {len(data)} 条记录，总共: {total_records} 条")
+        print(f"返回数据: {returned} 条记录，总共: {total_records} 条")
         
         return jsonify({
             'status': 'success',
+            'format': fmt,
             'data': data,
-            'columns': list(df.columns),  # 保证顺序与原始CSV一致
+            'columns': columns,
             'total': total_records,
             'page': page,
             'page_size': page_size,
-            'has_more': end_idx < total_records
+            'has_more': has_more,
+            'next_cursor': next_cursor
         }), 200
         
     except Exception as e:
@@ -2514,7 +2674,7 @@ def get_correlation():
     """获取特征相关性数据"""
     try:
         # 获取请求参数
-        table_name = request.args.get('table', global_data.get('current_table', 'students'))
+        table_name = request.args.get('table', table_state.current('students'))
         
         # 获取表数据
         df = get_table_data(table_name)
@@ -2583,7 +2743,7 @@ def get_score_distribution():
 
         # 可选按学生过滤
         if student_id and 'student_id' in df.columns:
-            student_df = df[df['student_id'].astype(str) == str(student_id)]
+            student_df = get_student_rows(df, student_id)
             if not student_df.empty:
                 df = student_df
 
@@ -2784,117 +2944,125 @@ def get_score_band_distribution():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
-@analysis_bp.route('/radar-data', methods=['GET'])
-def get_radar_data():
-    """获取雷达图数据 - 多维度能力分析"""
-    try:
-        table_name = request.args.get('table', 'class_performance')
-        student_id = request.args.get('student_id')
-        
-        # 获取表数据
-        df = get_table_data(table_name)
-        if df is None or df.empty:
-            return jsonify({
-                'status': 'error',
-                'message': '无法获取数据'
-            }), 404
-        
-        # 获取数值列
-        numeric_columns = get_numeric_columns(df, table_name)
-        
-        # 如果数值列不足，返回错误但状态码改为200，让前端能正常处理
-        if not numeric_columns or len(numeric_columns) < 2:
-            return jsonify({
-                'status': 'success',
-                'indicator': [
-                    {'name': '数据1', 'max': 100},
-                    {'name': '数据2', 'max': 100},
-                    {'name': '数据3', 'max': 100}
-                ],
-                'series': [
-                    {'name': '暂无数据', 'value': [0, 0, 0]}
-                ],
-                'message': '当前表数值列不足，无法生成雷达图'
-            }), 200
+def _compute_radar_data(table_name='class_performance', student_id=None):
+    """计算雷达图数据，返回 (响应体 dict, 状态码)；供 /radar-data 与报告导出直接调用。"""
+    # 获取表数据
+    df = get_table_data(table_name)
+    if df is None or df.empty:
+        return {
+            'status': 'error',
+            'message': '无法获取数据'
+        }, 404
+    
+    # 获取数值列
+    numeric_columns = get_numeric_columns(df, table_name)
+    
+    # 如果数值列不足，返回错误但状态码改为200，让前端能正常处理
+    if not numeric_columns or len(numeric_columns) < 2:
+        return {
+            'status': 'success',
+            'indicator': [
+                {'name': '数据1', 'max': 100},
+                {'name': '数据2', 'max': 100},
+                {'name': '数据3', 'max': 100}
+            ],
+            'series': [
+                {'name': '暂无数据', 'value': [0, 0, 0]}
+            ],
+            'message': '当前表数值列不足，无法生成雷达图'
+        }, 200
+
+    # 准备雷达图数据
+    indicators = []
+    class_avg = []
+    student_data = []
+    used_names = set()  # 避免同义中文映射导致的重复维度（例如“分数”出现两次）
+
+    # 指定了学生ID时，该学生的记录只需筛选一次
+    student_df = None
+    if student_id and 'student_id' in df.columns:
+        student_df = get_student_rows(df, student_id)
+
+    # 选择所有可用的数值列作为雷达图维度（最多8个）
+    for col in numeric_columns[:8]:
+        try:
+            # 计算班级平均值
+            mean_val = float(df[col].mean())
+            max_val = float(df[col].max())
+            min_val = float(df[col].min())
 
-        # 准备雷达图数据
-        indicators = []
-        class_avg = []
-        student_data = []
-        used_names = set()  # 避免同义中文映射导致的重复维度（例如“分数”出现两次）
+            if np.isnan(mean_val) or np.isnan(max_val):
+                continue
 
-        # 选择所有可用的数值列作为雷达图维度（最多8个）
-        for col in numeric_columns[:8]:
-            try:
-                # 计算班级平均值
-                mean_val = float(df[col].mean())
-                max_val = float(df[col].max())
-                min_val = float(df[col].min())
+            # 如果所有值都相同，设置一个合理的最大值
+            if max_val == min_val:
+                max_val = mean_val > 0 and (mean_val * 1.5) or 100
 
-                if np.isnan(mean_val) or np.isnan(max_val):
-                    continue
+            friendly = get_friendly_column_name(col)
+            # 跳过重复维度名称，避免“两个分数”等重复显示
+            if friendly in used_names:
+                continue
+            used_names.add(friendly)
 
-                # 如果所有值都相同，设置一个合理的最大值
-                if max_val == min_val:
-                    max_val = mean_val > 0 and (mean_val * 1.5) or 100
+            indicators.append({
+                'name': friendly,
+                'max': round(max(max_val * 1.1, 1), 2)  # 最大值设为实际最大值的1.1倍，至少为1
+            })
+            class_avg.append(round(mean_val, 2))
 
-                friendly = get_friendly_column_name(col)
-                # 跳过重复维度名称，避免“两个分数”等重复显示
-                if friendly in used_names:
-                    continue
-                used_names.add(friendly)
+            # 如果指定了学生ID，获取该学生的数据
+            if student_df is not None:
+                if not student_df.empty:
+                    student_val = float(student_df[col].mean())  # 使用mean以处理多条记录
+                    student_data.append(round(student_val, 2) if not np.isnan(student_val) else 0)
+                else:
+                    student_data.append(0)
+        except Exception as e:
+            print(f"处理列 {col} 时出错: {e}")
+            continue
 
-                indicators.append({
-                    'name': friendly,
-                    'max': round(max(max_val * 1.1, 1), 2)  # 最大值设为实际最大值的1.1倍，至少为1
-                })
-                class_avg.append(round(mean_val, 2))
-
-                # 如果指定了学生ID，获取该学生的数据
-                if student_id and 'student_id' in df.columns:
-                    student_df = df[df['student_id'].astype(str) == str(student_id)]
-                    if not student_df.empty:
-                        student_val = float(student_df[col].mean())  # 使用mean以处理多条记录
-                        student_data.append(round(student_val, 2) if not np.isnan(student_val) else 0)
-                    else:
-                        student_data.append(0)
-            except Exception as e:
-                print(f"处理列 {col} 时出错: {e}")
-                continue
+    # 如果处理后仍然没有有效数据
+    if len(indicators) < 2:
+        return {
+            'status': 'success',
+            'indicator': [
+                {'name': '数据1', 'max': 100},
+                {'name': '数据2', 'max': 100},
+                {'name': '数据3', 'max': 100}
+            ],
+            'series': [
+                {'name': '暂无有效数据', 'value': [0, 0, 0]}
+            ]
+        }, 200
 
-        # 如果处理后仍然没有有效数据
-        if len(indicators) < 2:
-            return jsonify({
-                'status': 'success',
-                'indicator': [
-                    {'name': '数据1', 'max': 100},
-                    {'name': '数据2', 'max': 100},
-                    {'name': '数据3', 'max': 100}
-                ],
-                'series': [
-                    {'name': '暂无有效数据', 'value': [0, 0, 0]}
-                ]
-            }), 200
+    # 构建返回数据
+    series_data = [
+        {
+            'name': '班级平均',
+            'value': class_avg
+        }
+    ]
 
-        # 构建返回数据
-        series_data = [
-            {
-                'name': '班级平均',
-                'value': class_avg
-            }
-        ]
+    if student_id and len(student_data) > 0 and len(student_data) == len(class_avg):
+        series_data.append({
+            'name': f'学生{student_id}',
+            'value': student_data
+        })
 
-        if student_id and len(student_data) > 0 and len(student_data) == len(class_avg):
-            series_data.append({
-                'name': f'学生{student_id}',
-                'value': student_data
-            })
+    return {
+        'status': 'success',
+        'indicator': indicators,
+        'series': series_data
+    }, 200
 
-        return jsonify({
-            'status': 'success',
-            'indicator': indicators,
-            'series': series_data
-        }), 200
+@analysis_bp.route('/radar-data', methods=['GET'])
+def get_radar_data():
+    """获取雷达图数据 - 多维度能力分析"""
+    try:
+        table_name = request.args.get('table', 'class_performance')
+        student_id = request.args.get('student_id')
+        body, status = _compute_radar_data(table_name, student_id)
+        return jsonify(body), status
         
     except Exception as e:
         traceback.print_exc(file=sys.stdout)
@@ -2908,31 +3076,83 @@ def get_radar_data():
 # Export Endpoints
 # =============================================================================
 
+def _export_batch_rows():
+    try:
+        return max(1, int(os.getenv('EXPORT_BATCH_ROWS', '5000')))
+    except Exception:
+        return 5000
+
+def _iter_table_csv_from_db(table_name, batch_rows):
+    """从数据库按批读取并逐批产出 CSV 文本（首批带表头）。"""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator='\n')
+    header_written = False
+    for columns, rows in iter_batches(f"SELECT * FROM `{table_name}`", batch_size=batch_rows):
+        if not header_written:
+            writer.writerow([str(c) for c in columns])
+            header_written = True
+        writer.writerows(rows)
+        chunk = buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+        yield chunk
+
+def _iter_frame_csv(df, batch_rows):
+    """DataFrame 按行切片逐段输出 CSV，与整体 to_csv 的结果一致。"""
+    if df.empty:
+        yield df.to_csv(index=False)
+        return
+    for start in range(0, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows].to_csv(index=False, header=(start == 0))
+
 @analysis_bp.route('/export-table', methods=['GET'])
 def export_table_csv():
-    """导出指定数据表为 CSV 文件"""
+    """导出指定数据表为 CSV 文件
+
+    数据库中的表以非缓冲游标分批读取、边读边发送，内存占用与表大小无关；
+    仅存在于 CSV/缓存中的表按批切片输出。批大小由环境变量 EXPORT_BATCH_ROWS 配置（默认 5000 行）。
+    """
     try:
         table_name = request.args.get('table')
         if not table_name:
             return jsonify({'status': 'error', 'message': '缺少参数 table'}), 400
 
-        df = get_table_data(table_name)
-        if df is None:
-            return jsonify({'status': 'error', 'message': '无法获取数据表'}), 404
+        batch_rows = _export_batch_rows()
+        chunks = None
+        try:
+            if table_name in get_tables():
+                chunks = _iter_table_csv_from_db(table_name, batch_rows)
+        except Exception as e:
+            print(f"数据库导出不可用，回退到表数据: {e}")
+            chunks = None
+
+        if chunks is None:
+            df = get_table_data(table_name)
+            if df is None:
+                return jsonify({'status': 'error', 'message': '无法获取数据表'}), 404
+            # 确保列名是字符串，避免中文编码问题
+            df.columns = [str(c) for c in df.columns]
+            chunks = _iter_frame_csv(df, batch_rows)
 
-        # 确保列名是字符串，避免中文编码问题
-        df.columns = [str(c) for c in df.columns]
+        # 先取出第一段：查询出错时仍可返回错误响应，同时尽早开始发送
+        first = next(chunks, '')
 
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_buffer.seek(0)
+        def generate():
+            yield first
+            try:
+                for chunk in chunks:
+                    yield chunk
+            except Exception as e:
+                # 响应头已发出，只能中止输出
+                print(f"[ERR] 导出 {table_name} 中途失败: {e}")
 
         filename = f"{table_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         return Response(
-            csv_buffer.getvalue(),
+            stream_with_context(generate()),
             mimetype='text/csv; charset=utf-8',
             headers={
-                'Content-Disposition': f"attachment; filename*=UTF-8''{filename}"
+                'Content-Disposition': f"attachment; filename*=UTF-8''{filename}",
+                'X-Accel-Buffering': 'no'
             }
         )
     except Exception as e:
@@ -2940,9 +3160,84 @@ def export_table_csv():
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+class _ZipStream:
+    """供 zipfile 写入的只追加缓冲：不可 seek，zipfile 会改用数据描述符写出每个成员，
+    每写完一个成员即可把已产生的字节取走发送，内存中只保留当前成员。"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b):
+        if b:
+            self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _frame_csv_text(frame, **kwargs):
+    buf = io.StringIO()
+    frame.to_csv(buf, **kwargs)
+    return buf.getvalue()
+
+def _report_describe(df):
+    try:
+        desc = df.describe(include='all').fillna('')
+        return [('analysis/describe.csv', _frame_csv_text(desc))]
+    except Exception as e:
+        return [('analysis/describe_error.txt', f'生成描述性统计失败: {e}')]
+
+def _report_correlation(df):
+    try:
+        numeric_df = df.select_dtypes(include=[np.number])
+        if numeric_df.empty:
+            return [('analysis/correlation_info.txt', '无数值列可用于相关性分析')]
+        corr = numeric_df.corr(numeric_only=True)
+        return [('analysis/correlation.csv', _frame_csv_text(corr))]
+    except Exception as e:
+        return [('analysis/correlation_error.txt', f'生成相关性失败: {e}')]
+
+def _report_radar(student_id):
+    # 雷达图数据（仅课堂表现表）
+    try:
+        radar_json, _ = _compute_radar_data('class_performance', str(student_id) if student_id else None)
+        if not radar_json or radar_json.get('status') != 'success':
+            return []
+        members = []
+        # 指标
+        ind_df = pd.DataFrame(radar_json.get('indicator', []))
+        members.append(('charts/radar_indicators.csv', _frame_csv_text(ind_df, index=False)))
+        # 系列：展平为列式 CSV
+        series_rows = []
+        for s in radar_json.get('series', []):
+            row = {'series_name': s.get('name')}
+            for i, v in enumerate(s.get('value', [])):
+                row[f'dim_{i+1}'] = v
+            series_rows.append(row)
+        members.append(('charts/radar_series.csv', _frame_csv_text(pd.DataFrame(series_rows), index=False)))
+        return members
+    except Exception as e:
+        return [('charts/radar_error.txt', f'生成雷达数据失败: {e}')]
+
+def _report_nonnull(df):
+    # 分布/进步等摘要（简化）：统计每列非空数量
+    try:
+        return [('analysis/nonnull_counts.csv', _frame_csv_text(df.notnull().sum(), header=['nonnull_count']))]
+    except Exception as e:
+        return [('analysis/summary_error.txt', f'生成摘要失败: {e}')]
+
 @analysis_bp.route('/export-report', methods=['GET'])
 def export_analysis_report():
-    """导出数据分析报告为 ZIP（包含多份 CSV 汇总）"""
+    """导出数据分析报告为 ZIP（包含多份 CSV 汇总）
+
+    ZIP 以流式写出：原始样本先发送，描述性统计/相关性/雷达图/非空统计在线程池中并行计算，
+    哪一份先算完就先写入并发送，不再在内存中拼出整个 ZIP。
+    """
     try:
         table_name = request.args.get('table', 'exam_scores')
         trend_type = request.args.get('trendType', 'individual')
@@ -2952,99 +3247,47 @@ def export_analysis_report():
         if df is None or df.empty:
             return jsonify({'status': 'error', 'message': '无可用数据生成报告'}), 404
 
-        # 构建内存 ZIP
-        zip_bytes = io.BytesIO()
-        with zipfile.ZipFile(zip_bytes, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
-            # 原始数据（前 2000 行，避免超大文件）
-            raw_csv = io.StringIO()
-            df.head(2000).to_csv(raw_csv, index=False)
-            zf.writestr('data/raw_sample.csv', raw_csv.getvalue())
-
-            # 描述性统计
-            try:
-                desc = df.describe(include='all').fillna('')
-                desc_csv = io.StringIO()
-                desc.to_csv(desc_csv)
-                zf.writestr('analysis/describe.csv', desc_csv.getvalue())
-            except Exception as e:
-                zf.writestr('analysis/describe_error.txt', f'生成描述性统计失败: {e}')
-
-            # 数值列相关性
+        def generate():
+            sink = _ZipStream()
+            pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='report')
             try:
-                numeric_df = df.select_dtypes(include=[np.number])
-                if not numeric_df.empty:
-                    corr = numeric_df.corr(numeric_only=True)
-                    corr_csv = io.StringIO()
-                    corr.to_csv(corr_csv)
-                    zf.writestr('analysis/correlation.csv', corr_csv.getvalue())
-                else:
-                    zf.writestr('analysis/correlation_info.txt', '无数值列可用于相关性分析')
-            except Exception as e:
-                zf.writestr('analysis/correlation_error.txt', f'生成相关性失败: {e}')
-
-            # 雷达图数据（仅课堂表现表）
-            try:
-                radar_params = {'table': 'class_performance'}
-                if student_id:
-                    radar_params['student_id'] = str(student_id)
-                with analysis_bp.test_request_context(query_string=radar_params):
-                    resp = get_radar_data()
-                if isinstance(resp, tuple):
-                    resp_data, status = resp
-                    radar_json = resp_data.get_json() if hasattr(resp_data, 'get_json') else None
-                else:
-                    radar_json = resp.get_json() if hasattr(resp, 'get_json') else None
-                if radar_json and radar_json.get('status') == 'success':
-                    # 指标
-                    indicators = radar_json.get('indicator', [])
-                    ind_df = pd.DataFrame(indicators)
-                    ind_csv = io.StringIO()
-                    ind_df.to_csv(ind_csv, index=False)
-                    zf.writestr('charts/radar_indicators.csv', ind_csv.getvalue())
-                    # 系列
-                    series = radar_json.get('series', [])
-                    # 展平为列式 CSV
-                    series_rows = []
-                    for s in series:
-                        name = s.get('name')
-                        values = s.get('value', [])
-                        row = {'series_name': name}
-                        for i, v in enumerate(values):
-                            row[f'dim_{i+1}'] = v
-                        series_rows.append(row)
-                    series_df = pd.DataFrame(series_rows)
-                    series_csv = io.StringIO()
-                    series_df.to_csv(series_csv, index=False)
-                    zf.writestr('charts/radar_series.csv', series_csv.getvalue())
-            except Exception as e:
-                zf.writestr('charts/radar_error.txt', f'生成雷达数据失败: {e}')
-
-            # 分布/进步等摘要（简化）
-            try:
-                # 统计每列非空数量
-                nonnull = df.notnull().sum()
-                nn_csv = io.StringIO()
-                nonnull.to_csv(nn_csv, header=['nonnull_count'])
-                zf.writestr('analysis/nonnull_counts.csv', nn_csv.getvalue())
-            except Exception as e:
-                zf.writestr('analysis/summary_error.txt', f'生成摘要失败: {e}')
-
-            # 元数据
-            meta = {
-                'table': table_name,
-                'trendType': trend_type,
-                'student_id': student_id,
-                'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
-            zf.writestr('meta.json', json.dumps(meta, ensure_ascii=False, indent=2))
+                with zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED) as zf:
+                    futures = [
+                        pool.submit(_report_describe, df),
+                        pool.submit(_report_correlation, df),
+                        pool.submit(_report_radar, student_id),
+                        pool.submit(_report_nonnull, df),
+                    ]
+                    # 原始数据（前 2000 行，避免超大文件）
+                    zf.writestr('data/raw_sample.csv', _frame_csv_text(df.head(2000), index=False))
+                    yield sink.drain()
+
+                    for fut in as_completed(futures):
+                        for name, content in fut.result():
+                            zf.writestr(name, content)
+                        yield sink.drain()
+
+                    # 元数据
+                    meta = {
+                        'table': table_name,
+                        'trendType': trend_type,
+                        'student_id': student_id,
+                        'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    }
+                    zf.writestr('meta.json', json.dumps(meta, ensure_ascii=False, indent=2))
+                yield sink.drain()
+            finally:
+                # 客户端中途断开时不再等待剩余计算
+                pool.shutdown(wait=False, cancel_futures=True)
 
-        zip_bytes.seek(0)
         filename = f"analysis_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
-        return send_file(
-            zip_bytes,
+        return Response(
+            stream_with_context(generate()),
             mimetype='application/zip',
-            as_attachment=True,
-            download_name=filename
+            headers={
+                'Content-Disposition': f'attachment; filename={filename}',
+                'X-Accel-Buffering': 'no'
+            }
         )
     except Exception as e:
         traceback.print_exc(file=sys.stdout)
@@ -3115,7 +3358,7 @@ def create_record(table_name):
         if table_name == 'university_grades' and 'student_id' in data:
             try:
                 st = get_table_data('students')
-                if st is None or st.empty or 'student_id' not in st.columns or not (st['student_id'].astype(str) == str(data['student_id'])).any():
+                if st is None or st.empty or 'student_id' not in st.columns or get_student_rows(st, data['student_id']).empty:
                     return jsonify({'status': 'error', 'message': 'student_id 不存在于学生表，请确认后再提交'}), 400
             except Exception:
                 # 无法验证时放行（可能使用 CSV 回退场景），由数据库约束兜底
@@ -3183,9 +3426,8 @@ def create_record(table_name):
         from database import execute_query
         execute_query(sql, values)
 
-        # 清空缓存，强制重新加载
-        if 'current_table' in global_data and global_data['current_table'] == table_name:
-            global_data.clear()
+        # 标记该表缓存失效，下次读取时重新加载
+        mark_table_dirty(table_name)
 
         return jsonify({
             'status': 'success',
@@ -3258,9 +3500,8 @@ def update_record(table_name, record_id):
         from database import execute_query
         result = execute_query(sql, values)
 
-        # 清空缓存
-        if 'current_table' in global_data and global_data['current_table'] == table_name:
-            global_data.clear()
+        # 标记该表缓存失效，下次读取时重新加载
+        mark_table_dirty(table_name)
 
         return jsonify({
             'status': 'success',
@@ -3286,10 +3527,9 @@ def delete_record(table_name, record_id):
 
         from database import execute_query
         execute_query(sql, [record_id])
-        
-        # 清空缓存
-        if 'current_table' in global_data and global_data['current_table'] == table_name:
-            global_data.clear()
+
+        # 标记该表缓存失效，下次读取时重新加载
+        mark_table_dirty(table_name)
         
         return jsonify({
             'status': 'success',
@@ -3348,7 +3588,7 @@ def get_student_courses():
         # 解析目标学生
         if students_df is not None and not students_df.empty:
             if student_id:
-                srow = students_df[students_df['student_id'].astype(str) == str(student_id)]
+                srow = get_student_rows(students_df, student_id)
                 if not srow.empty:
                     r = srow.iloc[0]
                     resolved_student = {
@@ -3390,7 +3630,7 @@ def get_student_courses():
                 continue
             if 'student_id' not in df.columns or 'course_id' not in df.columns:
                 continue
-            sdf = df[df['student_id'].astype(str) == str(student_id)]
+            sdf = get_student_rows(df, student_id)
             if not sdf.empty:
                 for val in sdf['course_id'].dropna().unique().tolist():
                     try:
@@ -3444,10 +3684,27 @@ def ensure_management_tables():
               stored_path VARCHAR(512),
               status VARCHAR(32) DEFAULT 'success',
               message TEXT,
-              uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP
+              uploaded_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+              rows_inserted BIGINT DEFAULT 0,
+              content_hash CHAR(64) NULL,
+              table_name VARCHAR(255) NULL,
+              task_id INT NULL,
+              INDEX idx_upload_content_hash (content_hash)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
             """
         )
+        # 旧库补充导入进度、内容哈希、对应数据表与导入任务列（已存在时忽略）
+        for ddl in (
+            "ALTER TABLE upload_history ADD COLUMN rows_inserted BIGINT DEFAULT 0",
+            "ALTER TABLE upload_history ADD COLUMN content_hash CHAR(64) NULL",
+            "ALTER TABLE upload_history ADD COLUMN table_name VARCHAR(255) NULL",
+            "ALTER TABLE upload_history ADD COLUMN task_id INT NULL",
+            "ALTER TABLE upload_history ADD INDEX idx_upload_content_hash (content_hash)",
+        ):
+            try:
+                execute_query(ddl)
+            except Exception:
+                pass
 
         # 数据源表
         execute_query(
@@ -3503,7 +3760,7 @@ def _get_actual_tables() -> list:
         tables = get_tables() or []
         management = {
             'data_sources', 'upload_history', 'collection_tasks', 'data_sync_state',
-            'table_column_mapping', 'collection_runs'
+            'table_column_mapping', 'collection_runs', 'training_jobs'
         }
         return [t for t in tables if t not in management]
     except Exception:
@@ -3573,15 +3830,314 @@ def sync_data_sources_with_db():
         pass
 
 
+def _upload_safe_filename(name: str) -> str:
+    """文件名保留原样（含中文），仅移除路径分隔、Windows 非法字符与控制字符。"""
+    s = str(name or '').strip()
+    # 去除路径分隔与 Windows 非法字符
+    s = s.replace('\\', '_').replace('/', '_')
+    s = re.sub(r'[<>:"\\|?*]', '_', s)
+    # 去除控制字符
+    s = re.sub(r'[\x00-\x1F\x7F]', '', s)
+    return s or 'uploaded_file'
+
+
+def _upload_table_name(name: str) -> str:
+    """表名保留原样（支持中文/空格等），仅移除反引号与控制字符，避免SQL注入/解析问题。"""
+    s = str(name or '').strip()
+    # 移除反引号，防止与SQL引用冲突
+    s = s.replace('`', '')
+    # 去除不可见控制字符
+    s = re.sub(r"[\x00-\x1F\x7F]", "", s)
+    # 空名兜底
+    return s or 'uploaded_table'
+
+
+def _upload_column_name(raw) -> str:
+    """列名清洗（尽量保留原始中文/空格等，仅移除反引号和控制字符）。"""
+    try:
+        if pd.isna(raw):
+            return ''
+    except Exception:
+        pass
+    s = str(raw or '').strip()
+    # 去掉反引号，避免与SQL引用冲突
+    s = s.replace('`', '')
+    # 去除不可见控制字符
+    s = re.sub(r"[\x00-\x1F\x7F]", "", s)
+    return s
+
+
+def _new_upload_path(fname: str) -> Path:
+    # 避免重名：每次上传一个时间戳子目录
+    ts = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    subdir = UPLOAD_DIR / ts
+    subdir.mkdir(parents=True, exist_ok=True)
+    return subdir / fname
+
+
+def _upload_entry(fname: str, size: int, status: str, **extra) -> dict:
+    entry = {
+        'filename': fname,
+        'uploadTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'fileSize': format_file_size_safe(size),
+        'status': status,
+    }
+    entry.update(extra)
+    return entry
+
+
+def _find_ingested_upload(content_hash: str):
+    """查找内容哈希相同、已成功导入且对应数据表仍存在的上传记录；没有则返回 None。"""
+    if not content_hash:
+        return None
+    try:
+        row = fetch_one(
+            "SELECT id, stored_path, table_name FROM upload_history "
+            "WHERE content_hash=%s AND status='success' AND table_name IS NOT NULL "
+            "ORDER BY id DESC LIMIT 1",
+            [content_hash]
+        )
+        if row and row.get('table_name') in (get_tables() or []):
+            return row
+    except Exception as e:
+        print(f"[上传] 查询重复上传失败: {e}")
+    return None
+
+
+def _record_duplicate_upload(fname: str, size: int, mime_type, content_hash: str, dup: dict) -> dict:
+    """相同内容已导入过：只记录一条上传历史并指向已有数据表，不再保存文件或重新导入。"""
+    table_name = dup.get('table_name')
+    execute_insert_return_id(
+        "INSERT INTO upload_history (filename, file_size, mime_type, stored_path, status, message, content_hash, table_name) "
+        "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+        [fname, size, mime_type, dup.get('stored_path'), 'success',
+         f'文件内容与上传记录 #{dup.get("id")} 相同，已跳过导入，对应数据表 `{table_name}`',
+         content_hash, table_name]
+    )
+    return _upload_entry(fname, size, 'success', duplicate=True, table=table_name)
+
+
+def _discard_duplicate_file(target_path: Path) -> None:
+    try:
+        os.remove(target_path)
+        target_path.parent.rmdir()
+    except Exception:
+        pass
+
+
+def _register_upload(target_path: Path, fname: str, mime_type, content_hash: str = None) -> int:
+    """登记上传历史（状态 processing），返回记录ID。"""
+    return execute_insert_return_id(
+        "INSERT INTO upload_history (filename, file_size, mime_type, stored_path, status, content_hash) "
+        "VALUES (%s, %s, %s, %s, %s, %s)",
+        [fname, os.path.getsize(target_path), mime_type, str(target_path), 'processing', content_hash]
+    )
+
+
+def _mark_upload_cancelled(up_id: int, rows: int) -> None:
+    execute_query("UPDATE upload_history SET status='cancelled', message=%s WHERE id=%s",
+                  [f'导入已取消（已写入 {rows} 行）', up_id])
+
+
+def _ingest_upload(target_path: Path, fname: str, mime_type, content_hash: str = None,
+                   up_id: int = None, on_progress=None) -> dict:
+    """导入一个已保存到磁盘的上传文件：记录上传历史 -> 推断结构并建表 -> 分块写入 -> 维护列名映射。
+
+    content_hash 相同的文件已导入过时直接复用已有数据表（删除本次保存的文件）。
+    up_id 为已登记的上传历史ID（后台任务提交前登记）；on_progress(pct) 用于汇报导入进度。
+    返回前端展示用的记录。
+    """
+    file_size = os.path.getsize(target_path)
+    report = on_progress or (lambda pct: None)
+    if up_id is None:
+        dup = _find_ingested_upload(content_hash)
+        if dup is not None:
+            _discard_duplicate_file(target_path)
+            return _record_duplicate_upload(fname, file_size, mime_type, content_hash, dup)
+        # 记录上传
+        up_id = _register_upload(target_path, fname, mime_type, content_hash)
+
+    # 在文件开头的有界窗口与蓄水池样本上推断列类型（不读取整个文件）
+    try:
+        # 编码只检测一次（有界前缀），结构推断与写入共用
+        encoding = detect_text_encoding(str(target_path)) if fname.lower().endswith('.csv') else None
+        schema = infer_schema(iter_file_chunks(str(target_path), fname, encoding=encoding))
+        raw_columns, profiles = schema.columns, schema.profiles
+    except Exception as read_err:
+        execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'读取文件失败: {read_err}', up_id])
+        return _upload_entry(fname, file_size, 'failed')
+
+    # 空文件则仅记录信息
+    if schema.scanned_rows == 0:
+        execute_query("UPDATE upload_history SET status='success', message=%s WHERE id=%s", [f'文件无数据，未创建数据表', up_id])
+        return _upload_entry(fname, file_size, 'success')
+    total_est = max(1, estimate_rows(str(target_path), schema))
+    try:
+        report(2)
+    except IngestCancelled:
+        # 尚未建表：只更新上传历史
+        _mark_upload_cancelled(up_id, 0)
+        raise
+
+    # 基于原始文件名推断表名
+    base = os.path.splitext(fname)[0]
+    # 按用户要求：数据库表名不修改（保留中文、大小写和空格），仅做最小安全处理
+    table_name = _upload_table_name(base)
+    # 列名去重与安全化
+    used_names = set()
+    ordered_new_cols = []
+    cols_sql = []
+    pk = None
+    for idx, col in enumerate(raw_columns):
+        # 处理缺失/空白/NaN 列名优先生成中文占位名，尽量保留原始中文
+        base_name = _upload_column_name(col)
+        if (not base_name) or (base_name.strip() == '') or (base_name.strip().lower() in ('nan','none','null')):
+            base_name = f"列{idx+1}"
+        # 去重：如重复则追加后缀 _2, _3...
+        unique = base_name
+        suffix = 2
+        while unique in used_names:
+            unique = f"{base_name}_{suffix}"
+            suffix += 1
+        used_names.add(unique)
+        ordered_new_cols.append(unique)
+
+        # 类型推断（基于样本的类型画像，写入时超出再加宽）
+        profile = profiles[idx]
+        col_type = profile.declare()
+        if unique == 'id' and profile.kind == 'int':
+            pk = 'id'
+        # SQL 引用使用反引号包裹（列名中不包含反引号）
+        cols_sql.append(f"`{unique}` {col_type}")
+    if pk:
+        cols_sql = [c.replace('`id` BIGINT', '`id` BIGINT AUTO_INCREMENT') if c.startswith('`id` BIGINT') else c for c in cols_sql]
+        cols_sql.append("PRIMARY KEY (`id`)")
+    create_sql = (
+        f"CREATE TABLE IF NOT EXISTS `{table_name}` (" + ", ".join(cols_sql) + ") "
+        "ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;"
+    )
+    try:
+        # 已存在的表结构不由本次上传决定，不做自动加宽
+        table_existed = table_name in (get_tables() or [])
+        execute_query(create_sql)
+    except Exception as ce:
+        execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'创建数据表失败: {ce}', up_id])
+        return _upload_entry(fname, file_size, 'failed')
+
+    # 按块归一化空值并分批写入，每块一个事务，提交后更新进度（写入阶段占 5%~95%）
+    progress = {'rows': 0}
+
+    def _record_progress(n):
+        progress['rows'] = n
+        execute_query("UPDATE upload_history SET rows_inserted=%s WHERE id=%s", [n, up_id])
+        report(min(95, 5 + int(90 * n / total_est)))
+
+    try:
+        report(5)
+        # 与实际表结构对齐，避免 Unknown column 错误
+        try:
+            cols_exist = set(get_columns(table_name) or [])
+        except Exception:
+            cols_exist = set(ordered_new_cols)
+        positions = [i for i, c in enumerate(ordered_new_cols) if c in cols_exist]
+        if not positions:
+            raise RuntimeError('表结构与数据列完全不匹配，无法写入')
+        cols_safe = [ordered_new_cols[i] for i in positions]
+        load_stats = insert_chunks(table_name, cols_safe, iter_file_chunks(str(target_path), fname, encoding=encoding),
+                                   positions, on_progress=_record_progress,
+                                   schema=None if table_existed else schema,
+                                   key_columns=[pk] if pk else ())
+
+        # 维护列名映射：先清空再写入
+        try:
+            execute_query("DELETE FROM table_column_mapping WHERE table_name=%s", [table_name])
+            mapping_rows = []
+            for idx, orig_col in enumerate(raw_columns):
+                # 原始列名转字符串；NaN/None 处理为空串
+                try:
+                    orig_str = '' if pd.isna(orig_col) else str(orig_col)
+                except Exception:
+                    orig_str = str(orig_col) if orig_col is not None else ''
+                stored = ordered_new_cols[idx] if idx < len(ordered_new_cols) else f"col_{idx+1}"
+                display = orig_str or stored
+                mapping_rows.append((table_name, idx+1, stored, orig_str, display))
+            execute_many(
+                "INSERT INTO table_column_mapping (table_name, column_order, stored_name, original_name, display_name) VALUES (%s,%s,%s,%s,%s)",
+                mapping_rows
+            )
+            # 清理缓存的列标签
+            table_state.drop_column_labels(table_name)
+        except Exception:
+            pass
+
+        # 标记缓存脏并自动注册数据源（若未存在）
+        try:
+            mark_table_dirty(table_name)
+        except Exception:
+            pass
+        try:
+            ds_name = f"{table_name} 表"
+            exist = fetch_one("SELECT id FROM data_sources WHERE name=%s", [ds_name])
+            if not exist:
+                cols_exist = set(get_columns(table_name) or [])
+                cfg = { 'table': table_name }
+                if 'updated_at' in cols_exist:
+                    cfg['updated_at_column'] = 'updated_at'
+                elif 'id' in cols_exist:
+                    cfg['key_column'] = 'id'
+                execute_query(
+                    "INSERT INTO data_sources (name, type, config, active) VALUES (%s,%s,%s,%s)",
+                    [ds_name, '数据库表', json.dumps(cfg, ensure_ascii=False), 1]
+                )
+        except Exception:
+            pass
+
+        execute_query("UPDATE upload_history SET status='success', table_name=%s, message=%s WHERE id=%s",
+                      [table_name,
+                       f'表 `{table_name}` 已创建/更新，写入 {progress["rows"]} 行'
+                       f'（{load_stats.get("method")}，{load_stats.get("rows_per_sec") or "-"} 行/秒'
+                       f'，加宽列 {len(load_stats.get("widened") or [])} 次）', up_id])
+    except IngestCancelled:
+        mark_table_dirty(table_name)
+        _mark_upload_cancelled(up_id, progress['rows'])
+        raise
+    except Exception as ie:
+        # 已提交的块保留在表中，便于排查；刷新缓存避免读到旧数据
+        mark_table_dirty(table_name)
+        execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'插入数据失败（已写入 {progress["rows"]} 行）: {ie}', up_id])
+        return _upload_entry(fname, file_size, 'failed')
+
+    return _upload_entry(fname, file_size, 'success', table=table_name)
+
+
+def _queue_upload_ingest(target_path: Path, fname: str, mime_type, content_hash: str = None) -> dict:
+    """重复内容直接复用已有数据表；否则登记上传历史并提交后台导入任务，立即返回（状态 processing）。"""
+    file_size = os.path.getsize(target_path)
+    dup = _find_ingested_upload(content_hash)
+    if dup is not None:
+        _discard_duplicate_file(target_path)
+        return _record_duplicate_upload(fname, file_size, mime_type, content_hash, dup)
+    # 新文件立即登记到 CSV 目录，无需等待目录重扫即可作为同名表的 CSV 回退
+    CsvCatalog.instance().register(target_path)
+    up_id = _register_upload(target_path, fname, mime_type, content_hash)
+    task_id = IngestWorkers.instance().submit(
+        f"上传导入：{fname}", _ingest_upload, target_path, fname, mime_type, content_hash, up_id=up_id
+    )
+    if task_id:
+        execute_query("UPDATE upload_history SET task_id=%s WHERE id=%s", [task_id, up_id])
+    return _upload_entry(fname, file_size, 'processing', taskId=task_id)
+
+
 @analysis_bp.route('/uploads', methods=['GET', 'POST'])
 def uploads_endpoint():
-    """GET: 获取上传历史; POST: 接收文件上传（保存到磁盘并记录到 upload_history）。"""
+    """GET: 获取上传历史; POST: 接收文件上传（保存到磁盘、记录到 upload_history 并提交后台导入任务）。"""
     try:
         ensure_management_tables()
 
         if request.method == 'GET':
             rows = fetch_all(
-                "SELECT id, filename, file_size, mime_type, stored_path, status, message, uploaded_at "
+                "SELECT id, filename, file_size, mime_type, stored_path, status, message, uploaded_at, rows_inserted, "
+                "content_hash, table_name, task_id "
                 "FROM upload_history ORDER BY uploaded_at DESC, id DESC LIMIT 100"
             ) or []
             # 转为前端期望结构
@@ -3595,7 +4151,11 @@ def uploads_endpoint():
                     'status': r.get('status') or 'success',
                     'mime_type': r.get('mime_type'),
                     'path': r.get('stored_path'),
-                    'message': r.get('message')
+                    'message': r.get('message'),
+                    'rowsInserted': int(r.get('rows_inserted') or 0),
+                    'contentHash': r.get('content_hash'),
+                    'table': r.get('table_name'),
+                    'taskId': r.get('task_id')
                 })
             return jsonify({'status': 'success', 'data': data}), 200
 
@@ -3605,294 +4165,15 @@ def uploads_endpoint():
             return jsonify({'status': 'error', 'message': '请提供要上传的文件'}), 400
 
         saved = []
-        # 工具方法：表名保留原样（支持中文/空格等），仅移除反引号与控制字符，避免SQL注入/解析问题
-        def _preserve_table_name(name: str) -> str:
-            s = str(name or '').strip()
-            # 移除反引号，防止与SQL引用冲突
-            s = s.replace('`', '')
-            # 去除不可见控制字符
-            s = re.sub(r"[\x00-\x1F\x7F]", "", s)
-            # 空名兜底
-            return s or 'uploaded_table'
-
-        # 工具方法：列名清洗（尽量保留原始中文/空格等，仅移除反引号和控制字符）
-        def _clean_column_name(raw) -> str:
-            try:
-                if pd.isna(raw):
-                    return ''
-            except Exception:
-                pass
-            s = str(raw or '').strip()
-            # 去掉反引号，避免与SQL引用冲突
-            s = s.replace('`', '')
-            # 去除不可见控制字符
-            s = re.sub(r"[\x00-\x1F\x7F]", "", s)
-            return s
-
-        # 工具方法：推断 MySQL 列类型
-        def _infer_mysql_type(s: pd.Series) -> str:
-            if pd.api.types.is_bool_dtype(s):
-                return 'TINYINT(1)'
-            if pd.api.types.is_integer_dtype(s):
-                return 'BIGINT'
-            if pd.api.types.is_float_dtype(s):
-                return 'DOUBLE'
-            if pd.api.types.is_datetime64_any_dtype(s):
-                return 'DATETIME'
-            try:
-                lens = s.astype(str).map(lambda x: len(x) if x is not None else 0)
-                max_len = int(lens.max() or 0)
-            except Exception:
-                max_len = 255
-            if max_len <= 0:
-                max_len = 64
-            if max_len > 1000:
-                return 'TEXT'
-            return f"VARCHAR({min(max_len+10, 255)})"
-
         for f in files:
             try:
-                # 文件名保留原样（含中文），仅移除危险字符，不做前缀/改名
-                def _sanitize_filename(name: str) -> str:
-                    s = str(name or '').strip()
-                    # 去除路径分隔与 Windows 非法字符
-                    s = s.replace('\\', '_').replace('/', '_')
-                    s = re.sub(r'[<>:"\\|?*]', '_', s)
-                    # 去除控制字符
-                    s = re.sub(r'[\x00-\x1F\x7F]', '', s)
-                    return s or 'uploaded_file'
-
-                fname = _sanitize_filename(getattr(f, 'filename', ''))
+                fname = _upload_safe_filename(getattr(f, 'filename', ''))
                 if not fname:
                     continue
-                # 避免重名：前缀时间戳
-                ts = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
-                subdir = UPLOAD_DIR / ts
-                subdir.mkdir(parents=True, exist_ok=True)
-                target_path = subdir / fname
-                f.save(str(target_path))
-
-                # 记录上传
-                up_id = execute_insert_return_id(
-                    "INSERT INTO upload_history (filename, file_size, mime_type, stored_path, status) "
-                    "VALUES (%s, %s, %s, %s, %s)",
-                    [fname, os.path.getsize(target_path), f.mimetype, str(target_path), 'success']
-                )
-
-                # 读取文件为 DataFrame
-                df = None
-                try:
-                    if fname.lower().endswith('.csv'):
-                        try:
-                            df = pd.read_csv(
-                                str(target_path),
-                                keep_default_na=True,
-                                na_values=['NA','N/A','na','nan','NaN','NULL','null','None','none']
-                            )
-                        except UnicodeDecodeError:
-                            df = pd.read_csv(
-                                str(target_path), encoding='gbk', errors='ignore',
-                                keep_default_na=True,
-                                na_values=['NA','N/A','na','nan','NaN','NULL','null','None','none']
-                            )
-                    elif fname.lower().endswith(('.xlsx', '.xls')):
-                        try:
-                            df = pd.read_excel(str(target_path))
-                        except ImportError as ie:
-                            raise RuntimeError('读取 Excel 需要安装 openpyxl，请安装后重试') from ie
-                    else:
-                        df = pd.read_csv(str(target_path))
-                except Exception as read_err:
-                    execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'读取文件失败: {read_err}', up_id])
-                    saved.append({
-                        'filename': fname,
-                        'uploadTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                        'fileSize': format_file_size_safe(os.path.getsize(target_path)),
-                        'status': 'failed'
-                    })
-                    continue
-
-                # 空文件则仅记录信息
-                if df is None or df.empty:
-                    execute_query("UPDATE upload_history SET message=%s WHERE id=%s", [f'文件无数据，未创建数据表', up_id])
-                else:
-                    # 基于原始文件名推断表名
-                    base = os.path.splitext(fname)[0]
-                    # 按用户要求：数据库表名不修改（保留中文、大小写和空格），仅做最小安全处理
-                    table_name = _preserve_table_name(base)
-                    # 列名去重与安全化
-                    used_names = set()
-                    name_map = {}
-                    ordered_new_cols = []
-                    cols_sql = []
-                    pk = None
-                    for idx, col in enumerate(list(df.columns)):
-                        # 处理缺失/空白/NaN 列名优先生成中文占位名，尽量保留原始中文
-                        base_name = _clean_column_name(col)
-                        if (not base_name) or (base_name.strip() == '') or (base_name.strip().lower() in ('nan','none','null')):
-                            base_name = f"列{idx+1}"
-                        # 去重：如重复则追加后缀 _2, _3...
-                        unique = base_name
-                        suffix = 2
-                        while unique in used_names:
-                            unique = f"{base_name}_{suffix}"
-                            suffix += 1
-                        used_names.add(unique)
-                        name_map[col] = unique
-                        ordered_new_cols.append(unique)
-
-                        # 类型推断
-                        series = df[col]
-                        if unique == 'id' and pd.api.types.is_integer_dtype(series):
-                            col_type = 'BIGINT'
-                            pk = 'id'
-                        else:
-                            col_type = _infer_mysql_type(series)
-                        # SQL 引用使用反引号包裹（列名中不包含反引号）
-                        cols_sql.append(f"`{unique}` {col_type}")
-                    if pk:
-                        cols_sql = [c.replace('`id` BIGINT', '`id` BIGINT AUTO_INCREMENT') if c.startswith('`id` BIGINT') else c for c in cols_sql]
-                        cols_sql.append("PRIMARY KEY (`id`)")
-                    create_sql = (
-                        f"CREATE TABLE IF NOT EXISTS `{table_name}` (" + ", ".join(cols_sql) + ") "
-                        "ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;"
-                    )
-                    try:
-                        execute_query(create_sql)
-                    except Exception as ce:
-                        execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'创建数据表失败: {ce}', up_id])
-                        saved.append({
-                            'filename': fname,
-                            'uploadTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                            'fileSize': format_file_size_safe(os.path.getsize(target_path)),
-                            'status': 'failed'
-                        })
-                        continue
-
-                    # 插入数据
-                    try:
-                        # 使用与建表一致的唯一列名（按位置设置，解决 NaN 列名无法通过 dict 匹配的问题）
-                        df2 = df.copy()
-                        try:
-                            df2.columns = ordered_new_cols
-                        except Exception:
-                            # 兜底：若列数不一致，回退逐列赋值
-                            cols_tmp = list(df2.columns)
-                            for i in range(min(len(cols_tmp), len(ordered_new_cols))):
-                                cols_tmp[i] = ordered_new_cols[i]
-                            df2.columns = cols_tmp
-                        # 统一将 'nan'/'null'/'none' 等文本与 NaN 转换为 None
-                        def _norm_cell(v):
-                            try:
-                                if v is None:
-                                    return None
-                                # pandas NaN
-                                if isinstance(v, float):
-                                    import math
-                                    if not math.isfinite(v):
-                                        return None
-                                s = str(v).strip()
-                                if s == '' or s.lower() in ('nan','none','null','na','n/a'):
-                                    return None
-                                return v
-                            except Exception:
-                                return v
-                        try:
-                            df2 = df2.applymap(_norm_cell)
-                        except Exception:
-                            pass
-                        records = df2.where(pd.notnull(df2), None).to_dict(orient='records')
-                        if records:
-                            # 与实际表结构对齐，避免 Unknown column 错误
-                            try:
-                                cols_exist = set(get_columns(table_name) or [])
-                            except Exception:
-                                cols_exist = set(df2.columns)
-                            cols_safe = [c for c in list(df2.columns) if c in cols_exist]
-                            if not cols_safe:
-                                raise RuntimeError('表结构与数据列完全不匹配，无法写入')
-                            placeholders = ",".join(["%s"] * len(cols_safe))
-                            insert_sql = f"INSERT INTO `{table_name}` (" + ",".join([f"`{c}`" for c in cols_safe]) + f") VALUES ({placeholders})"
-                            params = [tuple(rec.get(c) for c in cols_safe) for rec in records]
-                            try:
-                                execute_many(insert_sql, params)
-                            except Exception as ie:
-                                # 尝试容错：若仍提示 Unknown column，则再用交集列重试一次（已是交集，基本不会触发）
-                                if 'Unknown column' in str(ie):
-                                    cols_exist = set(get_columns(table_name) or [])
-                                    cols_safe = [c for c in list(df2.columns) if c in cols_exist]
-                                    placeholders = ",".join(["%s"] * len(cols_safe))
-                                    insert_sql = f"INSERT INTO `{table_name}` (" + ",".join([f"`{c}`" for c in cols_safe]) + f") VALUES ({placeholders})"
-                                    params = [tuple(rec.get(c) for c in cols_safe) for rec in records]
-                                    execute_many(insert_sql, params)
-                                else:
-                                    raise
-
-                        # 维护列名映射：先清空再写入
-                        try:
-                            execute_query("DELETE FROM table_column_mapping WHERE table_name=%s", [table_name])
-                            mapping_rows = []
-                            for idx, orig_col in enumerate(list(df.columns)):
-                                # 原始列名转字符串；NaN/None 处理为空串
-                                try:
-                                    orig_str = '' if pd.isna(orig_col) else str(orig_col)
-                                except Exception:
-                                    orig_str = str(orig_col) if orig_col is not None else ''
-                                stored = ordered_new_cols[idx] if idx < len(ordered_new_cols) else f"col_{idx+1}"
-                                display = orig_str or stored
-                                mapping_rows.append((table_name, idx+1, stored, orig_str, display))
-                            execute_many(
-                                "INSERT INTO table_column_mapping (table_name, column_order, stored_name, original_name, display_name) VALUES (%s,%s,%s,%s,%s)",
-                                mapping_rows
-                            )
-                            # 清理缓存的列标签
-                            try:
-                                if table_name in (global_data.get('column_labels') or {}):
-                                    del global_data['column_labels'][table_name]
-                            except Exception:
-                                pass
-                        except Exception:
-                            pass
-
-                        # 标记缓存脏并自动注册数据源（若未存在）
-                        try:
-                            mark_table_dirty(table_name)
-                        except Exception:
-                            pass
-                        try:
-                            ds_name = f"{table_name} 表"
-                            exist = fetch_one("SELECT id FROM data_sources WHERE name=%s", [ds_name])
-                            if not exist:
-                                cols_exist = set(get_columns(table_name) or [])
-                                cfg = { 'table': table_name }
-                                if 'updated_at' in cols_exist:
-                                    cfg['updated_at_column'] = 'updated_at'
-                                elif 'id' in cols_exist:
-                                    cfg['key_column'] = 'id'
-                                execute_query(
-                                    "INSERT INTO data_sources (name, type, config, active) VALUES (%s,%s,%s,%s)",
-                                    [ds_name, '数据库表', json.dumps(cfg, ensure_ascii=False), 1]
-                                )
-                        except Exception:
-                            pass
-
-                        execute_query("UPDATE upload_history SET message=%s WHERE id=%s", [f'表 `{table_name}` 已创建/更新', up_id])
-                    except Exception as ie:
-                        execute_query("UPDATE upload_history SET status='failed', message=%s WHERE id=%s", [f'插入数据失败: {ie}', up_id])
-                        saved.append({
-                            'filename': fname,
-                            'uploadTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                            'fileSize': format_file_size_safe(os.path.getsize(target_path)),
-                            'status': 'failed'
-                        })
-                        continue
-
-                saved.append({
-                    'filename': fname,
-                    'uploadTime': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'fileSize': format_file_size_safe(os.path.getsize(target_path)),
-                    'status': 'success'
-                })
+                target_path = _new_upload_path(fname)
+                # 写盘的同时计算内容哈希，用于识别重复上传
+                content_hash = save_stream(f.stream, str(target_path))
+                saved.append(_queue_upload_ingest(target_path, fname, f.mimetype, content_hash))
             except Exception as e:
                 print(f"[上传] 保存文件失败: {e}")
                 saved.append({
@@ -3902,6 +4183,12 @@ def uploads_endpoint():
                     'status': 'failed'
                 })
 
+        # 导入在后台进行，进度见 collection_tasks（taskId）与上传历史的 rowsInserted；
+        # 只有实际提交了导入任务时才返回 202，全部为重复文件时 200，全部失败时 400（逐个文件状态见 uploaded）
+        if any(item.get('status') == 'processing' for item in saved):
+            return jsonify({'status': 'success', 'uploaded': saved}), 202
+        if not saved or all(item.get('status') == 'failed' for item in saved):
+            return jsonify({'status': 'error', 'message': '文件均未能保存或导入', 'uploaded': saved}), 400
         return jsonify({'status': 'success', 'uploaded': saved}), 200
 
     except Exception as e:
@@ -3909,6 +4196,99 @@ def uploads_endpoint():
         return jsonify({'status': 'error', 'message': f'处理上传失败: {str(e)}'}), 500
 
 
+def _upload_session_error(e: UploadSessionError):
+    body = {'status': 'error', 'message': str(e)}
+    if e.received is not None:
+        body['received'] = e.received
+    return jsonify(body), e.status
+
+
+@analysis_bp.route('/uploads/init', methods=['POST'])
+def init_chunked_upload():
+    """创建分块上传会话。
+
+    请求体：{filename, size, mimeType?, resumeKey?, sha256?}
+    - resumeKey：客户端对同一文件的稳定标识（如 名称+大小+修改时间），会话仍存在时返回已接收字节数以便续传
+    - sha256：客户端已知的内容哈希，仅用于完成时校验上传内容完整；
+      重复文件识别只在 complete 时按服务端计算的哈希进行（客户端声明的哈希不可信，不据此复用已有数据表）
+    """
+    try:
+        ensure_management_tables()
+        payload = request.get_json(silent=True) or {}
+        fname = _upload_safe_filename(payload.get('filename'))
+        try:
+            size = int(payload.get('size'))
+        except Exception:
+            return jsonify({'status': 'error', 'message': '请提供文件大小 size'}), 400
+        mime_type = payload.get('mimeType')
+        expected_hash = str(payload.get('sha256') or '').strip().lower() or None
+        state = UploadSessionStore.instance().init(fname, size, mime_type,
+                                                   resume_key=payload.get('resumeKey'),
+                                                   expected_hash=expected_hash)
+        return jsonify({'status': 'success', 'data': state}), 200
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'创建上传会话失败: {str(e)}'}), 500
+
+
+@analysis_bp.route('/uploads/<upload_id>', methods=['GET', 'DELETE'])
+def chunked_upload_state(upload_id):
+    """GET: 查询会话已接收的字节数（断线后据此续传）; DELETE: 放弃上传并删除已接收的数据。"""
+    try:
+        store = UploadSessionStore.instance()
+        if request.method == 'DELETE':
+            store.discard(upload_id)
+            return jsonify({'status': 'success'}), 200
+        return jsonify({'status': 'success', 'data': store.state(upload_id)}), 200
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'查询上传会话失败: {str(e)}'}), 500
+
+
+@analysis_bp.route('/uploads/<upload_id>/chunk', methods=['PUT'])
+def put_upload_chunk(upload_id):
+    """追加一个分块：请求体为原始字节，查询参数 offset 必须等于已接收字节数（不一致返回 409 与当前偏移）。"""
+    try:
+        offset = int(request.args.get('offset', '0'))
+        state = UploadSessionStore.instance().append(upload_id, offset, request.stream)
+        return jsonify({'status': 'success', 'data': state}), 200
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'接收分块失败: {str(e)}'}), 500
+
+
+@analysis_bp.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """全部分块接收完成：校验大小与哈希后提交后台导入；内容与已导入文件相同时直接复用已有数据表。"""
+    try:
+        ensure_management_tables()
+        store = UploadSessionStore.instance()
+        fname = _upload_safe_filename(store.state(upload_id).get('filename'))
+        target_path = _new_upload_path(fname)
+        try:
+            info = store.complete(upload_id, str(target_path))
+        except UploadSessionError:
+            try:
+                target_path.parent.rmdir()
+            except Exception:
+                pass
+            raise
+        entry = _queue_upload_ingest(target_path, fname, info.get('mime_type'), info.get('sha256'))
+        duplicate = bool(entry.get('duplicate'))
+        return jsonify({'status': 'success', 'duplicate': duplicate, 'uploaded': [entry]}), 200 if duplicate else 202
+    except UploadSessionError as e:
+        return _upload_session_error(e)
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'完成上传失败: {str(e)}'}), 500
+
+
 @analysis_bp.route('/data-sources', methods=['GET', 'POST'])
 def data_sources_endpoint():
     """GET: 列出数据源（优先数据库记录，若为空则基于真实表构造默认数据）; POST: 新增数据源。"""
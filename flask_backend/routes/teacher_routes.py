@@ -14,9 +14,8 @@
 from flask import Blueprint, request, jsonify
 from services.auth import create_teacher, authenticate_teacher, verify_token
 from database import fetch_one, execute_query
-from routes.analysis_routes import get_table_data
+from routes.analysis_routes import get_table_data, get_student_rows
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
 import traceback, sys
 from mysql.connector import errors as mysql_errors
@@ -25,7 +24,7 @@ import re
 
 # 预测相关（用于学生画像中的“成绩预测”）
 from services.preprocessing import preprocess_df
-from services.model_selection import ModelSelector
+from services.model_registry import ModelRegistry, data_version, fit_artifact, build_feature_row
 
 teacher_bp = Blueprint('teacher_bp', __name__)
 
@@ -635,7 +634,7 @@ def student_portrait():
         students_df = get_table_data('students')
         profile = {'student_id': int(student_id)}
         if students_df is not None and not students_df.empty:
-            srow = students_df[students_df['student_id'].astype(str) == str(student_id)]
+            srow = get_student_rows(students_df, student_id)
             if not srow.empty:
                 r = srow.iloc[0]
                 profile.update({
@@ -685,28 +684,21 @@ def student_portrait():
         chosen_target_col = target_column or _auto_target(df_target)
         if df_target is not None and not df_target.empty and chosen_target_col and chosen_target_col in df_target.columns:
             try:
-                # 预处理与建模
-                df_proc, _ = preprocess_df(df_target)
-                # 若预处理后列名变化，尝试用同名列；否则按原名回退
-                if chosen_target_col not in df_proc.columns:
-                    # 简单回退：取预处理前列
-                    pass
-                X_all = df_proc.drop(columns=[c for c in [chosen_target_col] if c in df_proc.columns])
-                y_all = df_proc[chosen_target_col] if chosen_target_col in df_proc.columns else None
-                if y_all is None:
-                    # 无法定位目标列，跳过预测
-                    raise ValueError('目标列在预处理后缺失')
-
-                # 模型选择
-                selector = ModelSelector()
-                from sklearn.model_selection import train_test_split
-                X_train, X_test, y_train, y_test = train_test_split(X_all.values, y_all.values, test_size=0.2, random_state=42)
-                best_model, model_results, best_params = selector.select_best_model(X_train, y_train)
-                # 在全量数据拟合
-                best_model.fit(X_all.values, y_all.values)
+                # 复用已训练模型（按 表 + 目标列 + 数据版本），仅在数据变化后重新训练
+                registry = ModelRegistry.instance()
+                version = data_version(df_target)
+                artifact = registry.get(target_table, chosen_target_col, version)
+                if artifact is None:
+                    # 预处理与建模
+                    df_proc, encoders, preprocessor = preprocess_df(df_target, return_preprocessor=True)
+                    if chosen_target_col not in df_proc.columns:
+                        # 无法定位目标列，跳过预测
+                        raise ValueError('目标列在预处理后缺失')
+                    artifact = fit_artifact(df_proc, chosen_target_col, encoders, preprocessor=preprocessor)
+                    registry.put(target_table, chosen_target_col, version, artifact)
 
                 # 学生该表的“最新一条”记录（UG 没有时间列时取第一条即可）
-                sraw = df_target[df_target['student_id'].astype(str) == str(student_id)].copy() if 'student_id' in df_target.columns else pd.DataFrame()
+                sraw = get_student_rows(df_target, student_id).copy() if 'student_id' in df_target.columns else pd.DataFrame()
                 if not sraw.empty:
                     # 按可能存在的时间/自增列排序
                     for key in ['grade_id', 'score_id']:
@@ -717,18 +709,9 @@ def student_portrait():
                         sraw['exam_date_parsed'] = pd.to_datetime(sraw['exam_date'], errors='coerce')
                         sraw = sraw.sort_values(by='exam_date_parsed')
                     latest = sraw.iloc[-1:]
-                    # 对齐特征列
-                    feat_cols = list(X_all.columns)
-                    latest_feat = latest.reindex(columns=feat_cols, fill_value=np.nan)
-                    # 缺失填充
-                    for c in feat_cols:
-                        if latest_feat[c].isna().any():
-                            try:
-                                mean_val = pd.to_numeric(X_all[c], errors='coerce').mean()
-                                latest_feat[c] = latest_feat[c].fillna(mean_val)
-                            except Exception:
-                                latest_feat[c] = latest_feat[c].fillna(0)
-                    pred_total = float(best_model.predict(latest_feat.values)[0])
+                    # 对齐特征列并以训练集均值填充缺失
+                    latest_feat = build_feature_row(artifact, latest)
+                    pred_total = float(artifact['model'].predict(latest_feat.values)[0])
 
                     # 单科预测已移除
             except Exception as e:
@@ -750,7 +733,7 @@ def student_portrait():
                 # 转为数值
                 for c in ug_cols:
                     ug[c] = pd.to_numeric(ug[c], errors='coerce')
-                row = ug[ug['student_id'].astype(str) == str(student_id)]
+                row = get_student_rows(ug, student_id)
                 if not row.empty:
                     r = row.iloc[0]
                     for i, col in enumerate(ug_cols):
@@ -886,7 +869,7 @@ def student_portrait():
             pass
         ex = get_table_data('exam_scores')
         if ex is not None and not ex.empty and 'student_id' in ex.columns:
-            ed = ex[ex['student_id'].astype(str) == str(student_id)].copy()
+            ed = get_student_rows(ex, student_id).copy()
             if not ed.empty:
                 if 'exam_date' in ed.columns:
                     ed['exam_date_parsed'] = pd.to_datetime(ed['exam_date'], errors='coerce')
@@ -899,7 +882,7 @@ def student_portrait():
                         })
         cp = get_table_data('class_performance')
         if cp is not None and not cp.empty and 'student_id' in cp.columns:
-            cd = cp[cp['student_id'].astype(str) == str(student_id)].copy()
+            cd = get_student_rows(cp, student_id).copy()
             if not cd.empty:
                 for _, r in cd.iterrows():
                     txt = str(r.get('teacher_comments') or '').strip()
@@ -926,7 +909,7 @@ def student_portrait():
             for col in perf_keys:
                 if col in perf_df.columns:
                     perf_df[col] = pd.to_numeric(perf_df[col], errors='coerce')
-            stu = perf_df[perf_df['student_id'].astype(str) == str(student_id)]
+            stu = get_student_rows(perf_df, student_id)
             cls_avg = {k: (float(perf_df[k].mean()) if k in perf_df.columns and perf_df[k].notna().any() else None) for k in perf_keys}
             stu_avg = {k: (float(stu[k].mean()) if not stu.empty and k in stu.columns and stu[k].notna().any() else None) for k in perf_keys}
             name_map = {
@@ -5,9 +5,11 @@
 - 提供基于数据库数据的训练接口（POST /train）
 - 提供已保存模型列表（GET /models）
 - 提供训练数据统计（GET /data-stats）
+- 提供后台训练任务的提交/轮询/取消（/jobs），/train 与 /predict-table 也可通过 async=true 异步执行
 
 注意：
-- 当前示例仅返回评估结果与可视化，不实际持久化模型（可按需开启）
+- /train 仅返回评估结果与可视化，不实际持久化模型（可按需开启）
+- /predict-student 的模型经 ModelRegistry 落地到 models 目录，数据未变化时直接复用
 """
 
 # -*- coding: utf-8 -*-
@@ -16,6 +18,9 @@ from database import fetch_all, execute_query, fetch_one
 from services.prediction import PredictionService
 from services.preprocessing import preprocess_df
 from services.model_selection import ModelSelector
+from services.model_registry import ModelRegistry, TrainingResultCache, data_version, fit_artifact, build_feature_row
+from services.training_jobs import TrainingJobManager, JOB_RUNNERS
+from services.serialization import to_python, frame_to_records
 import pandas as pd
 import numpy as np
 import traceback
@@ -23,7 +28,7 @@ import sys
 import pickle
 import os
 from datetime import datetime
-from routes.analysis_routes import get_table_data, get_primary_key_column
+from routes.analysis_routes import get_table_data, get_primary_key_column, get_student_rows
 
 training_bp = Blueprint('training_bp', __name__)
 
@@ -31,8 +36,43 @@ training_bp = Blueprint('training_bp', __name__)
 MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+
+def _truthy(v) -> bool:
+    return v is True or str(v).lower() in ('1', 'true', 'yes')
+
+
+def _wants_async(data) -> bool:
+    """请求体中 async 为真（true/1/"true"）时走后台任务。"""
+    return _truthy((data or {}).get('async'))
+
+
+def _mark_cached(body):
+    """返回缓存结果的浅拷贝，并在 data 中标记 cached=true。"""
+    out = dict(body)
+    if isinstance(out.get('data'), dict):
+        out['data'] = dict(out['data'], cached=True)
+    return out
+
+
+def _submit_training_job(kind, data):
+    try:
+        job = TrainingJobManager.instance().submit(kind, data)
+        return jsonify({'status': 'success', 'message': '任务已提交', 'job_id': job['id'], 'data': job}), 202
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'提交训练任务失败: {str(e)}'}), 500
+
 @training_bp.route('/train', methods=['POST'])
 def train_model():
+    """训练成绩预测模型；请求体带 async=true 时提交后台任务并返回任务ID。"""
+    data = request.get_json(force=True) or {}
+    if _wants_async(data):
+        return _submit_training_job('train', data)
+    body, code = run_train(data)
+    return jsonify(body), code
+
+
+def run_train(data):
     """
     训练成绩预测模型（支持从数据库加载数据）。
     入参 JSON：
@@ -41,7 +81,6 @@ def train_model():
     - dataSource: 数据源（当前支持 database）
     """
     try:
-        data = request.get_json(force=True)
         target_column = data.get('targetColumn', 'total_score')
         test_size = float(data.get('testSize', 0.2))
         data_source = data.get('dataSource', 'database')  # database 或 upload
@@ -54,7 +93,7 @@ def train_model():
             # 通用：直接从指定表加载数据
             df = get_table_data(table_override)
             if df is None or df.empty:
-                return jsonify({'status': 'error', 'message': f'表 {table_override} 无数据可用于训练'}), 400
+                return {'status': 'error', 'message': f'表 {table_override} 无数据可用于训练'}, 400
             # 仅保留数值/分类列，由预处理负责编码
             # 下方将检查目标列是否存在
         elif data_source == 'database':
@@ -84,10 +123,10 @@ def train_model():
             rows = fetch_all(query)
             
             if not rows or len(rows) == 0:
-                return jsonify({
+                return {
                     'status': 'error',
                     'message': '数据库中没有可用的训练数据'
-                }), 400
+                }, 400
             
             # 转换为DataFrame
             df = pd.DataFrame(rows)
@@ -95,19 +134,28 @@ def train_model():
             print(f"[INFO] 数据列: {df.columns.tolist()}")
             
         else:
-            return jsonify({
+            return {
                 'status': 'error',
                 'message': '暂不支持上传文件训练'
-            }), 400
+            }, 400
         
         # 检查目标列是否存在
         if target_column not in df.columns:
             available_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
-            return jsonify({
+            return {
                 'status': 'error',
                 'message': f'目标列 {target_column} 不存在，可用的数值列: {available_cols}'
-            }), 400
+            }, 400
         
+        # 数据与参数均未变化时直接返回上次训练结果（force=true 可强制重新训练）
+        result_cache = TrainingResultCache.instance()
+        cache_key = result_cache.make_key('train', data_version(df), target_column, test_size, 42,
+                                          table=table_override, data_source=data_source)
+        cached = None if _truthy(data.get('force')) else result_cache.get(cache_key)
+        if cached is not None:
+            print("[TRAIN] 数据未变化，返回缓存的训练结果")
+            return _mark_cached(cached), 200
+
         # 使用预测服务进行训练
         prediction_service = PredictionService()
 
@@ -124,7 +172,7 @@ def train_model():
         print(f"[METRIC] RMSE: {result['metrics']['rmse']:.4f}")
         
         # 返回训练结果
-        return jsonify({
+        body = {
             'status': 'success',
             'message': '模型训练完成',
             'data': {
@@ -137,19 +185,30 @@ def train_model():
                 'training_samples': len(df),
                 'target_column': target_column
             }
-        }), 200
+        }
+        result_cache.put(cache_key, body)
+        return body, 200
         
     except Exception as e:
         print(f"[ERR] 训练失败: {str(e)}")
         traceback.print_exc(file=sys.stdout)
-        return jsonify({
+        return {
             'status': 'error',
             'message': f'训练失败: {str(e)}'
-        }), 500
+        }, 500
 
 
 @training_bp.route('/predict-table', methods=['POST'])
 def predict_table():
+    """基于指定表训练与预测；请求体带 async=true 时提交后台任务并返回任务ID。"""
+    data = request.get_json(force=True) or {}
+    if _wants_async(data):
+        return _submit_training_job('predict_table', data)
+    body, code = run_predict_table(data)
+    return jsonify(body), code
+
+
+def run_predict_table(data):
     """
     基于指定表进行训练与预测：
     - 先对表数据进行预处理
@@ -164,19 +223,27 @@ def predict_table():
     - previewLimit: 预测预览条数（默认50）
     """
     try:
-        data = request.get_json(force=True)
         table_name = data.get('table')
         target_column = data.get('targetColumn')
         test_size = float(data.get('testSize', 0.2))
         preview_limit = int(data.get('previewLimit', 50))
 
         if not table_name:
-            return jsonify({'status': 'error', 'message': '缺少参数: table'}), 400
+            return {'status': 'error', 'message': '缺少参数: table'}, 400
 
         # 加载表数据
         df_raw = get_table_data(table_name)
         if df_raw is None or df_raw.empty:
-            return jsonify({'status': 'error', 'message': f'表 {table_name} 无可用数据'}), 400
+            return {'status': 'error', 'message': f'表 {table_name} 无可用数据'}, 400
+
+        # 数据与参数均未变化时直接返回上次结果（force=true 可强制重新训练）
+        result_cache = TrainingResultCache.instance()
+        cache_key = result_cache.make_key('predict_table', data_version(df_raw), target_column, test_size, 42,
+                                          table=table_name, preview_limit=preview_limit)
+        cached = None if _truthy(data.get('force')) else result_cache.get(cache_key)
+        if cached is not None:
+            print(f"[PREDICT] 表 {table_name} 数据未变化，返回缓存的训练结果")
+            return _mark_cached(cached), 200
 
         # 记录目标列缺失的样本，用于后续重点返回（仅在提供目标列时）
         missing_mask = None
@@ -193,16 +260,16 @@ def predict_table():
         if not target_column:
             # 不再自动识别，强制前端手动选择
             if allowed_in_df:
-                return jsonify({'status': 'error', 'message': f'请指定目标列（可选: {", ".join(allowed_in_df)}）'}), 400
-            return jsonify({'status': 'error', 'message': '请指定目标列'}), 400
+                return {'status': 'error', 'message': f'请指定目标列（可选: {", ".join(allowed_in_df)}）'}, 400
+            return {'status': 'error', 'message': '请指定目标列'}, 400
         
         # 指定的目标列必须存在
         if target_column not in df_proc.columns:
-            return jsonify({'status': 'error', 'message': f'目标列 {target_column} 不存在于表 {table_name}'}), 400
+            return {'status': 'error', 'message': f'目标列 {target_column} 不存在于表 {table_name}'}, 400
         
         # 若存在允许集合，则强制限定
         if allowed_in_df and target_column not in allowed_in_df:
-            return jsonify({'status': 'error', 'message': f'目标列必须从 {", ".join(allowed_in_df)} 中选择'}), 400
+            return {'status': 'error', 'message': f'目标列必须从 {", ".join(allowed_in_df)} 中选择'}, 400
 
         # 前置校验已覆盖不存在情况
 
@@ -237,15 +304,14 @@ def predict_table():
         preview_rows = []
         try:
             n = min(preview_limit, len(y_all))  # 使用处理后的样本长度，避免越界
-            for i in range(n):
-                row = {
-                    'predicted': float(y_pred_all[i]),
-                    'actual': float(y_all.iloc[i]) if not pd.isna(y_all.iloc[i]) else None
-                }
-                # 优先从预处理后的数据中取主键，保证长度一致
-                if pk and pk in df_proc.columns:
-                    row[pk] = df_proc.iloc[i][pk]
-                preview_rows.append(row)
+            preview = pd.DataFrame({
+                'predicted': np.asarray(y_pred_all[:n], dtype='float64'),
+                'actual': pd.to_numeric(y_all.iloc[:n], errors='coerce').to_numpy(dtype='float64'),
+            })
+            # 优先从预处理后的数据中取主键，保证长度一致
+            if pk and pk in df_proc.columns:
+                preview[pk] = df_proc[pk].iloc[:n].to_numpy()
+            preview_rows = frame_to_records(preview)
         except Exception:
             pass
 
@@ -255,12 +321,11 @@ def predict_table():
             if missing_mask is None and target_column in df_raw.columns:
                 missing_mask = df_raw[target_column].isna()
             if missing_mask is not None and missing_mask.any():
-                idxs = np.where(missing_mask.values)[0].tolist()
-                for i in idxs[:preview_limit]:
-                    row = {'predicted': float(y_pred_all[i])}
-                    if pk in df_raw.columns:
-                        row[pk] = df_raw.iloc[i][pk]
-                    predicted_missing.append(row)
+                idxs = np.where(missing_mask.values)[0][:preview_limit]
+                missing = pd.DataFrame({'predicted': np.asarray(y_pred_all, dtype='float64')[idxs]})
+                if pk in df_raw.columns:
+                    missing[pk] = df_raw[pk].iloc[idxs].to_numpy()
+                predicted_missing = frame_to_records(missing)
         except Exception:
             pass
 
@@ -279,29 +344,6 @@ def predict_table():
             except Exception:
                 pass
 
-        # 统一将 numpy 类型转换为原生 Python，避免 jsonify 报错
-        def to_py(v):
-            try:
-                if isinstance(v, (np.integer,)):
-                    return int(v)
-                if isinstance(v, (np.floating,)):
-                    return float(v)
-                if isinstance(v, (np.ndarray,)):
-                    return v.tolist()
-                return v
-            except Exception:
-                return v
-
-        # 规范化预览中的主键与数值类型
-        if isinstance(preview_rows, list):
-            for row in preview_rows:
-                for k in list(row.keys()):
-                    row[k] = to_py(row[k])
-        if isinstance(predicted_missing, list):
-            for row in predicted_missing:
-                for k in list(row.keys()):
-                    row[k] = to_py(row[k])
-
         # ===== 可视化派生数据 =====
         try:
             actual_list = [float(v) for v in y_all.tolist()]
@@ -388,7 +430,7 @@ def predict_table():
                 for i in idx_sorted:
                     rec = {'predicted': predicted_list[i], 'actual': actual_list[i], 'abs_error': float(diffs[i])}
                     if pk and pk in df_proc.columns:
-                        rec[pk] = to_py(df_proc.iloc[i][pk])
+                        rec[pk] = to_python(df_proc.iloc[i][pk])
                     top_abs_errors.append(rec)
             except Exception:
                 pass
@@ -403,27 +445,72 @@ def predict_table():
         except Exception:
             visualizations = None
 
-        return jsonify({
+        body = {
             'status': 'success',
             'message': '训练与预测完成',
             'data': {
                 'table': table_name,
                 'target_column': target_column,
                 'training_samples': int(len(y_all)),
-                'metrics': {k: to_py(v) for k, v in metrics.items()},
-                'model_results': {k: {kk: to_py(vv) for kk, vv in vv.items()} for k, vv in model_results.items()},
-                'best_params': {k: to_py(v) for k, v in best_params.items()} if isinstance(best_params, dict) else best_params,
+                'metrics': {k: to_python(v) for k, v in metrics.items()},
+                'model_results': {k: {kk: to_python(vv) for kk, vv in vv.items()} for k, vv in model_results.items()},
+                'best_params': {k: to_python(v) for k, v in best_params.items()} if isinstance(best_params, dict) else best_params,
                 'feature_importance': fi_records,
                 'preview': preview_rows,
                 'predicted_missing': predicted_missing,
                 'visualizations': visualizations
             }
-        }), 200
+        }
+        result_cache.put(cache_key, body)
+        return body, 200
 
     except Exception as e:
         print(f"[ERR] predict-table 失败: {str(e)}")
         traceback.print_exc(file=sys.stdout)
-        return jsonify({'status': 'error', 'message': str(e)}), 500
+        return {'status': 'error', 'message': str(e)}, 500
+
+
+@training_bp.route('/jobs', methods=['GET', 'POST'])
+def training_jobs_endpoint():
+    """GET: 列出最近的训练任务；POST: 提交任务 {kind: train|predict_table, params: {...}}。"""
+    try:
+        if request.method == 'GET':
+            limit = max(1, min(200, request.args.get('limit', default=50, type=int)))
+            return jsonify({'status': 'success', 'data': TrainingJobManager.instance().list(limit)}), 200
+        payload = request.get_json(silent=True) or {}
+        kind = payload.get('kind')
+        if kind not in JOB_RUNNERS:
+            return jsonify({'status': 'error', 'message': f'kind 必须为: {", ".join(JOB_RUNNERS)}'}), 400
+        return _submit_training_job(kind, payload.get('params') or {})
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'训练任务处理失败: {str(e)}'}), 500
+
+
+@training_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_training_job(job_id):
+    """查询任务状态/进度；任务完成后 data.result 为与同步接口一致的响应体。"""
+    try:
+        job = TrainingJobManager.instance().get(job_id)
+        if job is None:
+            return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+        return jsonify({'status': 'success', 'data': job}), 200
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'查询任务失败: {str(e)}'}), 500
+
+
+@training_bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_training_job(job_id):
+    """取消任务：排队中的任务直接撤销，运行中的任务在下一次进度汇报时中止。"""
+    try:
+        job = TrainingJobManager.instance().cancel(job_id)
+        if job is None:
+            return jsonify({'status': 'error', 'message': '任务不存在'}), 404
+        return jsonify({'status': 'success', 'message': '已请求取消', 'data': job}), 200
+    except Exception as e:
+        traceback.print_exc(file=sys.stdout)
+        return jsonify({'status': 'error', 'message': f'取消任务失败: {str(e)}'}), 500
 
 
 @training_bp.route('/predict-student', methods=['GET'])
@@ -453,55 +540,46 @@ def predict_student():
         # 筛选该学生数据
         if 'student_id' not in df_raw.columns:
             return jsonify({'status': 'error', 'message': f'表 {table_name} 缺少 student_id 列，无法为学生预测'}), 400
-        sdf = df_raw[df_raw['student_id'].astype(str) == str(student_id)].copy()
+        sdf = get_student_rows(df_raw, student_id).copy()
         if course_id and 'course_id' in sdf.columns:
             sdf = sdf[sdf['course_id'].astype(str) == str(course_id)]
         if sdf.empty:
             return jsonify({'status': 'error', 'message': '该学生在此表中无记录'}), 404
 
-        # 预处理全表并训练模型
-        df_proc, _ = preprocess_df(df_raw)
-        # 自动/指定目标列（支持中文）
-        if not target_column:
-            en_keys = ('gpa','grade','score','final','total')
-            zh_keys = ('总成绩','总分','分数','成绩','期末','期中','平时','总评')
-            cand = []
-            for c in df_proc.columns:
-                if any(k in str(c) for k in zh_keys):
-                    cand.append(c)
-            for c in df_proc.columns:
-                cl = str(c).lower()
-                if any(k in cl for k in en_keys) and c not in cand:
-                    cand.append(c)
-            if cand:
-                target_column = cand[0]
-            else:
-                nums = df_proc.select_dtypes(include=['int64','float64']).columns.tolist()
-                if not nums:
-                    return jsonify({'status': 'error', 'message': '无法识别目标列，请提供 targetColumn 或在表中包含成绩列（如“总成绩/总分/分数”等）'}), 400
-                target_column = nums[-1]
-        if target_column not in df_proc.columns:
-            return jsonify({'status': 'error', 'message': f'目标列 {target_column} 不存在'}), 400
-
-        X_all = df_proc.drop(columns=[target_column])
-        y_all = df_proc[target_column]
-        feature_names = X_all.columns.tolist()
-
-        from sklearn.model_selection import train_test_split
-        X_train, X_test, y_train, y_test = train_test_split(X_all.values, y_all.values, test_size=0.2, random_state=42)
-        selector = ModelSelector()
-        best_model, model_results, best_params = selector.select_best_model(X_train, y_train)
-        from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
-        import numpy as np
-        y_pred = best_model.predict(X_test)
-        metrics = {
-            'r2': float(r2_score(y_test, y_pred)),
-            'mae': float(mean_absolute_error(y_test, y_pred)),
-            'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred)))
-        }
-
-        # 在全量数据上重新拟合
-        best_model.fit(X_all.values, y_all.values)
+        # 优先复用已训练的模型（按 表 + 目标列 + 数据版本），数据未变化时只做推理
+        registry = ModelRegistry.instance()
+        version = data_version(df_raw)
+        artifact = registry.get(table_name, target_column or '', version)
+        if artifact is None:
+            # 预处理全表并训练模型
+            df_proc, encoders, preprocessor = preprocess_df(df_raw, return_preprocessor=True)
+            requested_target = target_column
+            # 自动/指定目标列（支持中文）
+            if not target_column:
+                en_keys = ('gpa','grade','score','final','total')
+                zh_keys = ('总成绩','总分','分数','成绩','期末','期中','平时','总评')
+                cand = []
+                for c in df_proc.columns:
+                    if any(k in str(c) for k in zh_keys):
+                        cand.append(c)
+                for c in df_proc.columns:
+                    cl = str(c).lower()
+                    if any(k in cl for k in en_keys) and c not in cand:
+                        cand.append(c)
+                if cand:
+                    target_column = cand[0]
+                else:
+                    nums = df_proc.select_dtypes(include=['int64','float64']).columns.tolist()
+                    if not nums:
+                        return jsonify({'status': 'error', 'message': '无法识别目标列，请提供 targetColumn 或在表中包含成绩列（如“总成绩/总分/分数”等）'}), 400
+                    target_column = nums[-1]
+            if target_column not in df_proc.columns:
+                return jsonify({'status': 'error', 'message': f'目标列 {target_column} 不存在'}), 400
+
+            artifact = fit_artifact(df_proc, target_column, encoders, preprocessor=preprocessor)
+            registry.put(table_name, requested_target or '', version, artifact)
+        target_column = artifact['target_column']
+        metrics = artifact['metrics']
 
         # 用该学生的“最新一条”记录做预测（优先按 grade_id 或 exam_date 排序）
         row = sdf.copy()
@@ -518,34 +596,11 @@ def predict_student():
                 sort_done = True
         row_latest = row.iloc[-1:]
 
-        # 将最新记录通过相同预处理对齐（简单做法：在全表预处理后对齐列名，取该行原始映射列）
-        # 这里采用再次整体预处理并从 df_proc 中定位行索引的方式（可能不存在一一对应，做列交集对齐）
-        # 构造与 X_all 同列的特征行
-        feature_cols = list(feature_names)
-        row_feat = row_latest.reindex(columns=feature_cols, fill_value=np.nan)
-        # 缺失填充（用列均值）
-        for c in feature_cols:
-            if row_feat[c].isna().any():
-                try:
-                    mean_val = pd.to_numeric(X_all[c], errors='coerce').mean()
-                    row_feat[c] = row_feat[c].fillna(mean_val)
-                except Exception:
-                    row_feat[c] = row_feat[c].fillna(0)
-
-        pred_val = float(best_model.predict(row_feat.values)[0])
+        # 构造与训练特征同列的特征行，缺失值用训练集列均值填充
+        row_feat = build_feature_row(artifact, row_latest)
+        pred_val = float(artifact['model'].predict(row_feat.values)[0])
 
-        fi = selector.get_feature_importance(best_model, feature_names)
-        fi_records = None
-        if fi is not None:
-            fi_records = []
-            try:
-                for r in fi.to_dict('records'):
-                    fi_records.append({
-                        'feature': str(r.get('feature')),
-                        'importance': float(r.get('importance')) if r.get('importance') is not None else 0.0
-                    })
-            except Exception:
-                pass
+        fi_records = artifact.get('feature_importance')
 
         return jsonify({
             'status': 'success',
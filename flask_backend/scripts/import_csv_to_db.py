@@ -9,7 +9,7 @@ BACKEND_DIR = os.path.abspath(os.path.join(CURRENT_DIR, '..'))
 if BACKEND_DIR not in sys.path:
     sys.path.insert(0, BACKEND_DIR)
 
-from database import get_connection
+from database import get_connection, bulk_load
 
 ROOT_DIR = os.path.abspath(os.path.join(BACKEND_DIR, '..'))
 DATA_DIR = os.path.join(ROOT_DIR, 'database_datasets')
@@ -93,53 +93,42 @@ def _parse_date(s: str):
     return None
 
 
+def _report(table, stats):
+    rate = stats.get('rows_per_sec')
+    print(f"    {table}: {stats['rows']} rows via {stats['method']} in {stats['seconds']}s"
+          + (f" ({rate} rows/s)" if rate else ""))
+
+
 def import_students():
     if not os.path.exists(STUDENTS_CSV):
         print(f"[WARN] students.csv not found: {STUDENTS_CSV}")
         return 0
-    conn = get_connection()
-    cur = conn.cursor()
     inserted = 0
-    try:
-        with open(STUDENTS_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = []
-            for r in reader:
-                rows.append((
-                    int(r.get('student_id') or 0),
-                    r.get('student_no') or '',
-                    r.get('name') or '',
-                    r.get('gender') or '',
-                    r.get('grade') or '',
-                    r.get('class') or '',
-                    _parse_date(r.get('birth_date') or ''),
-                    r.get('contact_phone') or '',
-                    r.get('email') or ''
-                ))
-        if rows:
-            cur.executemany(
-                """
-                INSERT INTO students
-                  (student_id, student_no, name, gender, grade, class, birth_date, contact_phone, email)
-                VALUES
-                  (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE
-                  student_no=VALUES(student_no),
-                  name=VALUES(name),
-                  gender=VALUES(gender),
-                  grade=VALUES(grade),
-                  class=VALUES(class),
-                  birth_date=VALUES(birth_date),
-                  contact_phone=VALUES(contact_phone),
-                  email=VALUES(email)
-                """,
-                rows
-            )
-            conn.commit()
-            inserted = cur.rowcount
-    finally:
-        cur.close()
-        conn.close()
+    with open(STUDENTS_CSV, 'r', encoding='utf-8') as f:
+        reader = csv.DictReader(f)
+        rows = []
+        for r in reader:
+            rows.append((
+                int(r.get('student_id') or 0),
+                r.get('student_no') or '',
+                r.get('name') or '',
+                r.get('gender') or '',
+                r.get('grade') or '',
+                r.get('class') or '',
+                _parse_date(r.get('birth_date') or ''),
+                r.get('contact_phone') or '',
+                r.get('email') or ''
+            ))
+    if rows:
+        # Bulk load (LOAD DATA LOCAL INFILE, or multi-row INSERT fallback); existing keys are updated
+        stats = bulk_load(
+            'students',
+            ['student_id', 'student_no', 'name', 'gender', 'grade', 'class', 'birth_date', 'contact_phone', 'email'],
+            rows,
+            upsert=True
+        )
+        _report('students', stats)
+        inserted = stats['rows']
     return inserted
 
 
@@ -234,29 +223,18 @@ def import_university_grades():
                 'calculus_score', 'total_score'
             ]
             insert_cols = [c for c in desired_cols if (c in existing_cols or c in ('student_id','student_no'))]
-            # Build SQL dynamically
-            cols_sql = ", ".join(insert_cols)
-            placeholders = ", ".join(["%s"] * len(insert_cols))
-            update_cols = [c for c in insert_cols if c not in ('student_id',)]
-            update_sql = ",\n                  ".join([f"{c}=VALUES({c})" for c in update_cols])
-            sql = f"""
-                INSERT INTO university_grades
-                  ({cols_sql})
-                VALUES
-                  ({placeholders})
-                ON DUPLICATE KEY UPDATE
-                  {update_sql}
-            """
-
             rows = []
             for d in row_dicts:
                 rows.append(tuple(d.get(c) for c in insert_cols))
-            cur.executemany(sql, rows)
-            conn.commit()
-            inserted = cur.rowcount
     finally:
         cur.close()
         conn.close()
+
+    if row_dicts:
+        # Bulk load (LOAD DATA LOCAL INFILE, or multi-row INSERT fallback); existing keys are updated
+        stats = bulk_load('university_grades', insert_cols, rows, upsert=True)
+        _report('university_grades', stats)
+        inserted = stats['rows']
     return inserted
 
 
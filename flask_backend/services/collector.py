@@ -1,6 +1,8 @@
 """
 Background data collector that auto-detects new rows in configured data sources
-and invalidates caches so the app reflects fresh data automatically.
+and refreshes caches so the app reflects fresh data automatically: new rows (and,
+with updated_at_column, modified rows) are fetched as a delta and merged into the
+cached table; sources without a diff column invalidate the whole table.
 
 Configuration per data source (stored in data_sources.config as JSON):
 {
@@ -139,6 +141,8 @@ class DataCollector:
                 return
             has_new = False
             delta_rows = 0
+            last = None
+            last_ts = None
             if key_col:
                 # 通过主键精确计算新增行数
                 row = fetch_one(f"SELECT MAX({key_col}) AS max_id FROM {table}")
@@ -194,10 +198,15 @@ class DataCollector:
                 pass
 
             if has_new:
-                # mark cache dirty and update last_collection time
+                # 有差异列时只把增量并入已缓存的表，否则整表失效；并更新 last_collection
                 try:
-                    from routes.analysis_routes import mark_table_dirty
-                    mark_table_dirty(table)
+                    from routes.analysis_routes import mark_table_dirty, apply_table_delta
+                    if key_col or upd_col:
+                        apply_table_delta(table, key_column=key_col, last_max_id=last,
+                                          updated_column=None if key_col else upd_col,
+                                          last_max_updated=last_ts, expected_rows=delta_rows)
+                    else:
+                        mark_table_dirty(table)
                 except Exception:
                     pass
                 try:
@@ -0,0 +1,259 @@
+"""
+CSV 数据文件目录
+
+职责：
+- 维护 表名 -> CSV 文件（路径、表头、编码、分隔符）的内存索引，替代每次请求对 uploads 目录的 rglob
+- 启动时（首次使用时）扫描一次 uploads（递归）与 database_datasets；之后增量维护：
+  - 上传保存文件后调用 register() 直接登记
+  - 每次查询只 stat database_datasets 等根目录：根目录修改时间变化时才重新扫描该根目录；
+    uploads 的新文件都经 register() 登记，每次上传都会新建时间戳子目录（根目录 mtime 必变），不做 mtime 检查
+  - 另按 CSV_CATALOG_RESCAN 秒（默认 300）做一次完整重扫兜底，覆盖在已有子目录中手工增删文件的情况
+- 表头/编码/分隔符在首次需要时读取，以 (文件大小, 修改时间) 校验，文件变化后重新读取
+
+注意：
+- 同名表的候选顺序与原逻辑一致：uploads 中的文件优先（多个时最近修改的优先），其次 flask_backend/database_datasets、
+  项目根目录 database_datasets
+- 登记的文件在查询时若已不存在会被移除，并继续尝试下一个候选
+"""
+
+from __future__ import annotations
+import csv
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+import pandas as pd
+
+# 与 _read_csv_header_with_fallbacks 一致的编码尝试顺序
+CSV_ENCODINGS = ['utf-8', 'utf-8-sig', 'gbk', 'cp936', 'latin1']
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class CsvEntry:
+    __slots__ = ('table', 'path', 'root_rank', 'size', 'mtime_ns', 'header', 'encoding', 'delimiter')
+
+    def __init__(self, table: str, path: Path, root_rank: int, size: int, mtime_ns: int) -> None:
+        self.table = table
+        self.path = path
+        self.root_rank = root_rank
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.header: Optional[List[str]] = None
+        self.encoding: Optional[str] = None
+        self.delimiter: Optional[str] = None
+
+    def sort_key(self):
+        # 根目录优先级升序；同一根目录内最近修改的优先
+        return (self.root_rank, -self.mtime_ns, str(self.path))
+
+
+def _detect_format(path: Path):
+    """返回 (编码, 分隔符, 表头列表)；与 pandas python 引擎 sep=None 一致地嗅探分隔符。"""
+    for enc in CSV_ENCODINGS:
+        try:
+            header = pd.read_csv(path, nrows=0, encoding=enc, sep=None, engine='python')
+            with open(path, 'r', encoding=enc, newline='') as f:
+                first = f.readline().lstrip('\ufeff')
+            try:
+                delimiter = csv.Sniffer().sniff(first).delimiter
+            except Exception:
+                delimiter = ','
+            return enc, delimiter, [str(c) for c in header.columns.tolist()]
+        except Exception:
+            continue
+    return None, None, None
+
+
+class CsvCatalog:
+    _instance_lock = threading.Lock()
+    _instance: Optional['CsvCatalog'] = None
+
+    def __init__(self, roots: Optional[List[tuple]] = None, rescan_interval: Optional[float] = None) -> None:
+        # (目录, 是否递归, 是否按根目录 mtime 触发重扫)；列表顺序即同名表的优先级
+        self.roots = roots or [
+            (_BACKEND_DIR / 'uploads', True, False),
+            (_BACKEND_DIR / 'database_datasets', False, True),
+            (_BACKEND_DIR.parent / 'database_datasets', False, True),
+        ]
+        if rescan_interval is None:
+            try:
+                rescan_interval = float(os.getenv('CSV_CATALOG_RESCAN', '300'))
+            except Exception:
+                rescan_interval = 300.0
+        self.rescan_interval = rescan_interval
+        self._lock = threading.RLock()
+        self._entries: Dict[str, List[CsvEntry]] = {}
+        self._by_path: Dict[str, CsvEntry] = {}
+        self._root_mtimes: Dict[int, Optional[int]] = {}
+        self._built_at = 0.0
+        self._stats = {'full_scans': 0, 'root_rescans': 0, 'registered': 0, 'header_reads': 0, 'lookups': 0}
+
+    @classmethod
+    def instance(cls) -> 'CsvCatalog':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = CsvCatalog()
+            return cls._instance
+
+    # ---- 扫描 ----
+    @staticmethod
+    def _dir_mtime(path: Path) -> Optional[int]:
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _iter_root(self, rank: int):
+        base, recursive = self.roots[rank][:2]
+        if not base.is_dir():
+            return
+        stack = [base]
+        while stack:
+            d = stack.pop()
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        if e.name.startswith('.'):
+                            # 跳过隐藏目录（如分块上传的会话目录 .sessions）
+                            continue
+                        if e.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(Path(e.path))
+                        elif e.name.lower().endswith('.csv'):
+                            yield Path(e.path), e.stat()
+            except OSError:
+                continue
+
+    def _add_locked(self, path: Path, rank: int, st) -> CsvEntry:
+        key = str(path)
+        old = self._by_path.get(key)
+        if old is not None and old.size == st.st_size and old.mtime_ns == st.st_mtime_ns:
+            return old
+        if old is not None:
+            self._remove_locked(old)
+        entry = CsvEntry(path.stem, path, rank, st.st_size, st.st_mtime_ns)
+        self._by_path[key] = entry
+        bucket = self._entries.setdefault(entry.table, [])
+        bucket.append(entry)
+        bucket.sort(key=CsvEntry.sort_key)
+        return entry
+
+    def _remove_locked(self, entry: CsvEntry) -> None:
+        self._by_path.pop(str(entry.path), None)
+        bucket = self._entries.get(entry.table) or []
+        bucket = [e for e in bucket if e is not entry]
+        if bucket:
+            self._entries[entry.table] = bucket
+        else:
+            self._entries.pop(entry.table, None)
+
+    def _scan_root_locked(self, rank: int) -> None:
+        self._root_mtimes[rank] = self._dir_mtime(self.roots[rank][0])
+        seen = set()
+        for path, st in self._iter_root(rank):
+            seen.add(str(path))
+            self._add_locked(path, rank, st)
+        for entry in [e for e in self._by_path.values() if e.root_rank == rank and str(e.path) not in seen]:
+            self._remove_locked(entry)
+
+    def rebuild(self) -> None:
+        """完整扫描所有根目录。"""
+        with self._lock:
+            for rank in range(len(self.roots)):
+                self._scan_root_locked(rank)
+            self._built_at = time.monotonic()
+            self._stats['full_scans'] += 1
+
+    def _ensure_fresh(self) -> None:
+        with self._lock:
+            if not self._built_at or (self.rescan_interval > 0 and time.monotonic() - self._built_at > self.rescan_interval):
+                self.rebuild()
+                return
+            for rank in range(len(self.roots)):
+                if not self.roots[rank][2]:
+                    continue
+                if self._dir_mtime(self.roots[rank][0]) != self._root_mtimes.get(rank):
+                    self._scan_root_locked(rank)
+                    self._stats['root_rescans'] += 1
+
+    # ---- 增量维护 ----
+    def register(self, path) -> Optional[CsvEntry]:
+        """登记新保存的 CSV（非 CSV 或不在任何根目录下时忽略）。"""
+        path = Path(path).resolve()
+        if path.suffix.lower() != '.csv':
+            return None
+        for rank, (base, recursive, _) in enumerate(self.roots):
+            try:
+                rel = path.relative_to(base.resolve())
+            except ValueError:
+                continue
+            if not recursive and len(rel.parts) != 1:
+                continue
+            try:
+                st = path.stat()
+            except OSError:
+                return None
+            with self._lock:
+                self._stats['registered'] += 1
+                return self._add_locked(path, rank, st)
+        return None
+
+    # ---- 查询 ----
+    def tables(self) -> List[str]:
+        self._ensure_fresh()
+        with self._lock:
+            return sorted(t for t in self._entries if t)
+
+    def _validated(self, entry: CsvEntry) -> Optional[CsvEntry]:
+        try:
+            st = os.stat(entry.path)
+        except OSError:
+            with self._lock:
+                self._remove_locked(entry)
+            return None
+        if st.st_size != entry.size or st.st_mtime_ns != entry.mtime_ns:
+            with self._lock:
+                entry = self._add_locked(entry.path, entry.root_rank, st)
+        return entry
+
+    def paths(self, table: str) -> List[Path]:
+        """该表的全部 CSV 候选（已按优先级排序，均已确认存在）。"""
+        self._ensure_fresh()
+        with self._lock:
+            self._stats['lookups'] += 1
+            candidates = list(self._entries.get(str(table)) or [])
+        out = []
+        for entry in candidates:
+            entry = self._validated(entry)
+            if entry is not None:
+                out.append(entry.path)
+        return out
+
+    def lookup(self, table: str) -> Optional[CsvEntry]:
+        """优先级最高的可读 CSV 及其表头/编码/分隔符。"""
+        self._ensure_fresh()
+        with self._lock:
+            self._stats['lookups'] += 1
+            candidates = list(self._entries.get(str(table)) or [])
+        for entry in candidates:
+            entry = self._validated(entry)
+            if entry is None:
+                continue
+            if entry.header is None:
+                enc, delimiter, header = _detect_format(entry.path)
+                with self._lock:
+                    self._stats['header_reads'] += 1
+                    entry.encoding, entry.delimiter, entry.header = enc, delimiter, header
+            if entry.header is not None:
+                return entry
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['tables'] = len(self._entries)
+            out['files'] = len(self._by_path)
+            return out
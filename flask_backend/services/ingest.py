@@ -0,0 +1,411 @@
+"""
+上传文件流式入库
+
+职责：
+- 按块读取上传文件（read_csv(chunksize=...)），内存占用只与块大小有关，与文件行数无关
+- 只在文件开头的有界窗口内推断结构：合并各块 dtype 得到列类型，文本宽度仅在蓄水池样本上计算（预留余量）
+- 建表后边写边检查：某块超出已声明的类型/宽度时 ALTER TABLE ... MODIFY 加宽该列，无需预先扫描整个文件；
+  主键列（如 BIGINT AUTO_INCREMENT 的 id）不加宽：MODIFY 会丢掉 AUTO_INCREMENT 并改变主键类型，该块直接失败
+- 每块向量化地把 NaN/空串/'null'/'none' 等统一为 None，并在独立事务中批量写入（database.BulkLoader）
+- 每提交一块回调一次进度（已写入行数），由调用方写入 upload_history.rows_inserted
+
+注意：
+- 块大小通过环境变量 UPLOAD_CHUNK_ROWS 配置（默认 10000 行），同时也是单个事务的行数
+- 扫描窗口 SCHEMA_SCAN_ROWS（默认 100000 行）与样本大小 SCHEMA_SAMPLE_ROWS（默认 10000 行）可配置
+- 编码只校验文件开头的有界前缀（ENCODING_PROBE_BYTES，默认 4MB）：合法 UTF-8 则按 UTF-8 读取，否则按 GBK（忽略非法字节）；
+  前缀之后才出现非 UTF-8 字节时，从出错的块起改按 GBK 继续读取剩余行，不为校验单独通读整个文件
+- 调用方（_ingest_upload）只检测一次编码，结构推断与写入两次遍历共用；行数估计只读取文件开头按字节数外推
+- Excel 无法按块解析，整体读取后再按块切片写入
+"""
+
+from __future__ import annotations
+import codecs
+import os
+from typing import Callable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from database import BulkLoader, execute_query
+
+# 与原上传逻辑一致的缺失值文本
+READ_NA_VALUES = ['NA', 'N/A', 'na', 'nan', 'NaN', 'NULL', 'null', 'None', 'none']
+# 写库前统一视为空值的文本（去空白、小写后比较）
+NULL_TOKENS = ['', 'nan', 'none', 'null', 'na', 'n/a']
+
+
+class IngestCancelled(Exception):
+    """导入任务被取消：由进度回调抛出，insert_chunks 不吞掉该异常。"""
+
+
+def upload_chunk_rows() -> int:
+    try:
+        return max(1, int(os.getenv('UPLOAD_CHUNK_ROWS', '10000')))
+    except Exception:
+        return 10000
+
+
+def encoding_probe_bytes() -> int:
+    try:
+        return max(1, int(os.getenv('ENCODING_PROBE_BYTES', str(4 << 20))))
+    except Exception:
+        return 4 << 20
+
+
+def detect_text_encoding(path: str, limit: Optional[int] = None, block_size: int = 1 << 20) -> str:
+    """校验文件开头 limit 字节是否为合法 UTF-8，是则返回 'utf-8'，否则返回 'gbk'。
+
+    前缀末尾被截断的多字节字符不算错误；前缀之后的非法字节由 iter_file_chunks 在读取时处理。
+    """
+    limit = limit or encoding_probe_bytes()
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    read = 0
+    try:
+        with open(path, 'rb') as f:
+            while read < limit:
+                block = f.read(min(block_size, limit - read))
+                if not block:
+                    decoder.decode(b'', final=True)
+                    return 'utf-8'
+                read += len(block)
+                decoder.decode(block)
+    except UnicodeDecodeError:
+        return 'gbk'
+    return 'utf-8'
+
+
+def _csv_reader(path: str, encoding: str, chunk_rows: int, **kwargs):
+    return pd.read_csv(
+        path, encoding=encoding, encoding_errors='ignore' if encoding != 'utf-8' else 'strict',
+        keep_default_na=True, na_values=READ_NA_VALUES, chunksize=chunk_rows, **kwargs
+    )
+
+
+def iter_file_chunks(path: str, filename: str, chunk_rows: Optional[int] = None,
+                     encoding: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """按块读取上传文件，逐块产出 DataFrame（列名为文件原始表头）。
+
+    encoding 为调用方已检测的 CSV 编码（未给出时检测一次）；按 UTF-8 读到非法字节时，剩余行改按 GBK 读取。
+    """
+    chunk_rows = chunk_rows or upload_chunk_rows()
+    lower = filename.lower()
+    if lower.endswith(('.xlsx', '.xls')):
+        try:
+            df = pd.read_excel(path)
+        except ImportError as ie:
+            raise RuntimeError('读取 Excel 需要安装 openpyxl，请安装后重试') from ie
+        for start in range(0, len(df), chunk_rows):
+            yield df.iloc[start:start + chunk_rows]
+        if len(df) == 0:
+            yield df
+        return
+    if lower.endswith('.csv'):
+        encoding = encoding or detect_text_encoding(path)
+        yielded = 0
+        try:
+            with _csv_reader(path, encoding, chunk_rows) as reader:
+                for chunk in reader:
+                    yielded += len(chunk)
+                    yield chunk
+            return
+        except UnicodeDecodeError:
+            if encoding != 'utf-8':
+                raise
+            print(f"[Ingest] {filename} 第 {yielded} 行之后出现非 UTF-8 字节，剩余部分改按 GBK 读取")
+        # 保留表头，跳过已产出的数据行
+        with _csv_reader(path, 'gbk', chunk_rows, skiprows=range(1, yielded + 1)) as reader:
+            for chunk in reader:
+                yield chunk
+        return
+    else:
+        reader = pd.read_csv(path, chunksize=chunk_rows)
+    with reader:
+        for chunk in reader:
+            yield chunk
+
+
+def schema_sample_rows() -> int:
+    try:
+        return max(1, int(os.getenv('SCHEMA_SAMPLE_ROWS', '10000')))
+    except Exception:
+        return 10000
+
+
+def schema_scan_rows() -> int:
+    try:
+        return max(1, int(os.getenv('SCHEMA_SCAN_ROWS', '100000')))
+    except Exception:
+        return 100000
+
+
+# 数值类型之间按 布尔 < 整型 < 浮点 逐级放宽；其它不一致一律放宽为文本
+_KIND_RANK = {'bool': 0, 'int': 1, 'float': 2}
+# VARCHAR 的最大声明宽度，超过则使用 TEXT
+VARCHAR_LIMIT = 255
+
+
+def _kind_of(s: pd.Series) -> str:
+    if pd.api.types.is_bool_dtype(s):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(s):
+        return 'int'
+    if pd.api.types.is_float_dtype(s):
+        return 'float'
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return 'datetime'
+    return 'text'
+
+
+def _merge_kind(a: Optional[str], b: Optional[str]) -> Optional[str]:
+    if a is None:
+        return b
+    if b is None or a == b:
+        return a
+    if a in _KIND_RANK and b in _KIND_RANK:
+        return a if _KIND_RANK[a] >= _KIND_RANK[b] else b
+    return 'text'
+
+
+def _value_len(s: pd.Series, kind: str) -> int:
+    """该列值转为文本后的最大长度；数值列按极值估计（浮点按最长表示 24 位），不逐值转字符串。"""
+    try:
+        s = s.dropna()
+        if not len(s):
+            return 0
+        if kind == 'text':
+            if not pd.api.types.is_string_dtype(s) or s.dtype == object:
+                s = s.astype(str)
+            return int(s.str.len().max() or 0)
+        if kind == 'int':
+            return max(len(str(s.min())), len(str(s.max())))
+        if kind == 'float':
+            return 24
+        if kind == 'bool':
+            return 5
+        if kind == 'datetime':
+            return 26
+    except Exception:
+        pass
+    return VARCHAR_LIMIT
+
+
+class ColumnProfile:
+    """单列的类型画像与已声明的 MySQL 类型。
+
+    kind/max_len 随观察到的数据单调放宽；declare() 按当前画像生成列类型（文本宽度留有余量）
+    并记录下来，之后的数据超出已声明的类型/宽度时 fits() 返回 False，由调用方 ALTER 加宽。
+    """
+
+    __slots__ = ('kind', 'max_len', 'declared_kind', 'capacity')
+
+    def __init__(self) -> None:
+        self.kind: Optional[str] = None   # bool / int / float / datetime / text；None 表示尚未见到非空值
+        self.max_len = 0
+        self.declared_kind: Optional[str] = None
+        self.capacity: Optional[int] = None   # 已声明 VARCHAR 的宽度；TEXT 为 None
+
+    def observe_kind(self, s: pd.Series) -> None:
+        """只合并类型（不计算长度），整列为空的块不参与推断。"""
+        if len(s) and not s.isna().all():
+            self.kind = _merge_kind(self.kind, _kind_of(s))
+
+    def observe(self, s: pd.Series) -> None:
+        """合并类型并更新最大长度。"""
+        if not len(s) or s.isna().all():
+            return
+        kind = _kind_of(s)
+        self.kind = _merge_kind(self.kind, kind)
+        self.max_len = max(self.max_len, _value_len(s, kind))
+
+    def mysql_type(self) -> str:
+        kind = self.kind or 'text'
+        if kind == 'bool':
+            return 'TINYINT(1)'
+        if kind == 'int':
+            return 'BIGINT'
+        if kind == 'float':
+            return 'DOUBLE'
+        if kind == 'datetime':
+            return 'DATETIME'
+        if self.max_len > VARCHAR_LIMIT:
+            return 'TEXT'
+        if self.max_len <= 0:
+            return 'VARCHAR(64)'
+        # 宽度只来自样本，预留 50%（至少 10 个字符）
+        return f"VARCHAR({min(self.max_len + max(10, self.max_len // 2), VARCHAR_LIMIT)})"
+
+    def declare(self) -> str:
+        """生成并记录当前列类型（建表或加宽时调用）。"""
+        col_type = self.mysql_type()
+        self.declared_kind = self.kind or 'text'
+        self.capacity = int(col_type[8:-1]) if col_type.startswith('VARCHAR(') else None
+        return col_type
+
+    def fits(self) -> bool:
+        kind = self.kind or 'text'
+        if kind != self.declared_kind:
+            return False
+        return kind != 'text' or self.capacity is None or self.max_len <= self.capacity
+
+
+class UploadSchema:
+    """基于有界样本推断的上传文件结构。
+
+    只扫描文件开头的 SCHEMA_SCAN_ROWS 行：各块的 dtype 用于合并列类型，
+    同时用蓄水池抽样保留至多 SCHEMA_SAMPLE_ROWS 行，仅在样本上计算文本宽度。
+    建表后写入每一块前调用 widen()，某列超出已声明的类型或宽度时返回需要加宽的列。
+    """
+
+    def __init__(self, columns: List, profiles: List[ColumnProfile], scanned_rows: int,
+                 sample_rows: int, complete: bool) -> None:
+        self.columns = columns
+        self.profiles = profiles
+        self.scanned_rows = scanned_rows
+        self.sample_rows = sample_rows
+        self.complete = complete   # True 表示扫描窗口已覆盖整个文件
+
+    def widen(self, chunk: pd.DataFrame, positions: Sequence[int]) -> List[tuple]:
+        """观察一块数据，返回需要加宽的 [(列位置, 新类型), ...]，并记为已声明。"""
+        changes = []
+        for i in positions:
+            p = self.profiles[i]
+            p.observe(chunk.iloc[:, i])
+            if not p.fits():
+                changes.append((i, p.declare()))
+        return changes
+
+
+def infer_schema(chunks: Iterator[pd.DataFrame], sample_rows: Optional[int] = None,
+                 scan_rows: Optional[int] = None, seed: int = 0) -> UploadSchema:
+    """在有界样本上推断列类型与宽度，读满扫描窗口即停止，不把整个文件载入内存。"""
+    sample_rows = sample_rows or schema_sample_rows()
+    scan_rows = scan_rows or schema_scan_rows()
+    rng = np.random.default_rng(seed)
+    columns: Optional[List] = None
+    profiles: List[ColumnProfile] = []
+    reservoir: List[np.ndarray] = []
+    filled = 0
+    seen = 0
+    complete = True
+    for chunk in chunks:
+        if columns is None:
+            columns = list(chunk.columns)
+            profiles = [ColumnProfile() for _ in columns]
+            reservoir = [np.empty(sample_rows, dtype=object) for _ in columns]
+        n = len(chunk)
+        if n == 0:
+            continue
+        if seen >= scan_rows:
+            complete = False
+            break
+        for i, p in enumerate(profiles):
+            p.observe_kind(chunk.iloc[:, i])
+        # 蓄水池抽样（Algorithm R）：先填满，之后第 t 行以 sample_rows/t 的概率替换随机一个位置
+        take = min(n, sample_rows - filled)
+        slots = np.arange(filled, filled + take)
+        rows = np.arange(take)
+        if take < n:
+            later = np.arange(take, n)
+            picks = rng.integers(0, seen + later + 1)
+            keep = picks < sample_rows
+            slots = np.concatenate([slots, picks[keep]])
+            rows = np.concatenate([rows, later[keep]])
+        if len(rows):
+            for i in range(len(columns)):
+                values = chunk.iloc[:, i].to_numpy(dtype=object)
+                reservoir[i][slots] = values[rows]
+        filled += take
+        seen += n
+    if columns is None:
+        return UploadSchema([], [], 0, 0, True)
+    for i, p in enumerate(profiles):
+        if p.kind is None:
+            continue
+        sample = pd.Series(reservoir[i][:filled]).dropna()
+        # 文本列按字符串长度；数值列按样本极值估计（之后若合并为文本，VARCHAR 仍足够宽）
+        p.max_len = _value_len(sample if p.kind == 'text' else sample.infer_objects(), p.kind)
+    return UploadSchema(columns, profiles, seen, filled, complete)
+
+
+def estimate_rows(path: str, schema: UploadSchema, probe_bytes: int = 1 << 20) -> int:
+    """估计数据行数（用于进度百分比）：扫描窗口已覆盖全文件时为精确值，
+    否则按文件开头 probe_bytes 字节内的换行符密度与文件大小外推（不通读文件）。"""
+    if schema.complete:
+        return schema.scanned_rows
+    try:
+        size = os.path.getsize(path)
+        with open(path, 'rb') as f:
+            head = f.read(probe_bytes)
+    except Exception:
+        return schema.scanned_rows
+    lines = head.count(b'\n')
+    if not head or not lines:
+        return schema.scanned_rows
+    return max(schema.scanned_rows, int(lines * size / len(head)) - 1)
+
+
+def normalize_chunk(df: pd.DataFrame) -> List[tuple]:
+    """向量化地把缺失/空白/'null' 等统一为 None，返回可直接 executemany 的行元组（原生 Python 类型）。"""
+    if df.empty:
+        return []
+    out = {}
+    for i in range(df.shape[1]):
+        s = df.iloc[:, i]
+        if pd.api.types.is_float_dtype(s):
+            arr = s.to_numpy(dtype='float64', na_value=np.nan)
+            mask = ~np.isfinite(arr)
+        elif pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+            mask = s.isna().to_numpy()
+        else:
+            text = s.astype(str).str.strip().str.lower()
+            mask = (s.isna() | text.isin(NULL_TOKENS)).to_numpy()
+        col = s.astype(object)
+        if mask.any():
+            col = col.where(~mask, None)
+        out[i] = col.tolist()
+    return list(zip(*out.values()))
+
+
+def insert_chunks(table: str, columns: Sequence[str], chunks: Iterator[pd.DataFrame],
+                  positions: Sequence[int],
+                  on_progress: Optional[Callable[[int], None]] = None,
+                  schema: Optional[UploadSchema] = None,
+                  key_columns: Sequence[str] = ()) -> dict:
+    """逐块写入：每块一个事务（经 BulkLoader 走 LOAD DATA 或多行 INSERT），提交后回调已写入的累计行数。
+
+    positions 为要写入的列在块中的位置（与 columns 一一对应）。传入 schema 时，写入每块前先检查
+    是否超出已声明的列类型/宽度，超出则 ALTER TABLE ... MODIFY 加宽该列；
+    key_columns 中的列（主键）超出时不加宽，抛出 ValueError，该块不写入。
+    某块失败时回滚该块并抛出异常，之前已提交的块保留。
+    返回 BulkLoader.stats()（写入方式、行数、耗时、每秒行数）及加宽记录 widened。
+    """
+    total = 0
+    widened = []
+    name_of = dict(zip(positions, columns))
+    with BulkLoader(table, columns) as loader:
+        for chunk in chunks:
+            if schema is not None:
+                changes = schema.widen(chunk, positions)
+                for i, col_type in changes:
+                    if name_of[i] in key_columns:
+                        raise ValueError(f'主键列 `{name_of[i]}` 在第 {total + 1} 行之后出现与建表类型不符的值'
+                                         f'（需要 {col_type}），主键列不能加宽，请检查数据后重新上传')
+                for i, col_type in changes:
+                    execute_query(f"ALTER TABLE `{table}` MODIFY COLUMN `{name_of[i]}` {col_type}")
+                    widened.append({'column': name_of[i], 'type': col_type, 'at_row': total})
+            rows = normalize_chunk(chunk.iloc[:, list(positions)])
+            if not rows:
+                continue
+            total += loader.load(rows)
+            if on_progress is not None:
+                try:
+                    on_progress(total)
+                except IngestCancelled:
+                    raise
+                except Exception as e:
+                    print(f"[上传] 记录进度失败: {e}")
+        stats = loader.stats()
+    stats['widened'] = widened
+    print(f"[上传] 写入表 {table}: {stats['rows']} 行，方式 {stats['method']}，{stats['rows_per_sec']} 行/秒，"
+          f"加宽列 {len(widened)} 次")
+    return stats
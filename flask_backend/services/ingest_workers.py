@@ -0,0 +1,141 @@
+"""
+上传文件的后台导入
+
+职责：
+- 上传请求只负责保存文件并提交任务，建表/写入交给后台线程池执行，多个文件并行导入
+- 每个导入任务登记为一条 collection_tasks 记录（status/progress），前端在“采集任务”中查看进度
+- 导入过程中汇报进度（0~100）；任务被取消（status 改为 cancelled）后在下一次汇报时中止，
+  最终状态与中止时的进度写回 collection_tasks，对应的上传历史标记为 cancelled
+
+注意：
+- 工作线程数通过环境变量 INGEST_WORKERS 配置（默认 2）；导入以数据库 I/O 为主，使用线程即可，
+  且与 Web 进程共享表缓存，写入完成后的缓存失效对本进程立即生效
+- 进度写库做了节流：百分比变化时才更新，取消检查与进度更新共用同一次查询
+- 数据库不可用时任务仍会执行，只是没有 collection_tasks 记录
+"""
+
+from __future__ import annotations
+import os
+import threading
+import traceback
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Callable
+
+from database import execute_query, execute_insert_return_id, fetch_one
+from services.ingest import IngestCancelled
+
+
+class IngestWorkers:
+    _instance_lock = threading.Lock()
+    _instance: Optional['IngestWorkers'] = None
+
+    def __init__(self, max_workers: Optional[int] = None) -> None:
+        if max_workers is None:
+            try:
+                max_workers = int(os.getenv('INGEST_WORKERS', '2'))
+            except Exception:
+                max_workers = 2
+        self.max_workers = max(1, max_workers)
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {'submitted': 0, 'running': 0, 'completed': 0, 'failed': 0, 'cancelled': 0}
+
+    @classmethod
+    def instance(cls) -> 'IngestWorkers':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = IngestWorkers()
+            return cls._instance
+
+    def _ensure_started(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='ingest')
+            return self._executor
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out['workers'] = self.max_workers
+        return out
+
+    def _count(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += delta
+
+    @staticmethod
+    def _update_task(task_id: Optional[int], status: Optional[str] = None, progress: Optional[int] = None) -> None:
+        if not task_id:
+            return
+        fields, params = [], []
+        if status is not None:
+            fields.append("status=%s")
+            params.append(status)
+        if progress is not None:
+            fields.append("progress=%s")
+            params.append(int(progress))
+        try:
+            execute_query(f"UPDATE collection_tasks SET {', '.join(fields)}, updated_at=NOW() WHERE id=%s",
+                          params + [task_id])
+        except Exception as e:
+            print(f"[IngestWorkers] 更新任务 #{task_id} 失败: {e}")
+
+    def submit(self, name: str, fn: Callable[..., Dict[str, Any]], *args, **kwargs) -> Optional[int]:
+        """登记任务并提交到线程池，返回 collection_tasks 的任务ID（数据库不可用时为 None）。
+
+        fn 需接受关键字参数 on_progress(pct:int)；返回值中 status 为 'failed' 时任务记为失败。
+        """
+        task_id = None
+        try:
+            task_id = execute_insert_return_id(
+                "INSERT INTO collection_tasks (name, source_id, source_name, status, progress) VALUES (%s, %s, %s, %s, %s)",
+                [name[:120], None, '文件上传', 'pending', 0]
+            )
+        except Exception as e:
+            print(f"[IngestWorkers] 登记任务失败，继续后台导入: {e}")
+        self._count('submitted')
+        self._ensure_started().submit(self._run, task_id, fn, args, kwargs)
+        return task_id
+
+    def _run(self, task_id: Optional[int], fn, args, kwargs) -> None:
+        state = {'pct': -1}
+
+        def report(pct: int) -> None:
+            pct = max(0, min(99, int(pct)))
+            if pct == state['pct']:
+                return
+            state['pct'] = pct
+            if task_id:
+                try:
+                    row = fetch_one("SELECT status FROM collection_tasks WHERE id=%s", [task_id])
+                    if row and row.get('status') == 'cancelled':
+                        raise IngestCancelled('导入任务已取消')
+                except IngestCancelled:
+                    raise
+                except Exception:
+                    pass
+            self._update_task(task_id, progress=pct)
+
+        self._count('running')
+        self._update_task(task_id, status='running', progress=0)
+        try:
+            result = fn(*args, on_progress=report, **kwargs) or {}
+            if result.get('status') == 'failed':
+                self._count('failed')
+                self._update_task(task_id, status='failed')
+            else:
+                self._count('completed')
+                self._update_task(task_id, status='completed', progress=100)
+        except IngestCancelled:
+            self._count('cancelled')
+            print(f"[IngestWorkers] 任务 #{task_id} 已取消")
+            # 记录最终状态与取消时的进度（取消请求可能来自其它入口，此处统一落库）
+            self._update_task(task_id, status='cancelled', progress=max(0, state['pct']))
+        except Exception as e:
+            self._count('failed')
+            print(f"[IngestWorkers] 任务 #{task_id} 执行失败: {e}")
+            traceback.print_exc(file=sys.stdout)
+            self._update_task(task_id, status='failed')
+        finally:
+            self._count('running', -1)
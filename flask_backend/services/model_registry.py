@@ -0,0 +1,333 @@
+"""
+模型注册表
+
+职责：
+- 持久化已训练的模型及其推理所需的上下文（拟合好的 Preprocessor、特征列、特征均值、指标、特征重要性）
+- 以 (表名, 目标列, 数据版本) 为键复用模型，单个学生的预测只做推理而不再重新训练
+
+注意：
+- 数据版本为表内容指纹（列名/类型 + 逐行哈希），数据变化后自动失效并重新训练；
+  来自表缓存（TableCache）的未改动视图按缓存条目版本复用已算好的指纹，每个版本只哈希一次，
+  其它 DataFrame（筛选/加列后的数据、直接查询的结果）每次现场计算
+- 模型以 .pkl 落地到 models 目录（与 /api/training/models 列表一致），同一 (表, 目标列) 只保留最新版本
+- 进程内另有一层 LRU 内存缓存，容量通过环境变量 MODEL_CACHE_SIZE 配置（默认 16）
+- TrainingResultCache 缓存 /train、/predict-table 的完整响应，键为 (任务类型, 数据指纹, 目标列,
+  测试集比例, 随机种子, 其它影响输出的参数)；落地到 models/results，后台任务进程与 Web 进程共享
+"""
+
+from __future__ import annotations
+import os
+import re
+import hashlib
+import pickle
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+from .model_selection import ModelSelector
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'models')
+
+
+def _content_hash(df: pd.DataFrame) -> Optional[str]:
+    try:
+        h = hashlib.sha1()
+        h.update(repr([(str(c), str(t)) for c, t in df.dtypes.items()]).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+        return h.hexdigest()
+    except Exception as e:
+        print(f"[ModelRegistry] 计算数据版本失败，跳过模型缓存: {e}")
+        return None
+
+
+def data_version(df: Optional[pd.DataFrame]) -> Optional[str]:
+    """计算 DataFrame 的内容指纹；无法哈希（如含不可哈希对象）时返回 None，表示不缓存。
+
+    df 是 TableCache 当前条目的视图（df.attrs['table_cache'] 标记有效）时，指纹按 (表, 版本, 变体) 缓存在条目上；
+    指纹本身仍是内容哈希，模型文件与结果缓存可在进程间、重启后继续复用。
+    """
+    if df is None:
+        return None
+    try:
+        from .table_cache import TableCache
+        fp = TableCache.instance().fingerprint(df, _content_hash)
+        if fp is not None:
+            return fp
+    except Exception as e:
+        print(f"[ModelRegistry] 读取表缓存指纹失败，改为直接计算: {e}")
+    return _content_hash(df)
+
+
+def fit_artifact(df_proc: pd.DataFrame, target_column: str, encoders=None,
+                 test_size: float = 0.2, random_state: int = 42, preprocessor=None) -> Dict[str, Any]:
+    """在预处理后的数据上选择并训练模型，返回可直接用于推理的模型包。
+
+    流程与原各端点内联实现一致：划分训练/测试集 -> 模型选择 -> 测试集评估 -> 全量数据重新拟合。
+    传入 preprocessor 时随模型一起保存，推理时对新记录做与训练一致的预处理。
+    """
+    X_all = df_proc.drop(columns=[target_column])
+    y_all = df_proc[target_column]
+    feature_names = X_all.columns.tolist()
+
+    X_train, X_test, y_train, y_test = train_test_split(X_all.values, y_all.values, test_size=test_size, random_state=random_state)
+    selector = ModelSelector()
+    best_model, model_results, best_params = selector.select_best_model(X_train, y_train)
+    y_pred = best_model.predict(X_test)
+    metrics = {
+        'r2': float(r2_score(y_test, y_pred)),
+        'mae': float(mean_absolute_error(y_test, y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y_test, y_pred)))
+    }
+
+    # 在全量数据上重新拟合
+    best_model.fit(X_all.values, y_all.values)
+
+    # 推理时用于填补缺失特征的列均值
+    feature_means = {}
+    for c in feature_names:
+        try:
+            v = pd.to_numeric(X_all[c], errors='coerce').mean()
+            feature_means[c] = float(v) if pd.notna(v) else 0.0
+        except Exception:
+            feature_means[c] = 0.0
+
+    fi_records = None
+    fi = selector.get_feature_importance(best_model, feature_names)
+    if fi is not None:
+        fi_records = []
+        try:
+            for r in fi.to_dict('records'):
+                fi_records.append({
+                    'feature': str(r.get('feature')),
+                    'importance': float(r.get('importance')) if r.get('importance') is not None else 0.0
+                })
+        except Exception:
+            pass
+
+    return {
+        'model': best_model,
+        'encoders': encoders,
+        'preprocessor': preprocessor,
+        'target_column': target_column,
+        'feature_names': feature_names,
+        'feature_means': feature_means,
+        'metrics': metrics,
+        'model_results': model_results,
+        'best_params': best_params,
+        'feature_importance': fi_records,
+        'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+def build_feature_row(artifact: Dict[str, Any], row: pd.DataFrame) -> pd.DataFrame:
+    """将原始记录按模型特征列对齐，缺失值以训练集列均值填充。
+
+    模型包中带有 Preprocessor 时，先用训练时的统计量处理该记录（类型转换、填充、异常值、标签编码）。
+    """
+    feature_cols = list(artifact['feature_names'])
+    means = artifact.get('feature_means') or {}
+    pre = artifact.get('preprocessor')
+    if pre is not None:
+        try:
+            row = pre.transform(row)
+        except Exception as e:
+            print(f"[ModelRegistry] 预处理推理记录失败，按原始值对齐: {e}")
+    row_feat = row.reindex(columns=feature_cols, fill_value=np.nan)
+    for c in feature_cols:
+        if row_feat[c].isna().any():
+            row_feat[c] = row_feat[c].fillna(means.get(c, 0.0))
+    return row_feat
+
+
+class ModelRegistry:
+    _instance_lock = threading.Lock()
+    _instance: Optional['ModelRegistry'] = None
+
+    def __init__(self, model_dir: str = MODEL_DIR, memory_size: Optional[int] = None) -> None:
+        self.model_dir = model_dir
+        if memory_size is None:
+            try:
+                memory_size = int(os.getenv('MODEL_CACHE_SIZE', '16'))
+            except Exception:
+                memory_size = 16
+        self.memory_size = max(0, memory_size)
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        os.makedirs(self.model_dir, exist_ok=True)
+
+    @classmethod
+    def instance(cls) -> 'ModelRegistry':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = ModelRegistry()
+            return cls._instance
+
+    @staticmethod
+    def _prefix(table: str, target: str) -> str:
+        # 文件名：可读的表名 + (表, 目标列) 哈希，目标列可能是中文，避免直接放入文件名
+        safe_table = re.sub(r'[^0-9A-Za-z_]+', '_', str(table))[:40] or 'table'
+        digest = hashlib.sha1(f"{table}|{target}".encode('utf-8')).hexdigest()[:10]
+        return f"registry_{safe_table}_{digest}_"
+
+    def _path(self, table: str, target: str, version: str) -> str:
+        return os.path.join(self.model_dir, f"{self._prefix(table, target)}{version[:16]}.pkl")
+
+    def get(self, table: str, target: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        """按键获取模型包：先查内存，再查磁盘；不存在返回 None。"""
+        if not version:
+            return None
+        path = self._path(table, target, version)
+        with self._lock:
+            art = self._memory.get(path)
+            if art is not None:
+                self._memory.move_to_end(path)
+                return art
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                art = pickle.load(f)
+        except Exception as e:
+            print(f"[ModelRegistry] 读取模型失败 {path}: {e}")
+            return None
+        if art.get('data_version') != version:
+            return None
+        self._remember(path, art)
+        return art
+
+    def put(self, table: str, target: str, version: Optional[str], artifact: Dict[str, Any]) -> Dict[str, Any]:
+        """保存模型包（内存 + 磁盘），并清理同一 (表, 目标列) 的旧版本文件。"""
+        artifact['table'] = table
+        artifact['data_version'] = version
+        if not version:
+            return artifact
+        path = self._path(table, target, version)
+        self._remember(path, artifact)
+        try:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(artifact, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            prefix = self._prefix(table, target)
+            for name in os.listdir(self.model_dir):
+                full = os.path.join(self.model_dir, name)
+                if name.startswith(prefix) and name.endswith('.pkl') and full != path:
+                    try:
+                        os.remove(full)
+                    except Exception:
+                        pass
+        except Exception as e:
+            print(f"[ModelRegistry] 保存模型失败 {path}: {e}")
+        return artifact
+
+    def _remember(self, path: str, artifact: Dict[str, Any]) -> None:
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[path] = artifact
+            self._memory.move_to_end(path)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+
+class TrainingResultCache:
+    """训练结果缓存：数据与参数均未变化时，重复点击“训练”直接返回上次结果。"""
+
+    _instance_lock = threading.Lock()
+    _instance: Optional['TrainingResultCache'] = None
+
+    def __init__(self, cache_dir: Optional[str] = None, memory_size: Optional[int] = None) -> None:
+        self.cache_dir = cache_dir or os.path.join(MODEL_DIR, 'results')
+        if memory_size is None:
+            try:
+                memory_size = int(os.getenv('TRAINING_RESULT_CACHE_SIZE', '32'))
+            except Exception:
+                memory_size = 32
+        self.memory_size = max(0, memory_size)
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @classmethod
+    def instance(cls) -> 'TrainingResultCache':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TrainingResultCache()
+            return cls._instance
+
+    @staticmethod
+    def make_key(kind: str, fingerprint: Optional[str], target: Any, test_size: float,
+                 random_state: int = 42, **extra) -> Optional[str]:
+        if not fingerprint:
+            return None
+        parts = [str(kind), fingerprint, str(target), repr(float(test_size)), str(random_state)]
+        parts += [f"{k}={extra[k]!r}" for k in sorted(extra)]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not key:
+            return None
+        with self._lock:
+            body = self._memory.get(key)
+            if body is not None:
+                self._memory.move_to_end(key)
+                return body
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                body = pickle.load(f)
+        except Exception as e:
+            print(f"[TrainingResultCache] 读取缓存失败 {path}: {e}")
+            return None
+        self._remember(key, body)
+        return body
+
+    def put(self, key: Optional[str], body: Dict[str, Any]) -> None:
+        if not key or body is None:
+            return
+        self._remember(key, body)
+        path = self._path(key)
+        try:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                pickle.dump(body, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            self._prune_disk()
+        except Exception as e:
+            print(f"[TrainingResultCache] 保存缓存失败 {path}: {e}")
+
+    def _prune_disk(self) -> None:
+        # 磁盘上最多保留 4 倍内存容量的结果，按修改时间淘汰最旧的
+        limit = max(self.memory_size * 4, 1)
+        try:
+            files = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith('.pkl')]
+            if len(files) <= limit:
+                return
+            files.sort(key=os.path.getmtime)
+            for full in files[:len(files) - limit]:
+                try:
+                    os.remove(full)
+                except Exception:
+                    pass
+        except Exception:
+            pass
+
+    def _remember(self, key: str, body: Dict[str, Any]) -> None:
+        if self.memory_size <= 0:
+            return
+        with self._lock:
+            self._memory[key] = body
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
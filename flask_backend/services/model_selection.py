@@ -3,19 +3,37 @@
 
 职责：
 - 提供一组候选回归模型
-- 使用交叉验证评估并选出最佳模型
+- 在所有模型的联合参数网格上做逐次减半（successive halving）搜索并选出最佳模型
 - 提供特征重要性导出
 
 注意：
-- 采用 n_jobs=1 避免 Windows 下多进程并行带来的临时目录/编码等问题
+- 默认 n_jobs=1（串行），避免 Windows 下多进程并行带来的临时目录/编码等问题
+- 可通过环境变量 MODEL_SELECTION_N_JOBS（或构造参数 n_jobs）开启并行：
+  (模型, 参数组合, 折) 被拆成独立任务交给 joblib 分发到多核，结果与串行模式逐位一致
+- 逐次减半以交叉验证折数为资源：每轮所有存活组合补算到 1 -> 3 -> 5 折，
+  保留得分前 1/eta 的组合进入下一轮；折划分为打乱顺序的 KFold（固定 random_state），
+  避免首轮只用按原始顺序切出的第 1 折就淘汰大部分组合
+- 可用 MODEL_SEARCH_MAX_FITS（拟合次数）与 MODEL_SEARCH_TIME_BUDGET（秒）限制搜索预算：
+  - 拟合次数预算同样作用于第 1 轮：首轮任务超出预算时，按模型轮流挑选组合，只评估预算内的部分
+  - 时间预算在每轮开始前检查，第 1 轮（每组合 1 折）总会完整执行，即最少耗时为首轮用时
+  - 预算用尽时以已完成轮次的结果选优
+- 对比结果带 n_folds：预算提前停止时各模型评估折数可能不同，is_best 只在评估折数最多的结果中产生；
+  拟合失败的折记为 NaN，均值/标准差忽略 NaN
+- 进度回调：构造参数 progress_callback 或 set_progress_callback() 设置的进程级回调，
+  串行与并行模式下都在每完成一次拟合后调用一次（并行时按提交顺序汇报）；回调抛出的异常会中止搜索（用于取消后台任务）
 """
 
 # flask_backend/services/model_selection.py
 # -*- coding: utf-8 -*-
 import os
+import math
+import time
 import tempfile
 import numpy as np
-from sklearn.model_selection import cross_val_score
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import r2_score
+from sklearn.model_selection import KFold, ParameterGrid
 from sklearn.linear_model import LinearRegression, Ridge, Lasso
 from sklearn.ensemble import RandomForestRegressor, GradientBoostingRegressor
 import pandas as pd
@@ -23,8 +41,47 @@ import pandas as pd
 # 设置sklearn临时文件夹为纯ASCII路径
 os.environ['JOBLIB_TEMP_FOLDER'] = tempfile.gettempdir()
 
+def _fit_and_score(model, params, X, y, train_idx, test_idx):
+    """单个 (模型, 参数, 折) 任务：在训练折上拟合并返回测试折 R²（与 cross_val_score(scoring='r2') 一致）。"""
+    try:
+        est = clone(model).set_params(**params)
+        est.fit(X[train_idx], y[train_idx])
+        return float(r2_score(y[test_idx], est.predict(X[test_idx])))
+    except Exception as e:
+        print(f"[ModelSelector] 拟合失败 {type(model).__name__} {params}: {e}")
+        return float('nan')
+
+
+# 进程级默认进度回调（后台训练任务在工作进程中设置）
+_progress_callback = None
+
+
+def set_progress_callback(callback):
+    """设置当前进程内 ModelSelector 的默认进度回调，传 None 取消。"""
+    global _progress_callback
+    _progress_callback = callback
+
+
+def _env_number(name, default, cast=float):
+    try:
+        return cast(os.getenv(name, default))
+    except Exception:
+        return cast(default)
+
+
 class ModelSelector:
-    def __init__(self):
+    def __init__(self, n_jobs=None, cv=5, eta=None, max_fits=None, time_budget=None, progress_callback=None):
+        if n_jobs is None:
+            n_jobs = _env_number('MODEL_SELECTION_N_JOBS', '1', int)
+        self.n_jobs = n_jobs or 1
+        self.cv = cv
+        # 交叉验证折划分的随机种子（与候选模型的 random_state 一致）
+        self.random_state = 42
+        # 逐次减半参数：每轮保留 1/eta；预算 <=0 表示不限制
+        self.eta = max(2, int(eta if eta is not None else _env_number('MODEL_SEARCH_ETA', '3', int)))
+        self.max_fits = int(max_fits if max_fits is not None else _env_number('MODEL_SEARCH_MAX_FITS', '0', int))
+        self.time_budget = float(time_budget if time_budget is not None else _env_number('MODEL_SEARCH_TIME_BUDGET', '0'))
+        self.progress_callback = progress_callback
         self.models = {
             'linear': {
                 'model': LinearRegression(),
@@ -50,48 +107,165 @@ class ModelSelector:
             }
         }
     
+    def _candidates(self):
+        """展开所有模型的联合参数网格：[(模型名, 参数字典)]，无超参数的模型只有默认参数一组。"""
+        cands = []
+        for name, config in self.models.items():
+            for params in ParameterGrid(config['params'] or {}):
+                cands.append((name, dict(params)))
+        return cands
+
+    def _interleaved(self, cands):
+        """候选序号按模型轮流排列（linear, ridge, rf, gb, ridge, rf, ...），截断时各模型都有组合被评估。"""
+        groups = {}
+        for i, (name, _) in enumerate(cands):
+            groups.setdefault(name, []).append(i)
+        order = []
+        for k in range(max((len(g) for g in groups.values()), default=0)):
+            order.extend(g[k] for g in groups.values() if k < len(g))
+        return order
+
+    def _fold_schedule(self, n_splits):
+        """每轮使用的累计折数：1, eta, eta^2 ... 直到全部 n_splits 折。"""
+        schedule = []
+        r = 1
+        while r < n_splits:
+            schedule.append(r)
+            r *= self.eta
+        schedule.append(n_splits)
+        return schedule
+
+    def _planned_fits(self, n_candidates, n_splits):
+        """不触发预算时逐次减半的总拟合次数，用于进度百分比。"""
+        total, alive, done_folds = 0, n_candidates, 0
+        for n_folds in self._fold_schedule(n_splits):
+            total += alive * (n_folds - done_folds)
+            done_folds = n_folds
+            alive = max(1, int(math.ceil(alive / self.eta)))
+        return total
+
+    def _notify(self, **info):
+        callback = self.progress_callback or _progress_callback
+        if callback is not None:
+            callback(info)
+
+    def _run_tasks(self, tasks, X, y, folds, progress):
+        """执行 (参数组合序号, 模型名, 参数, 折序号) 任务列表，返回与 tasks 对齐的得分。"""
+        jobs = [
+            delayed(_fit_and_score)(self.models[name]['model'], params, X, y, folds[fold][0], folds[fold][1])
+            for _, name, params, fold in tasks
+        ]
+        if self.n_jobs == 1:
+            out = []
+            for (f, a, kw), (_, name, params, fold) in zip(jobs, tasks):
+                out.append(f(*a, **kw))
+                progress['done'] += 1
+                self._notify(model=name, params=params, fold=fold + 1, **progress)
+            return out
+        try:
+            # 按提交顺序逐个产出结果：每完成一个任务即汇报一次进度（取消也能在单次拟合粒度上生效）
+            results = Parallel(n_jobs=self.n_jobs, return_as='generator')(jobs)
+        except TypeError:
+            # joblib < 1.3 不支持 return_as：按 n_jobs 个任务一批执行，批内逐个汇报
+            step = max(1, self.n_jobs if self.n_jobs > 0 else (os.cpu_count() or 1))
+            results = (score for k in range(0, len(jobs), step)
+                       for score in Parallel(n_jobs=self.n_jobs)(jobs[k:k + step]))
+        out = []
+        for score, (_, name, params, fold) in zip(results, tasks):
+            out.append(score)
+            progress['done'] += 1
+            self._notify(model=name, params=params, fold=fold + 1, **progress)
+        return out
+
+    @staticmethod
+    def _nan_stat(func, scores):
+        """忽略失败折（NaN）的统计量；全部失败时返回 None（JSON 中为 null 而不是 NaN）。"""
+        arr = np.asarray(scores, dtype=float)
+        if not np.isfinite(arr).any():
+            return None
+        return float(func(arr))
+
+    @classmethod
+    def _rank_score(cls, scores):
+        m = cls._nan_stat(np.nanmean, scores)
+        return m if m is not None else float('-inf')
+
     def select_best_model(self, X, y):
-        """对候选模型进行交叉验证并返回最佳模型与对比结果。"""
-        best_score = float('-inf')
-        best_model = None
-        best_params = {}
+        """对候选模型做逐次减半搜索并返回 (最佳模型, 各模型对比结果, 最佳参数)。
+
+        results 为 {模型名: {'cv_mean', 'cv_std', 'n_folds', 'n_candidates', 'is_best'}}，
+        取该模型内评估折数最多且均分最高的参数组合；n_folds 不同的结果不可直接比较均分。
+        """
+        X = np.asarray(X)
+        y = np.asarray(y)
+        # 打乱后划分：首轮只评估 1 折时，该折不会只覆盖按原始顺序排列的某一段样本
+        n_splits = max(2, min(self.cv, len(X)))
+        folds = list(KFold(n_splits=n_splits, shuffle=True, random_state=self.random_state).split(X, y))
+
+        cands = self._candidates()
+        scores = {i: [] for i in range(len(cands))}
+        alive = self._interleaved(cands)
+        started = time.monotonic()
+        fits = 0
+        planned = self._planned_fits(len(cands), n_splits)
+        if self.max_fits > 0:
+            planned = min(planned, max(self.max_fits, 1))
+        progress = {'round': 0, 'done': 0, 'total': planned}
+
+        for rnd, n_folds in enumerate(self._fold_schedule(n_splits)):
+            if rnd == 0:
+                # 首轮每组合 1 折：超出拟合次数预算时只评估预算内的组合（至少 1 组）
+                if self.max_fits > 0 and len(alive) > self.max_fits:
+                    print(f"[ModelSelector] 拟合次数预算 {self.max_fits} 小于候选数 {len(alive)}，首轮只评估其中 {self.max_fits} 组")
+                    alive = alive[:max(1, self.max_fits)]
+            tasks = [
+                (i, cands[i][0], cands[i][1], fold)
+                for i in alive
+                for fold in range(len(scores[i]), n_folds)
+            ]
+            if rnd > 0:
+                if self.max_fits > 0 and fits + len(tasks) > self.max_fits:
+                    print(f"[ModelSelector] 已达拟合次数预算 {self.max_fits}，停止于第 {rnd} 轮")
+                    break
+                if self.time_budget > 0 and time.monotonic() - started > self.time_budget:
+                    print(f"[ModelSelector] 已达时间预算 {self.time_budget}s，停止于第 {rnd} 轮")
+                    break
+            progress['round'] = rnd + 1
+            for (i, _, _, _), score in zip(tasks, self._run_tasks(tasks, X, y, folds, progress)):
+                scores[i].append(score)
+            fits += len(tasks)
+            if n_folds >= n_splits:
+                break
+            # 保留得分前 1/eta 的组合进入下一轮
+            keep = max(1, int(math.ceil(len(alive) / self.eta)))
+            alive = sorted(alive, key=lambda i: self._rank_score(scores[i]), reverse=True)[:keep]
+
+        # 各模型的对比结果：取评估最充分、得分最高的组合
         results = {}
-        
-        for name, config in self.models.items():
-            model = config['model']
-            # 使用交叉验证评估模型
-            cv_scores = cross_val_score(model, X, y, cv=5, scoring='r2', n_jobs=1)  # 设置 n_jobs=1 避免并行处理问题
-            mean_score = np.mean(cv_scores)
+        for name in self.models:
+            idxs = [i for i, (n, _) in enumerate(cands) if n == name and scores[i]]
+            if not idxs:
+                continue
+            top = max(idxs, key=lambda i: (len(scores[i]), self._rank_score(scores[i])))
             results[name] = {
-                'cv_mean': float(mean_score),
-                'cv_std': float(np.std(cv_scores))
+                'cv_mean': self._nan_stat(np.nanmean, scores[top]),
+                'cv_std': self._nan_stat(np.nanstd, scores[top]),
+                'n_folds': len(scores[top]),
+                'n_candidates': len(idxs),
+                'is_best': False,
             }
-            
-            # 如果有超参数需要调整
-            if config['params']:
-                best_params_model = {}
-                best_score_model = float('-inf')
-                
-                # 手动网格搜索
-                for param_name, param_values in config['params'].items():
-                    for value in param_values:
-                        setattr(model, param_name, value)
-                        score = np.mean(cross_val_score(model, X, y, cv=5, scoring='r2', n_jobs=1))
-                        
-                        if score > best_score_model:
-                            best_score_model = score
-                            best_params_model = {param_name: value}
-                
-                # 使用最佳参数设置模型
-                for param_name, value in best_params_model.items():
-                    setattr(model, param_name, value)
-                mean_score = best_score_model
-                
-            if mean_score > best_score:
-                best_score = mean_score
-                best_model = model
-                best_model.fit(X, y)  # 使用最佳参数训练模型
-        
+
+        best_model = None
+        best_params = {}
+        if alive:
+            winner = max(alive, key=lambda i: (len(scores[i]), self._rank_score(scores[i])))
+            name, params = cands[winner]
+            if name in results:
+                results[name]['is_best'] = True
+            best_model = clone(self.models[name]['model']).set_params(**params)
+            best_model.fit(X, y)
+            best_params = dict(params)
+        print(f"[ModelSelector] 搜索完成：{len(cands)} 组候选，{fits} 次拟合，用时 {time.monotonic() - started:.2f}s")
         return best_model, results, best_params
 
     def get_feature_importance(self, model, feature_names):
@@ -9,96 +9,234 @@
 注意：
 - 返回处理后的 DataFrame 与编码器字典（便于后续反编码）
 - 不进行归一化/标准化，避免影响模型可解释性；如需可在此处扩展
+- Preprocessor 为可复用的 fit/transform 对象：fit 时对数值列整体一次性计算统计量
+  （均值/中位数/分位数/标准差），可随模型一起 pickle 保存；
+  transform 复用训练时的统计量，对单条新记录做与训练一致的处理，开销与行数成正比
 """
 
 # flask_backend/services/preprocessing.py
+from typing import Dict, List
+
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import LabelEncoder
 from pandas.api.types import is_datetime64_any_dtype
 
-def preprocess_df(df: pd.DataFrame, missing_strategy: str = 'mean', outlier_strategy: str = 'iqr'):
-    """对输入数据进行通用预处理。
+_EPOCH = pd.Timestamp('1970-01-01')
 
-    参数：
-    - df: 原始数据
-    - missing_strategy: 数值缺失填充策略（mean/median）
-    - outlier_strategy: 异常值处理策略（iqr/z-score）
+
+def _is_text(s: pd.Series) -> bool:
+    # 与 select_dtypes(include=['object']) 的选择范围一致（pandas 3 中包含 str 类型）
+    return s.dtype == object or isinstance(s.dtype, pd.StringDtype)
+
+
+class Preprocessor:
+    """可序列化的预处理器。
+
+    fit_transform 的结果与原 preprocess_df 完全一致：
+    去重 -> 时间列数值化 -> 数值列转 float64 -> 缺失填充 -> 异常值替换 -> 字符串标签编码。
+    各步骤的统计量在 fit 时记录，transform 只做查表/向量化替换，不再重新统计。
     """
-    df = df.drop_duplicates()
-
-    # -------- 1) 处理时间列并统一数值列为 float（最关键） --------
-    # 1.1 将 datetime 列转换为数值（以“自1970-01-01起的天数”为单位），便于模型训练
-    dt_cols = []
-    for c in df.columns:
-        try:
-            if is_datetime64_any_dtype(df[c]):
-                dt_cols.append(c)
-            # 某些场景列类型是 object 但实际是日期字符串，这里不强转，交由后续 LabelEncoder/保留；
-            # 只对已是 datetime64 的列做数值化，避免误伤纯文本。
-        except Exception:
-            continue
-    for c in dt_cols:
-        try:
-            # 转换为天为单位的浮点数（NaT -> NaN）
-            base = pd.Timestamp('1970-01-01')
-            df[c] = ((df[c] - base) / pd.Timedelta(days=1)).astype('float64')
-        except Exception:
-            # 若异常，回退为字符串再做标签编码阶段处理
-            df[c] = df[c].astype(str)
-
-    # 1.2 统一数值列类型为 float64
-    numeric_cols = df.select_dtypes(include=['int64','float64']).columns.tolist()
-    df[numeric_cols] = df[numeric_cols].astype('float64')
-    # 将时间列纳入数值列集合，方便后续缺失/异常处理
-    for c in dt_cols:
-        if c not in numeric_cols and c in df.columns and df[c].dtype.kind in ('i', 'u', 'f'):
-            numeric_cols = list(numeric_cols) + [c]
-
-    # -------- 2) 缺失值填充 --------
-    for col in df.columns:
-        if col in numeric_cols:
-            if missing_strategy == 'median':
-                df[col] = df[col].fillna(df[col].median())
-            else:  # default mean
-                df[col] = df[col].fillna(df[col].mean())
+
+    def __init__(self, missing_strategy: str = 'mean', outlier_strategy: str = 'iqr') -> None:
+        self.missing_strategy = missing_strategy
+        self.outlier_strategy = outlier_strategy
+        self.dt_cols: List[str] = []
+        self.numeric_cols: List[str] = []
+        self.numeric_fill: Dict[str, float] = {}
+        self.other_fill: Dict[str, object] = {}
+        # 异常值规则：iqr -> (下界, 上界, 替换值)；z-score -> (均值, 标准差, 替换值)
+        self.outlier_rules: Dict[str, tuple] = {}
+        self.encoders: Dict[str, LabelEncoder] = {}
+        # 列 -> {类别: 编码}，fit 时由 encoders 生成一次，transform 直接查表
+        self.encoder_maps: Dict[str, Dict[object, int]] = {}
+        self.fitted = False
+
+    # ---- 1) 时间列与数值列 ----
+    def _coerce_types(self, df: pd.DataFrame, fitting: bool) -> pd.DataFrame:
+        if fitting:
+            dt_cols = []
+            for c in df.columns:
+                try:
+                    if is_datetime64_any_dtype(df[c]):
+                        dt_cols.append(c)
+                    # 某些场景列类型是 object 但实际是日期字符串，这里不强转，交由后续 LabelEncoder/保留；
+                    # 只对已是 datetime64 的列做数值化，避免误伤纯文本。
+                except Exception:
+                    continue
+            self.dt_cols = dt_cols
+        for c in self.dt_cols:
+            if c not in df.columns:
+                continue
+            try:
+                col = df[c]
+                if not fitting and not is_datetime64_any_dtype(col):
+                    col = pd.to_datetime(col, errors='coerce')
+                # 转换为天为单位的浮点数（NaT -> NaN）
+                df[c] = ((col - _EPOCH) / pd.Timedelta(days=1)).astype('float64')
+            except Exception:
+                # 若异常，回退为字符串再做标签编码阶段处理
+                df[c] = df[c].astype(str)
+
+        if fitting:
+            numeric_cols = df.select_dtypes(include=['int64', 'float64']).columns.tolist()
+            # 将时间列纳入数值列集合，方便后续缺失/异常处理
+            for c in self.dt_cols:
+                if c not in numeric_cols and c in df.columns and df[c].dtype.kind in ('i', 'u', 'f'):
+                    numeric_cols.append(c)
+            self.numeric_cols = numeric_cols
+            if numeric_cols:
+                df[numeric_cols] = df[numeric_cols].astype('float64')
         else:
-            mode_vals = df[col].mode()
-            if not mode_vals.empty:
-                df[col] = df[col].fillna(mode_vals.iloc[0])
-            else:
-                df[col] = df[col].fillna('')
+            # 新数据的类型可能与训练时不同（如字符串数字），按训练时的数值列强制转换
+            for c in self.numeric_cols:
+                if c in df.columns and df[c].dtype != 'float64':
+                    df[c] = pd.to_numeric(df[c], errors='coerce').astype('float64')
+        return df
+
+    # ---- 2) 缺失值填充 ----
+    def _fit_fill(self, df: pd.DataFrame) -> None:
+        nums = [c for c in self.numeric_cols if c in df.columns]
+        if nums:
+            block = df[nums]
+            stats = block.median() if self.missing_strategy == 'median' else block.mean()
+            self.numeric_fill = {c: float(v) for c, v in stats.items() if pd.notna(v)}
+        else:
+            self.numeric_fill = {}
+        numeric = set(self.numeric_cols)
+        others = [c for c in df.columns if c not in numeric]
+        self.other_fill = {}
+        if others:
+            # 一次计算所有非数值列的众数：第一行即各列众数，整列为空的列为 NaN，回退为空串
+            modes = df[others].mode(dropna=True)
+            first = modes.iloc[0] if len(modes) else pd.Series(index=others, dtype=object)
+            self.other_fill = {c: (first[c] if pd.notna(first[c]) else '') for c in others}
 
-    # -------- 3) 异常值处理 --------
-    for c in numeric_cols:
-        col_series = df[c]
-        if col_series.notna().sum() < 3:
-            continue   # 数据太少跳过
+    def _apply_fill(self, df: pd.DataFrame) -> pd.DataFrame:
+        fills = {c: v for c, v in self.numeric_fill.items() if c in df.columns}
+        fills.update({c: v for c, v in self.other_fill.items() if c in df.columns})
+        if fills:
+            df = df.fillna(fills)
+        return df
 
-        if outlier_strategy == 'iqr':
-            q1, q3 = col_series.quantile([0.25, 0.75])
+    # ---- 3) 异常值处理 ----
+    def _fit_outliers(self, df: pd.DataFrame) -> None:
+        self.outlier_rules = {}
+        nums = [c for c in self.numeric_cols if c in df.columns]
+        if not nums:
+            return
+        block = df[nums]
+        counts = block.notna().sum()
+        # 数据太少的列跳过
+        nums = [c for c in nums if counts[c] >= 3]
+        if not nums:
+            return
+        block = block[nums]
+        means = block.mean()
+        if self.outlier_strategy == 'iqr':
+            # 对整个数值块一次性计算上下四分位数
+            q = block.quantile([0.25, 0.75])
+            q1, q3 = q.iloc[0], q.iloc[1]
             iqr = q3 - q1
             lower = q1 - 1.5 * iqr
             upper = q3 + 1.5 * iqr
-            mean_val = col_series.mean()
-            df.loc[(col_series < lower) | (col_series > upper), c] = mean_val
-
+            for c in nums:
+                self.outlier_rules[c] = (float(lower[c]), float(upper[c]), float(means[c]))
         else:  # default z-score
-            std = col_series.std()
-            if std and not np.isnan(std) and std != 0:
-                z = np.abs((col_series - col_series.mean()) / std)
-                mean_val = col_series.mean()
-                df.loc[z > 3, c] = mean_val
-
-    # -------- 4) 字符串编码 --------
-    encoders = {}
-    obj_cols = df.select_dtypes(include=['object']).columns
-    for c in obj_cols:
-        le = LabelEncoder()
-        try:
-            df[c] = le.fit_transform(df[c])
-            encoders[c] = le
-        except:
-            pass
-
-    return df, encoders
+            stds = block.std()
+            for c in nums:
+                std = stds[c]
+                if std and not np.isnan(std) and std != 0:
+                    self.outlier_rules[c] = (float(means[c]), float(std), float(means[c]))
+
+    def _apply_outliers(self, df: pd.DataFrame) -> pd.DataFrame:
+        cols = [c for c in self.outlier_rules if c in df.columns]
+        if not cols:
+            return df
+        rules = np.array([self.outlier_rules[c] for c in cols], dtype='float64')
+        vals = df[cols].to_numpy(dtype='float64', copy=True)
+        with np.errstate(invalid='ignore'):
+            if self.outlier_strategy == 'iqr':
+                mask = (vals < rules[:, 0]) | (vals > rules[:, 1])
+            else:
+                mask = np.abs((vals - rules[:, 0]) / rules[:, 1]) > 3
+        if mask.any():
+            vals = np.where(mask, rules[:, 2], vals)
+            df[cols] = pd.DataFrame(vals, index=df.index, columns=cols)
+        return df
+
+    # ---- 4) 字符串编码 ----
+    def _fit_encoders(self, df: pd.DataFrame) -> pd.DataFrame:
+        self.encoders = {}
+        for c in df.columns:
+            if not _is_text(df[c]):
+                continue
+            le = LabelEncoder()
+            try:
+                df[c] = le.fit_transform(df[c])
+                self.encoders[c] = le
+            except Exception:
+                pass
+        self.encoder_maps = self._build_encoder_maps()
+        return df
+
+    def _build_encoder_maps(self) -> Dict[str, Dict[object, int]]:
+        return {c: {v: i for i, v in enumerate(le.classes_)} for c, le in self.encoders.items()}
+
+    def _apply_encoders(self, df: pd.DataFrame) -> pd.DataFrame:
+        maps = getattr(self, 'encoder_maps', None)
+        if maps is None:
+            # 旧版本 pickle 的预处理器没有该属性：补建一次并保存在实例上
+            maps = self.encoder_maps = self._build_encoder_maps()
+        for c, mapping in maps.items():
+            if c not in df.columns:
+                continue
+            # 训练时未出现过的类别编码为 -1
+            df[c] = df[c].map(mapping).fillna(-1).astype('int64')
+        return df
+
+    # ---- 对外接口 ----
+    def fit_transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """在 df 上拟合并返回处理结果（会先去重）。"""
+        df = df.drop_duplicates()
+        df = self._coerce_types(df, fitting=True)
+        self._fit_fill(df)
+        df = self._apply_fill(df)
+        # 与原实现一致：异常值统计基于填充后的数据
+        self._fit_outliers(df)
+        df = self._apply_outliers(df)
+        df = self._fit_encoders(df)
+        self.fitted = True
+        return df
+
+    def fit(self, df: pd.DataFrame) -> 'Preprocessor':
+        self.fit_transform(df)
+        return self
+
+    def transform(self, df: pd.DataFrame) -> pd.DataFrame:
+        """用训练时的统计量处理新数据（不去重，行数与输入一致）。"""
+        if not self.fitted:
+            raise ValueError('Preprocessor 尚未拟合')
+        df = df.copy()
+        df = self._coerce_types(df, fitting=False)
+        df = self._apply_fill(df)
+        df = self._apply_outliers(df)
+        df = self._apply_encoders(df)
+        return df
+
+
+def preprocess_df(df: pd.DataFrame, missing_strategy: str = 'mean', outlier_strategy: str = 'iqr',
+                  return_preprocessor: bool = False):
+    """对输入数据进行通用预处理。
+
+    参数：
+    - df: 原始数据
+    - missing_strategy: 数值缺失填充策略（mean/median）
+    - outlier_strategy: 异常值处理策略（iqr/z-score）
+    - return_preprocessor: 为 True 时额外返回拟合好的 Preprocessor，供推理阶段复用
+    """
+    pre = Preprocessor(missing_strategy, outlier_strategy)
+    out = pre.fit_transform(df)
+    if return_preprocessor:
+        return out, pre.encoders, pre
+    return out, pre.encoders
@@ -0,0 +1,123 @@
+"""
+DataFrame 的 JSON 序列化
+
+职责：
+- 按列一次性把 DataFrame 转成可直接 jsonify 的 Python 值（日期格式化、NaN -> null、numpy 标量 -> 原生类型）
+- 行格式（list[dict]）与列格式（{"columns": [...], "data": [[第1列...], [第2列...]]}）两种输出
+
+注意：
+- table_page_records() 与 /table-data 原逐单元格清洗循环的输出逐值一致（数值列缺失填 0 后转为字符串、
+  文本列缺失为空串、日期为 YYYY-MM-DD），保证前端既有页面不受影响
+- frame_to_columns() / frame_to_records() 输出带类型的值：数值保持为数字，缺失为 null
+- 仅 object 列需要逐元素判断类型，其余列均按列整体转换
+"""
+
+from __future__ import annotations
+import math
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype, is_float_dtype, is_string_dtype
+)
+
+
+def to_python(v: Any) -> Any:
+    """单个值转为可 JSON 序列化的原生类型：numpy 标量 -> int/float，ndarray -> list，NaN/NaT -> None。"""
+    try:
+        if v is None:
+            return None
+        if isinstance(v, np.ndarray):
+            return v.tolist()
+        if isinstance(v, (np.bool_, bool)):
+            return bool(v)
+        if isinstance(v, np.integer):
+            return int(v)
+        if isinstance(v, (np.floating, float)):
+            f = float(v)
+            return None if math.isnan(f) or math.isinf(f) else f
+        if isinstance(v, Decimal):
+            return float(v)
+        if isinstance(v, (pd.Timestamp, datetime, date)):
+            return None if pd.isna(v) else str(v)
+        if v is pd.NaT or (not isinstance(v, (str, bytes, list, dict, tuple)) and pd.isna(v)):
+            return None
+        return v
+    except Exception:
+        return v
+
+
+def _column_values(s: pd.Series, date_format: str) -> List[Any]:
+    """带类型的整列转换（列格式 / 行格式共用）。"""
+    if is_datetime64_any_dtype(s):
+        out = s.dt.strftime(date_format)
+        return out.astype(object).where(s.notna(), None).tolist()
+    if is_bool_dtype(s) and not s.isna().any():
+        return s.astype(bool).tolist()
+    if is_numeric_dtype(s):
+        mask = s.isna().to_numpy()
+        if is_float_dtype(s):
+            arr = s.to_numpy(dtype='float64', na_value=np.nan)
+            mask = mask | np.isinf(arr)
+            values = arr.tolist()
+        else:
+            values = s.astype(object).tolist() if mask.any() else s.to_numpy().tolist()
+        if mask.any():
+            for i in np.flatnonzero(mask):
+                values[i] = None
+        return values
+    if is_string_dtype(s) and s.dtype != object:
+        return s.astype(object).where(s.notna(), None).tolist()
+    return [to_python(v) for v in s.tolist()]
+
+
+def frame_to_columns(df: pd.DataFrame, date_format: str = '%Y-%m-%d') -> Dict[str, Any]:
+    """列格式：{"columns": [...], "data": [[第1列的值...], [第2列的值...], ...]}。"""
+    return {
+        'columns': [str(c) for c in df.columns],
+        'data': [_column_values(df.iloc[:, i], date_format) for i in range(df.shape[1])],
+    }
+
+
+def frame_to_records(df: pd.DataFrame, date_format: str = '%Y-%m-%d') -> List[Dict[str, Any]]:
+    """行格式（list[dict]），值为带类型的原生 Python 值。"""
+    cols = [str(c) for c in df.columns]
+    values = [_column_values(df.iloc[:, i], date_format) for i in range(df.shape[1])]
+    return [dict(zip(cols, row)) for row in zip(*values)]
+
+
+def _legacy_cell(value: Any) -> Any:
+    # 与 /table-data 原逐单元格清洗逻辑一致（object 列）
+    if value is None or pd.isna(value):
+        return None
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return str(value)[:10]
+    if isinstance(value, (np.integer, np.floating)):
+        return float(value)
+    if hasattr(value, 'date'):
+        return str(value)
+    return str(value) if value != 'nan' else None
+
+
+def _legacy_column_values(s: pd.Series) -> List[Any]:
+    if is_datetime64_any_dtype(s):
+        out = s.dt.strftime('%Y-%m-%d')
+        return out.astype(object).where(s.notna(), None).tolist()
+    if is_numeric_dtype(s):
+        s = s.fillna(0)
+        if s.dtype == 'float32':
+            s = s.astype('float64')
+        return list(map(str, s.tolist()))
+    if is_string_dtype(s) and s.dtype != object:
+        return [None if v == 'nan' else v for v in s.fillna('').tolist()]
+    return [_legacy_cell(v) for v in s.fillna('').tolist()]
+
+
+def table_page_records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    """/table-data 默认的行格式输出（兼容原有取值规则），按列整体转换后再拼装为行。"""
+    cols = list(df.columns)
+    values = [_legacy_column_values(df.iloc[:, i]) for i in range(df.shape[1])]
+    return [dict(zip(cols, row)) for row in zip(*values)]
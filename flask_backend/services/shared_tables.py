@@ -0,0 +1,243 @@
+"""
+跨进程共享的表数据缓存
+
+职责：
+- gunicorn 多 worker 部署时，同一台机器上的所有 worker 共享一份表数据，而不是每个 worker 各自加载一份
+- 每张表发布为一个不可变的 Arrow IPC 文件（write_arrow_file：单批次、无压缩），各 worker 内存映射读取，
+  数值列与字符串列直接引用映射页，多个进程读到的是同一份物理内存（操作系统页缓存）
+- 小型版本登记表 registry.json 记录 表名 -> {generation, file, rows}，读写都在文件锁（fcntl.flock）内完成
+- 每个 worker 记录自己映射的是哪一代数据；请求时比对登记表中的代数（registry.json 未变化时只做一次 stat），
+  其它 worker 失效/重新发布后本 worker 自动丢弃本地缓存并重新映射
+- 每张表一个加载锁文件：多个 worker 同时未命中时只有一个执行 SELECT * / CSV 解析，其余等待后直接映射其结果
+
+注意：
+- 通过环境变量 TABLE_CACHE_BACKEND=shared 开启（默认 local，即各进程独立缓存）；目录 SHARED_TABLE_DIR
+  （默认 flask_backend/cache/shared），需为同一台机器上所有 worker 可写的本地目录
+- 依赖 pyarrow 与 fcntl（Linux/macOS）；缺少任一时打印警告并退回进程内缓存
+- 映射得到的列为只读数组；pandas Copy-on-Write 下修改会先复制被改动的列，不会影响其它 worker
+- 文件发布后不再改写；失效或重新发布时旧文件被删除，已映射它的 worker 在重新映射前仍可安全读取（Linux 语义）
+- 发布时若登记表中的代数已不同于加载开始时（期间被其它 worker 失效或发布），放弃本次发布
+- 预处理结果、学号索引等派生数据仍由各 worker 的 TableCache 在本地维护
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import pandas as pd
+
+from services.table_snapshots import HAS_ARROW, write_arrow_file, read_arrow_file
+
+try:
+    import fcntl
+except Exception:  # pragma: no cover - Windows
+    fcntl = None
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+class SharedTableStore:
+    _instance_lock = threading.Lock()
+    _instance: Optional['SharedTableStore'] = None
+
+    def __init__(self, root: Optional[str] = None, enabled: Optional[bool] = None) -> None:
+        if enabled is None:
+            enabled = (os.getenv('TABLE_CACHE_BACKEND') or 'local').strip().lower() == 'shared'
+        self.root = Path(root or os.getenv('SHARED_TABLE_DIR') or _BACKEND_DIR / 'cache' / 'shared')
+        if enabled and (not HAS_ARROW or fcntl is None):
+            print("[SharedTables] 共享缓存需要 pyarrow 与 fcntl，当前环境缺少，已退回进程内缓存")
+            enabled = False
+        if enabled:
+            try:
+                (self.root / 'locks').mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                print(f"[SharedTables] 无法创建共享缓存目录 {self.root}，已退回进程内缓存: {e}")
+                enabled = False
+        self.enabled = bool(enabled)
+        self._registry_path = self.root / 'registry.json'
+        self._lock = threading.Lock()
+        # 登记表的进程内副本：((registry.json 的 inode, mtime_ns, size), 内容)
+        self._registry_cache = (None, {})
+        # 本 worker 当前映射的数据代数：表名 -> generation
+        self._local: Dict[str, int] = {}
+        self._stats = {'maps': 0, 'publishes': 0, 'publish_skipped': 0, 'invalidations': 0,
+                       'stale_local': 0, 'lock_waits': 0}
+
+    @classmethod
+    def instance(cls) -> 'SharedTableStore':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = SharedTableStore()
+            return cls._instance
+
+    def _count(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self._stats[key] += delta
+
+    # ---- 文件锁与登记表 ----
+    @contextmanager
+    def _flock(self, path: Path):
+        with open(path, 'a+') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _registry(self) -> Dict[str, Any]:
+        """读取登记表；文件未变化（mtime/size 相同）时直接用进程内副本。"""
+        try:
+            st = os.stat(self._registry_path)
+        except OSError:
+            return {}
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached_key, data = self._registry_cache
+            if cached_key == key:
+                return data
+        try:
+            with open(self._registry_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            return {}
+        with self._lock:
+            self._registry_cache = (key, data)
+        return data
+
+    def _write_registry(self, data: Dict[str, Any]) -> None:
+        # 调用方已持有登记表文件锁
+        tmp = self._registry_path.with_name(f'registry.{os.getpid()}.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self._registry_path)
+
+    @contextmanager
+    def _registry_update(self):
+        """在登记表文件锁内读取最新内容并交给调用方修改，退出时写回。"""
+        with self._flock(self.root / 'registry.lock'):
+            with self._lock:
+                self._registry_cache = (None, {})
+            data = dict(self._registry())
+            yield data
+            self._write_registry(data)
+
+    @staticmethod
+    def _safe(table: str) -> str:
+        safe = re.sub(r'[^0-9A-Za-z_\-]+', '_', str(table))[:60] or 'table'
+        return f"{safe}-{hashlib.sha1(str(table).encode('utf-8')).hexdigest()[:10]}"
+
+    def _unlink(self, name: Optional[str]) -> None:
+        if not name:
+            return
+        try:
+            (self.root / name).unlink(missing_ok=True)
+        except Exception as e:
+            print(f"[SharedTables] 删除共享数据文件 {name} 失败: {e}")
+
+    # ---- 对外接口 ----
+    def generation(self, table: str) -> int:
+        return int((self._registry().get(table) or {}).get('generation') or 0)
+
+    def is_current(self, table: str) -> bool:
+        """本 worker 缓存的该表数据是否仍是登记表中的最新一代（未映射过时视为是，由正常加载流程处理）。"""
+        with self._lock:
+            local = self._local.get(table)
+        if local is None:
+            return True
+        if local == self.generation(table):
+            return True
+        with self._lock:
+            self._local.pop(table, None)
+            self._stats['stale_local'] += 1
+        return False
+
+    @contextmanager
+    def table_lock(self, table: str):
+        """跨进程的单表加载锁：同一张表同时只有一个 worker 从数据源加载。"""
+        path = self.root / 'locks' / f"{self._safe(table)}.lock"
+        started = time.perf_counter()
+        with self._flock(path):
+            if time.perf_counter() - started > 0.01:
+                self._count('lock_waits')
+            yield
+
+    def load(self, table: str) -> Optional[pd.DataFrame]:
+        """映射登记表中该表的最新数据；未发布或文件缺失时返回 None。"""
+        entry = self._registry().get(table) or {}
+        name = entry.get('file')
+        if not name:
+            return None
+        try:
+            df = read_arrow_file(self.root / name)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"[SharedTables] 映射表 {table} 的共享数据失败: {e}")
+            return None
+        with self._lock:
+            self._local[table] = int(entry.get('generation') or 0)
+            self._stats['maps'] += 1
+        return df
+
+    def publish(self, table: str, df: pd.DataFrame, based_on: Optional[int] = None) -> Optional[int]:
+        """把整表发布为新一代共享数据，返回新的代数；based_on 与当前代数不一致或写入失败时返回 None。"""
+        if df is None:
+            return None
+        name = f"{self._safe(table)}.{uuid.uuid4().hex[:12]}.arrow"
+        try:
+            # 数据文件在锁外写好，锁内只更新登记表
+            write_arrow_file(df, self.root / name)
+        except Exception as e:
+            print(f"[SharedTables] 写入表 {table} 的共享数据失败（仅使用本进程缓存）: {e}")
+            self._unlink(name)
+            return None
+        old = None
+        with self._registry_update() as reg:
+            entry = reg.get(table) or {}
+            current = int(entry.get('generation') or 0)
+            if based_on is not None and current != based_on:
+                self._count('publish_skipped')
+                self._unlink(name)
+                return None
+            old = entry.get('file')
+            reg[table] = {'generation': current + 1, 'file': name, 'rows': int(len(df)), 'published_at': time.time()}
+        self._unlink(old)
+        with self._lock:
+            self._local[table] = current + 1
+            self._stats['publishes'] += 1
+        return current + 1
+
+    def invalidate(self, table: str) -> None:
+        """递增该表的代数并撤下共享数据；所有 worker 在下次访问时丢弃本地缓存。"""
+        with self._registry_update() as reg:
+            entry = reg.get(table) or {}
+            old = entry.get('file')
+            reg[table] = {'generation': int(entry.get('generation') or 0) + 1, 'file': None}
+        self._unlink(old)
+        with self._lock:
+            self._local.pop(table, None)
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['mapped'] = dict(self._local)
+        out['enabled'] = self.enabled
+        out['pid'] = os.getpid()
+        if self.enabled:
+            reg = self._registry()
+            out['tables'] = {t: {'generation': e.get('generation'), 'rows': e.get('rows'), 'published': bool(e.get('file'))}
+                             for t, e in reg.items()}
+            try:
+                out['bytes'] = sum(p.stat().st_size for p in self.root.glob('*.arrow'))
+            except Exception:
+                out['bytes'] = None
+        return out
@@ -0,0 +1,81 @@
+"""
+单飞（single-flight）加载
+
+职责：
+- 同一个键同时只执行一次加载：第一个调用者执行，其余并发调用者等待并共享其结果（或异常）
+- 用于表数据缓存未命中：仪表盘首次打开时 /statistics、/correlation、/radar-data 等并行请求
+  同时读取同一张表，只发出一次 SELECT * / CSV 解析
+- 统计执行次数与被合并（等待共享结果）的次数，按键细分
+
+注意：
+- 加载完成后立即移除该键，之后的调用者重新走缓存；结果本身不在这里保存
+- 加载函数抛出的异常会原样抛给所有等待者
+- 键可以是 (名称, 版本) 元组：不同版本互不合并，统计按名称汇总
+"""
+
+from __future__ import annotations
+import threading
+from typing import Optional, Dict, Any, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._stats = {'loads': 0, 'coalesced': 0, 'max_waiters': 0}
+        self._key_stats: Dict[str, Dict[str, int]] = {}
+
+    def _key_stat(self, key: Hashable) -> Dict[str, int]:
+        name = str(key[0] if isinstance(key, tuple) and key else key)
+        st = self._key_stats.get(name)
+        if st is None:
+            st = self._key_stats[name] = {'loads': 0, 'coalesced': 0}
+        return st
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """执行 fn(*args, **kwargs)；同一 key 已有进行中的调用时等待并返回其结果。"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['coalesced'] += 1
+                self._stats['max_waiters'] = max(self._stats['max_waiters'], call.waiters)
+                self._key_stat(key)['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['loads'] += 1
+                self._key_stat(key)['loads'] += 1
+                leader = True
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['in_flight'] = sorted(str(k[0] if isinstance(k, tuple) and k else k) for k in self._calls)
+            out['keys'] = {k: dict(v) for k, v in self._key_stats.items()}
+            return out
@@ -0,0 +1,431 @@
+"""
+表数据缓存
+
+职责：
+- 按表名缓存 DataFrame（原始数据 + 可选的预处理结果）
+- 以字节预算为上限做 LRU 淘汰，占用按 DataFrame.memory_usage(deep=True) 计算
+- 记录每张表的命中/未命中/淘汰次数，便于观察缓存效果
+
+注意：
+- 预算通过环境变量 TABLE_CACHE_MAX_MB 配置（默认 512MB，<=0 表示不缓存）
+- 单表超过预算时不进入缓存（直接返回给调用方），避免把其它表全部挤出
+- 失效（invalidate）由 mark_table_dirty / 增删改接口触发：移除条目并递增该表的代数（generation），O(1)；
+  加载前记录代数，put(generation=...) 时代数已变（加载期间被失效）则拒绝写入，避免旧数据在失效后重新进入缓存
+- put_processed(based_on=...) 只在预处理所用的数据与当前缓存条目为同一版本时挂上结果
+- 命中时通过 share_frame() 返回共享底层数据的视图（依赖 pandas Copy-on-Write），
+  调用方修改视图只会复制被改动的列，不会污染缓存；需要独立副本时显式深拷贝
+- 入缓存时为 student_id 建立 学号 -> 行位置 的哈希索引，随表一起失效；
+  lookup_rows() 通过 DataFrame.attrs 中的标记确认传入的是该缓存的视图后才使用索引
+- fingerprint() 为缓存视图返回内容指纹：每个 (表, 版本, raw|processed) 只计算一次并挂在条目上，
+  之后同一版本的请求直接复用，无需再逐行哈希整表
+- apply_delta() 把采集器拉取的增量行追加/按键覆盖到已缓存的原始数据上，生成新版本：
+  纯追加时学号索引增量扩展，有覆盖时重建；预处理结果依赖整列统计量（均值填充、IQR 等），随之丢弃按需重算
+"""
+
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+import numpy as np
+import pandas as pd
+
+# 建立哈希索引的键列
+INDEX_COLUMN = 'student_id'
+# 写入 DataFrame.attrs 的缓存标记键：(表名, 版本号, 'raw'|'processed')
+_ATTR_KEY = 'table_cache'
+
+
+def _enable_copy_on_write() -> bool:
+    """pandas 3 起 Copy-on-Write 恒为开启；pandas 2.x 需显式打开。返回 CoW 是否生效。"""
+    try:
+        major = int(str(pd.__version__).split('.')[0])
+    except Exception:
+        major = 0
+    if major >= 3:
+        return True
+    try:
+        pd.set_option('mode.copy_on_write', True)
+        return pd.get_option('mode.copy_on_write') is True
+    except Exception:
+        return False
+
+
+COPY_ON_WRITE = _enable_copy_on_write()
+
+
+def share_frame(df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """返回可安全交给调用方的缓存数据。
+
+    CoW 生效时为浅拷贝（O(列数)，不复制数据）；否则退化为深拷贝以保证缓存不被改写。
+    """
+    if df is None:
+        return None
+    return df.copy(deep=not COPY_ON_WRITE)
+
+
+def _frame_nbytes(df: Optional[pd.DataFrame]) -> int:
+    if df is None:
+        return 0
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except Exception:
+        return 0
+
+
+def _build_key_index(df: pd.DataFrame, column: str = INDEX_COLUMN) -> Optional[Dict[str, np.ndarray]]:
+    """按 column 的字符串形式分组，得到 键 -> 行位置数组（与 astype(str) == str(x) 的比较语义一致）。"""
+    if df is None or column not in df.columns:
+        return None
+    try:
+        keys = df[column].astype(str)
+        return {str(k): v for k, v in keys.groupby(keys, sort=False).indices.items()}
+    except Exception as e:
+        print(f"[TableCache] 构建 {column} 索引失败: {e}")
+        return None
+
+
+class _Entry:
+    __slots__ = ('raw', 'processed', 'nbytes', 'version', 'raw_index', 'processed_index', 'fingerprints')
+
+    def __init__(self, raw: pd.DataFrame, version: int, raw_index=False):
+        self.raw = raw
+        self.processed: Optional[pd.DataFrame] = None
+        self.nbytes = _frame_nbytes(raw)
+        self.version = version
+        # raw_index 为 False 时现场构建；apply_delta 传入增量维护好的索引（可为 None）
+        self.raw_index = _build_key_index(raw) if raw_index is False else raw_index
+        self.processed_index = None
+        # 'raw'/'processed' -> 内容指纹（按需计算）
+        self.fingerprints: Dict[str, str] = {}
+
+    def frame(self) -> pd.DataFrame:
+        # 与原单槽缓存一致：若已做过预处理，优先返回预处理结果
+        return self.processed if self.processed is not None else self.raw
+
+
+class TableCache:
+    _instance_lock = threading.Lock()
+    _instance: Optional['TableCache'] = None
+
+    def __init__(self, max_bytes: Optional[int] = None) -> None:
+        if max_bytes is None:
+            try:
+                max_bytes = int(float(os.getenv('TABLE_CACHE_MAX_MB', '512')) * 1024 * 1024)
+            except Exception:
+                max_bytes = 512 * 1024 * 1024
+        self.max_bytes = max(0, int(max_bytes))
+        self._lock = threading.RLock()
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._bytes = 0
+        self._version = 0
+        self._generations: Dict[str, int] = {}
+        # clear() 的次数，计入每张表的代数（整体清空同样使进行中的加载失效）
+        self._clears = 0
+        self._table_stats: Dict[str, Dict[str, int]] = {}
+
+    @classmethod
+    def instance(cls) -> 'TableCache':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TableCache()
+            return cls._instance
+
+    # ---- 内部工具 ----
+    def _stat(self, table: str) -> Dict[str, int]:
+        st = self._table_stats.get(table)
+        if st is None:
+            st = {'hits': 0, 'misses': 0, 'loads': 0, 'evictions': 0, 'invalidations': 0, 'oversize': 0,
+                  'index_hits': 0, 'index_fallbacks': 0, 'deltas': 0, 'delta_rows': 0, 'stale_puts': 0,
+                  'fingerprint_hits': 0, 'fingerprint_computes': 0}
+            self._table_stats[table] = st
+        return st
+
+    def _drop(self, table: str) -> Optional[_Entry]:
+        entry = self._entries.pop(table, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+        return entry
+
+    def _evict_until_fits(self, incoming: int, keep: Optional[str] = None) -> None:
+        # 从最久未使用的一端开始淘汰，直到新数据能放下
+        while self._entries and self._bytes + incoming > self.max_bytes:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(oldest)
+                continue
+            self._drop(oldest)
+            self._stat(oldest)['evictions'] += 1
+
+    # ---- 对外接口 ----
+    def get(self, table: str) -> Optional[pd.DataFrame]:
+        """命中则返回缓存的 DataFrame（预处理结果优先）并刷新 LRU 位置；未命中返回 None。"""
+        with self._lock:
+            entry = self._entries.get(table)
+            st = self._stat(table)
+            if entry is None:
+                st['misses'] += 1
+                return None
+            self._entries.move_to_end(table)
+            st['hits'] += 1
+            return entry.frame()
+
+    def contains(self, table: str) -> bool:
+        with self._lock:
+            return table in self._entries
+
+    def generation(self, table: str) -> int:
+        """该表的失效代数；加载前读取并传给 put()，用于识别加载期间发生的失效。"""
+        with self._lock:
+            return self._generations.get(table, 0) + self._clears
+
+    def put(self, table: str, df: pd.DataFrame, generation: Optional[int] = None) -> bool:
+        """写入原始数据（会丢弃该表已有的预处理结果）。返回是否成功进入缓存。
+
+        generation 为加载开始时的 generation(table)；其间表被失效过则不写入。
+        """
+        if df is None:
+            return False
+        with self._lock:
+            self._version += 1
+            version = self._version
+        # 索引与内存统计在锁外构建，避免阻塞其它表的读取
+        entry = _Entry(df, version)
+        df.attrs[_ATTR_KEY] = (table, version, 'raw')
+        with self._lock:
+            st = self._stat(table)
+            if generation is not None and self._generations.get(table, 0) + self._clears != generation:
+                st['stale_puts'] += 1
+                return False
+            st['loads'] += 1
+            self._drop(table)
+            if entry.nbytes > self.max_bytes:
+                st['oversize'] += 1
+                return False
+            self._evict_until_fits(entry.nbytes)
+            self._entries[table] = entry
+            self._bytes += entry.nbytes
+            return True
+
+    def put_processed(self, table: str, df: pd.DataFrame, based_on: Optional[pd.DataFrame] = None) -> bool:
+        """为已缓存的表挂上预处理结果；若原始数据不在缓存中则不保存。
+
+        based_on 为预处理所用的 get_table_data 返回值：其缓存版本与当前条目不一致（期间被失效/重新加载）时不保存。
+        """
+        if df is None:
+            return False
+        try:
+            tag = based_on.attrs.get(_ATTR_KEY) if based_on is not None else None
+        except Exception:
+            tag = None
+        nbytes = _frame_nbytes(df)
+        index = _build_key_index(df)
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is None:
+                return False
+            if tag and (tag[0] != table or tag[1] != entry.version):
+                self._stat(table)['stale_puts'] += 1
+                return False
+            old_processed = _frame_nbytes(entry.processed)
+            new_total = entry.nbytes - old_processed + nbytes
+            if new_total > self.max_bytes:
+                self._stat(table)['oversize'] += 1
+                return False
+            self._bytes -= entry.nbytes
+            df.attrs[_ATTR_KEY] = (table, entry.version, 'processed')
+            entry.processed = df
+            entry.processed_index = index
+            entry.fingerprints.pop('processed', None)
+            entry.nbytes = new_total
+            self._evict_until_fits(entry.nbytes, keep=table)
+            self._bytes += entry.nbytes
+            self._entries.move_to_end(table)
+            return True
+
+    def apply_delta(self, table: str, delta: pd.DataFrame, key_column: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """把增量行并入已缓存的原始数据（key_column 给定时按键覆盖已有行，否则直接追加）。
+
+        返回 {'appended', 'replaced', 'rows', 'frame'}；表不在缓存中、增量带来了缓存中没有的非空列
+        或缺少缓存中的列（表结构变化）时返回 None，由调用方整表失效。被覆盖的行移到末尾。
+        """
+        if delta is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is None:
+                return None
+            raw, old_index = entry.raw, entry.raw_index
+        # 整表加载时去掉了整列为空的列：增量中这些列仍为空则忽略，否则无法对齐
+        extra = [c for c in delta.columns if c not in raw.columns]
+        if extra and bool(delta[extra].notna().any().any()):
+            return None
+        if any(c not in delta.columns for c in raw.columns):
+            return None
+        delta = delta[list(raw.columns)].reset_index(drop=True)
+        replaced = 0
+        base = raw
+        if key_column and key_column in raw.columns and len(raw) and len(delta):
+            delta_keys = delta[key_column].astype(str)
+            dup = delta_keys.duplicated(keep='last')
+            if dup.any():
+                delta = delta[~dup.to_numpy()].reset_index(drop=True)
+                delta_keys = delta_keys[~dup.to_numpy()]
+            hit = raw[key_column].astype(str).isin(delta_keys).to_numpy()
+            replaced = int(hit.sum())
+            if replaced:
+                base = raw[~hit]
+        if not len(delta):
+            new = raw
+        elif not len(base):
+            new = delta.copy()
+        else:
+            new = pd.concat([base, delta], ignore_index=True)
+        # 纯追加：只为新行计算索引位置，旧索引整体复用（复制字典，旧版本视图仍可安全使用旧索引）
+        if replaced == 0 and old_index is not None and INDEX_COLUMN in new.columns:
+            index = dict(old_index)
+            if len(delta):
+                keys = delta[INDEX_COLUMN].astype(str)
+                for k, pos in keys.groupby(keys, sort=False).indices.items():
+                    pos = pos + len(raw)
+                    prev = index.get(str(k))
+                    index[str(k)] = pos if prev is None else np.concatenate([prev, pos])
+        else:
+            index = _build_key_index(new)
+        with self._lock:
+            self._version += 1
+            version = self._version
+        fresh = _Entry(new, version, raw_index=index)
+        new.attrs[_ATTR_KEY] = (table, version, 'raw')
+        with self._lock:
+            if self._entries.get(table) is not entry:
+                # 计算期间该表被失效或重新加载，放弃本次增量
+                return None
+            st = self._stat(table)
+            self._drop(table)
+            if fresh.nbytes > self.max_bytes:
+                st['oversize'] += 1
+                return None
+            self._evict_until_fits(fresh.nbytes)
+            self._entries[table] = fresh
+            self._bytes += fresh.nbytes
+            st['deltas'] += 1
+            st['delta_rows'] += int(len(delta))
+        return {'appended': int(len(delta)) - replaced, 'replaced': replaced, 'rows': int(len(new)), 'frame': new}
+
+    def lookup_rows(self, df: pd.DataFrame, key, column: str = INDEX_COLUMN) -> Optional[np.ndarray]:
+        """用缓存索引查找 df 中 column == key 的行位置（供 df.iloc 使用）。
+
+        仅当 df 是当前缓存表的视图（attrs 标记、版本、行数与行索引均一致）时命中；
+        否则返回 None，由调用方退化为整列比较。
+        """
+        if column != INDEX_COLUMN or df is None:
+            return None
+        try:
+            tag = df.attrs.get(_ATTR_KEY)
+        except Exception:
+            tag = None
+        if not tag:
+            return None
+        table, version, variant = tag
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is None or entry.version != version:
+                return None
+            base = entry.processed if variant == 'processed' else entry.raw
+            index = entry.processed_index if variant == 'processed' else entry.raw_index
+            st = self._stat(table)
+        if base is None or index is None or len(df) != len(base) or column not in df.columns:
+            with self._lock:
+                st['index_fallbacks'] += 1
+            return None
+        # RangeIndex 之间的比较为 O(1)；筛选/重排过的 DataFrame 在这里被排除
+        if not df.index.equals(base.index):
+            with self._lock:
+                st['index_fallbacks'] += 1
+            return None
+        pos = index.get(str(key))
+        if pos is None:
+            pos = np.empty(0, dtype=np.intp)
+        elif len(pos) and not (df[column].iloc[pos].astype(str) == str(key)).all():
+            # 调用方改写过键列，索引不再可信
+            with self._lock:
+                st['index_fallbacks'] += 1
+            return None
+        with self._lock:
+            st['index_hits'] += 1
+        return pos
+
+    def fingerprint(self, df: pd.DataFrame, compute: Callable[[pd.DataFrame], Optional[str]]) -> Optional[str]:
+        """返回缓存视图 df 的内容指纹，同一 (表, 版本, raw|processed) 只调用一次 compute(缓存数据)。
+
+        df 不是当前缓存条目的未改动视图（无 attrs 标记、版本已过期、行数/列/类型/行索引不一致）时返回 None，
+        由调用方自行对 df 计算。与 lookup_rows 相同，不检测调用方对视图中已有列的原地改值。
+        """
+        if df is None:
+            return None
+        try:
+            tag = df.attrs.get(_ATTR_KEY)
+        except Exception:
+            tag = None
+        if not tag:
+            return None
+        table, version, variant = tag
+        with self._lock:
+            entry = self._entries.get(table)
+            if entry is None or entry.version != version:
+                return None
+            base = entry.processed if variant == 'processed' else entry.raw
+            fp = entry.fingerprints.get(variant)
+            st = self._stat(table)
+        if base is None or len(df) != len(base) or not df.columns.equals(base.columns) \
+                or not df.dtypes.equals(base.dtypes) or not df.index.equals(base.index):
+            return None
+        if fp is None:
+            # 锁外计算：整表哈希耗时，不阻塞其它表；并发计算同一版本时结果相同，后写覆盖无妨
+            fp = compute(base)
+            if fp is None:
+                return None
+            with self._lock:
+                if self._entries.get(table) is entry:
+                    entry.fingerprints[variant] = fp
+                st['fingerprint_computes'] += 1
+        else:
+            with self._lock:
+                st['fingerprint_hits'] += 1
+        return fp
+
+    def invalidate(self, table: str) -> bool:
+        with self._lock:
+            self._generations[table] = self._generations.get(table, 0) + 1
+            entry = self._drop(table)
+            if entry is not None:
+                self._stat(table)['invalidations'] += 1
+            return entry is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._clears += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = {}
+            for name, st in self._table_stats.items():
+                row = dict(st)
+                entry = self._entries.get(name)
+                row['cached'] = entry is not None
+                row['bytes'] = entry.nbytes if entry is not None else 0
+                row['has_processed'] = bool(entry is not None and entry.processed is not None)
+                row['generation'] = self._generations.get(name, 0) + self._clears
+                tables[name] = row
+            return {
+                'max_bytes': self.max_bytes,
+                'used_bytes': self._bytes,
+                'cached_tables': list(self._entries.keys()),
+                'tables': tables,
+            }
@@ -0,0 +1,269 @@
+"""
+表数据分页
+
+职责：
+- 把 /api/analysis/table-data 的分页下推到数据源，只读取当前页，不再整表加载
+- MySQL：单列主键表使用键集分页（WHERE pk > cursor ORDER BY pk LIMIT n），
+  无主键或未提供游标时回退为 LIMIT/OFFSET；总行数使用带过期时间的 COUNT(*) 缓存
+- CSV：首次访问时扫描一遍文件，每隔 CSV_INDEX_STRIDE 行记录一次字节偏移，
+  翻页时 seek 到最近的检查点再读取当前页
+
+注意：
+- COUNT(*) 缓存有效期通过环境变量 TABLE_COUNT_TTL 配置（秒，默认 60）；
+  增删改接口经 mark_table_dirty 调用 invalidate() 立即失效；采集器增量并入新行时经 adjust_count() 修正
+- CSV 行偏移索引以 (文件大小, 修改时间) 校验，文件变化后自动重建
+- 与整表加载不同，分页结果保留全部表头列（整表加载会去掉整列为空的列），列类型按当前页推断
+"""
+
+from __future__ import annotations
+import csv
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable
+
+import pandas as pd
+
+from database import fetch_all, fetch_one, get_tables, get_columns, get_primary_key
+
+# 与 _read_csv_full_with_fallbacks 一致的编码尝试顺序
+CSV_ENCODINGS = ['utf-8', 'utf-8-sig', 'gbk', 'cp936', 'latin1']
+CSV_INDEX_STRIDE = 1000
+
+
+class _CsvIndex:
+    __slots__ = ('path', 'size', 'mtime_ns', 'encoding', 'delimiter', 'columns', 'offsets', 'row_count')
+
+    def __init__(self, path: str, size: int, mtime_ns: int, encoding: str, delimiter: str,
+                 columns: List[str], offsets: List[int], row_count: int):
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.encoding = encoding
+        self.delimiter = delimiter
+        self.columns = columns
+        self.offsets = offsets
+        self.row_count = row_count
+
+
+def _scan_records(path: str, encoding: str, stride: int):
+    """逐行扫描文件，返回 (每 stride 行的记录起始字节偏移, 数据行数)。
+
+    引号内的换行不算记录结束；空行与 pandas 默认的 skip_blank_lines 一致不计数。
+    扫描时同时按 encoding 解码校验，失败抛出 UnicodeDecodeError 以便尝试下一个编码。
+    """
+    offsets: List[int] = []
+    pos = 0
+    rows = -1  # -1 表示尚未读到表头
+    in_quote = False
+    with open(path, 'rb') as f:
+        for line in f:
+            line.decode(encoding)
+            if not in_quote and line.strip(b'\r\n') == b'':
+                pos += len(line)
+                continue
+            if not in_quote:
+                if rows >= 0 and rows % stride == 0:
+                    offsets.append(pos)
+                rows += 1
+            if line.count(b'"') % 2 == 1:
+                in_quote = not in_quote
+            pos += len(line)
+    return offsets, max(rows, 0)
+
+
+def _build_csv_index(path: str, stride: int = CSV_INDEX_STRIDE) -> _CsvIndex:
+    st = os.stat(path)
+    last_err: Optional[Exception] = None
+    for enc in CSV_ENCODINGS:
+        try:
+            offsets, rows = _scan_records(path, enc, stride)
+            header = pd.read_csv(path, encoding=enc, sep=None, engine='python', nrows=0)
+            with open(path, 'r', encoding=enc, newline='') as f:
+                first = f.readline().lstrip('\ufeff')
+            # 与 pandas python 引擎 sep=None 的做法一致：对首行做分隔符嗅探
+            try:
+                delimiter = csv.Sniffer().sniff(first).delimiter
+            except Exception:
+                delimiter = ','
+            return _CsvIndex(path, st.st_size, st.st_mtime_ns, enc, delimiter,
+                             [str(c) for c in header.columns], offsets, rows)
+        except Exception as e:
+            last_err = e
+            continue
+    raise last_err or Exception(f'无法建立CSV索引: {path}')
+
+
+class TablePager:
+    _instance_lock = threading.Lock()
+    _instance: Optional['TablePager'] = None
+
+    def __init__(self, count_ttl: Optional[float] = None) -> None:
+        if count_ttl is None:
+            try:
+                count_ttl = float(os.getenv('TABLE_COUNT_TTL', '60'))
+            except Exception:
+                count_ttl = 60.0
+        self.count_ttl = max(0.0, count_ttl)
+        self._lock = threading.Lock()
+        self._counts: Dict[str, tuple] = {}
+        self._schema: Dict[str, tuple] = {}
+        # 表名（文件名去后缀）-> {文件路径: 行偏移索引}，失效时按表名整组移除
+        self._csv: Dict[str, Dict[str, _CsvIndex]] = {}
+        self._stats = {'count_hits': 0, 'count_queries': 0, 'db_pages': 0, 'keyset_pages': 0,
+                       'csv_pages': 0, 'csv_index_builds': 0}
+
+    @classmethod
+    def instance(cls) -> 'TablePager':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TablePager()
+            return cls._instance
+
+    # ---- 缓存维护 ----
+    def invalidate(self, table: str) -> None:
+        with self._lock:
+            self._counts.pop(table, None)
+            self._schema.pop(table, None)
+            self._csv.pop(table, None)
+
+    def adjust_count(self, table: str, delta: int) -> None:
+        """增量并入新行后同步修正已缓存的 COUNT(*)（不刷新过期时间）。"""
+        with self._lock:
+            hit = self._counts.get(table)
+            if hit is not None:
+                self._counts[table] = (max(0, hit[0] + int(delta)), hit[1])
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out['cached_counts'] = len(self._counts)
+            out['csv_indexes'] = {k: idx.row_count for group in self._csv.values() for k, idx in group.items()}
+            return out
+
+    # ---- MySQL ----
+    def count(self, table: str) -> int:
+        """带过期时间的 COUNT(*) 缓存。"""
+        now = time.monotonic()
+        with self._lock:
+            hit = self._counts.get(table)
+            if hit is not None and now - hit[1] < self.count_ttl:
+                self._stats['count_hits'] += 1
+                return hit[0]
+        row = fetch_one(f"SELECT COUNT(*) AS c FROM `{table}`")
+        total = int((row or {}).get('c') or 0)
+        with self._lock:
+            self._counts[table] = (total, now)
+            self._stats['count_queries'] += 1
+        return total
+
+    def _table_schema(self, table: str):
+        with self._lock:
+            hit = self._schema.get(table)
+        if hit is not None:
+            return hit
+        columns = get_columns(table)
+        pk = get_primary_key(table)
+        # 仅单列主键可做键集分页
+        schema = (columns, pk[0] if len(pk) == 1 else None)
+        with self._lock:
+            self._schema[table] = schema
+        return schema
+
+    def _db_page(self, table: str, page: int, page_size: int, cursor: Optional[str]) -> Dict[str, Any]:
+        columns, pk = self._table_schema(table)
+        total = self.count(table)
+        limit = page_size + 1  # 多取一行判断是否还有下一页
+        if pk and cursor not in (None, ''):
+            rows = fetch_all(f"SELECT * FROM `{table}` WHERE `{pk}` > %s ORDER BY `{pk}` LIMIT %s",
+                             (cursor, limit))
+            mode = 'keyset'
+        else:
+            order = f" ORDER BY `{pk}`" if pk else ''
+            rows = fetch_all(f"SELECT * FROM `{table}`{order} LIMIT %s OFFSET %s",
+                             (limit, (page - 1) * page_size))
+            mode = 'offset'
+        rows = list(rows or [])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        next_cursor = None
+        if pk and has_more and rows:
+            next_cursor = rows[-1].get(pk)
+        with self._lock:
+            self._stats['db_pages'] += 1
+            if mode == 'keyset':
+                self._stats['keyset_pages'] += 1
+        return {
+            'frame': pd.DataFrame(rows, columns=columns or None),
+            'columns': columns or (list(rows[0].keys()) if rows else []),
+            'total': total,
+            'has_more': has_more,
+            'next_cursor': None if next_cursor is None else str(next_cursor),
+            'source': 'mysql',
+            'mode': mode,
+        }
+
+    # ---- CSV ----
+    def csv_index(self, path: str) -> _CsvIndex:
+        st = os.stat(path)
+        table = Path(path).stem
+        with self._lock:
+            idx = (self._csv.get(table) or {}).get(path)
+        if idx is not None and idx.size == st.st_size and idx.mtime_ns == st.st_mtime_ns:
+            return idx
+        idx = _build_csv_index(path)
+        with self._lock:
+            self._csv.setdefault(table, {})[path] = idx
+            self._stats['csv_index_builds'] += 1
+        return idx
+
+    def _csv_page(self, path: str, page: int, page_size: int, cursor: Optional[str]) -> Dict[str, Any]:
+        idx = self.csv_index(path)
+        # CSV 的游标即下一页的起始行号
+        start = (page - 1) * page_size
+        if cursor not in (None, ''):
+            try:
+                start = max(0, int(cursor))
+            except Exception:
+                pass
+        end = min(start + page_size, idx.row_count)
+        if start >= idx.row_count or not idx.offsets:
+            frame = pd.DataFrame(columns=idx.columns)
+        else:
+            k = start // CSV_INDEX_STRIDE
+            with open(path, 'rb') as f:
+                f.seek(idx.offsets[k])
+                frame = pd.read_csv(f, encoding=idx.encoding, sep=idx.delimiter, header=None,
+                                    names=idx.columns, skiprows=start - k * CSV_INDEX_STRIDE,
+                                    nrows=end - start)
+        with self._lock:
+            self._stats['csv_pages'] += 1
+        return {
+            'frame': frame,
+            'columns': list(idx.columns),
+            'total': idx.row_count,
+            'has_more': end < idx.row_count,
+            'next_cursor': str(end) if end < idx.row_count else None,
+            'source': 'csv',
+            'mode': 'row_index',
+        }
+
+    # ---- 对外接口 ----
+    def fetch_page(self, table: str, page: int, page_size: int, cursor: Optional[str] = None,
+                   csv_paths: Iterable[Path] = ()) -> Optional[Dict[str, Any]]:
+        """读取一页数据：数据库中存在该表时查数据库，否则读取第一个存在的 CSV；都不可用返回 None。"""
+        page = max(1, int(page))
+        page_size = max(1, int(page_size))
+        try:
+            if table in get_tables():
+                return self._db_page(table, page, page_size, cursor)
+        except Exception as e:
+            print(f"[TablePager] 数据库分页失败，尝试CSV: {e}")
+        for p in csv_paths:
+            try:
+                if Path(p).exists():
+                    return self._csv_page(str(p), page, page_size, cursor)
+            except Exception as e:
+                print(f"[TablePager] CSV分页失败 {p}: {e}")
+        return None
@@ -0,0 +1,282 @@
+"""
+表数据列式快照
+
+职责：
+- get_table_data 从数据库 SELECT * 或 CSV 加载整表后，把结果写成列式快照文件（Feather/Arrow IPC）
+- 进程重启后首次请求优先以内存映射方式读取快照，避免重新全表查询或多编码重试解析 CSV
+- 快照带版本戳，版本不一致即视为过期：
+  - 数据库表：data_sync_state 中该表的同步位置（last_max_id / last_max_updated / updated_at）+ COUNT(*) + MAX(主键)；
+    未配置采集数据源的表不写快照（无法感知外部写入，重启后总是重新加载）
+  - CSV：文件路径 + 大小 + 修改时间
+- 采集器发现新数据、增删改接口调用 mark_table_dirty 时删除该表快照
+
+注意：
+- 快照目录通过 TABLE_SNAPSHOT_DIR 配置（默认 flask_backend/cache/snapshots），TABLE_SNAPSHOTS=false 关闭
+- 依赖 pyarrow；未安装时退化为 pickle 格式（仍可省去重新加载，但不能内存映射）
+- 未经采集器/本服务写入的外部修改无法感知，快照超过 TABLE_SNAPSHOT_MAX_AGE 秒（默认 86400，0 表示不限）后不再使用
+- 写入先落临时文件再 os.replace，元数据（meta.json）最后写入，读到元数据即表示数据文件完整
+- 含混合类型等无法转换为 Arrow 的列时跳过快照，不影响正常加载
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    HAS_ARROW = True
+except Exception:  # pragma: no cover - 可选依赖
+    pa = None
+    feather = None
+    HAS_ARROW = False
+
+_BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def _env_flag(name: str, default: bool = True) -> bool:
+    raw = os.getenv(name)
+    if raw is None or raw == '':
+        return default
+    return raw.strip().lower() not in ('0', 'false', 'no', 'off')
+
+
+def file_version(path) -> Optional[str]:
+    """CSV 等文件数据源的版本戳：路径 + 大小 + 修改时间。文件不存在时返回 None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return f"file:{Path(path).resolve()}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _arrow_column(series: pd.Series):
+    """浮点列保留 NaN 为值（而非 Arrow null），读取时可零拷贝映射；其它列按 pandas 语义转换。"""
+    if series.dtype.kind == 'f':
+        return pa.array(series.to_numpy(), type=pa.from_numpy_dtype(series.dtype), from_pandas=False)
+    return pa.Array.from_pandas(series)
+
+
+def write_arrow_file(df: pd.DataFrame, path) -> None:
+    """把 DataFrame 写成单批次、无压缩的 Arrow IPC（Feather v2）文件。
+
+    单批次 + 无 null 的数值列在内存映射读取时无需复制；原列名（可能不是字符串）记录在 schema 元数据中。
+    """
+    frame = df.reset_index(drop=True)
+    names = [str(c) for c in frame.columns]
+    arrays = [_arrow_column(frame.iloc[:, i]) for i in range(frame.shape[1])]
+    table = pa.Table.from_arrays(arrays, names=names)
+    columns = [c if isinstance(c, (str, int, float)) else str(c) for c in df.columns]
+    table = table.replace_schema_metadata({b'columns': json.dumps(columns, ensure_ascii=False).encode('utf-8')})
+    feather.write_feather(table, str(path), compression='uncompressed', chunksize=max(1, len(frame)))
+
+
+def read_arrow_file(path) -> pd.DataFrame:
+    """内存映射读取 write_arrow_file 写出的文件：数值列与字符串列直接引用映射页（只读），不复制数据。"""
+    table = feather.read_table(str(path), memory_map=True)
+    df = table.to_pandas(split_blocks=True)
+    try:
+        columns = json.loads((table.schema.metadata or {}).get(b'columns', b'null').decode('utf-8'))
+        if isinstance(columns, list) and len(columns) == len(df.columns):
+            df.columns = columns
+    except Exception:
+        pass
+    return df
+
+
+class TableSnapshotStore:
+    _instance_lock = threading.Lock()
+    _instance: Optional['TableSnapshotStore'] = None
+
+    def __init__(self, root: Optional[str] = None, enabled: Optional[bool] = None,
+                 max_age: Optional[float] = None) -> None:
+        self.root = Path(root or os.getenv('TABLE_SNAPSHOT_DIR') or _BACKEND_DIR / 'cache' / 'snapshots')
+        self.enabled = _env_flag('TABLE_SNAPSHOTS', True) if enabled is None else enabled
+        if max_age is None:
+            try:
+                max_age = float(os.getenv('TABLE_SNAPSHOT_MAX_AGE', '86400'))
+            except Exception:
+                max_age = 86400.0
+        self.max_age = max_age
+        self.format = 'feather' if HAS_ARROW else 'pickle'
+        if self.enabled:
+            try:
+                self.root.mkdir(parents=True, exist_ok=True)
+            except Exception as e:
+                print(f"[TableSnapshot] 无法创建快照目录 {self.root}，已关闭快照: {e}")
+                self.enabled = False
+        if self.enabled and not HAS_ARROW:
+            print("[TableSnapshot] 未安装 pyarrow，快照改用 pickle 格式（不支持内存映射）")
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale': 0, 'writes': 0, 'write_errors': 0,
+                       'invalidations': 0, 'load_seconds': 0.0, 'write_seconds': 0.0}
+
+    @classmethod
+    def instance(cls) -> 'TableSnapshotStore':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TableSnapshotStore()
+            return cls._instance
+
+    # ---- 路径 ----
+    def _base(self, table: str) -> Path:
+        # 表名可能含中文或特殊字符：保留可读前缀，再加哈希避免冲突
+        safe = re.sub(r'[^0-9A-Za-z_\-]+', '_', str(table))[:60] or 'table'
+        digest = hashlib.sha1(str(table).encode('utf-8')).hexdigest()[:10]
+        return self.root / f"{safe}-{digest}"
+
+    def _meta_path(self, table: str) -> Path:
+        return self._base(table).with_suffix('.meta.json')
+
+    def _data_path(self, table: str, fmt: str) -> Path:
+        return self._base(table).with_suffix('.arrow' if fmt == 'feather' else '.pkl')
+
+    def _count(self, key: str, delta=1) -> None:
+        with self._lock:
+            self._stats[key] += delta
+
+    # ---- 版本戳 ----
+    @staticmethod
+    def db_version(table: str) -> Optional[str]:
+        """数据库表的版本戳：data_sync_state 中该表的同步位置 + 当前 COUNT(*) 与 MAX(主键)。
+
+        没有采集数据源（data_sync_state 中无该表记录）的表无法可靠判断是否被外部修改，返回 None，不使用快照；
+        查询失败时同样返回 None。COUNT/MAX 用于发现导入脚本、其它主机或手工 SQL 带来的新增/删除。
+        """
+        try:
+            from database import fetch_one, get_primary_key
+            row = fetch_one(
+                "SELECT COUNT(*) AS n, MAX(last_max_id) AS max_id, MAX(last_max_updated) AS max_upd, "
+                "MAX(updated_at) AS upd FROM data_sync_state WHERE table_name=%s", [table]
+            ) or {}
+            if not int(row.get('n') or 0):
+                return None
+            pk = get_primary_key(table) or []
+            max_expr = f", MAX(`{pk[0]}`) AS max_pk" if len(pk) == 1 else ""
+            stamp = fetch_one(f"SELECT COUNT(*) AS cnt{max_expr} FROM `{table}`") or {}
+            return (f"db:{row.get('max_id')}:{row.get('max_upd')}:{row.get('upd')}"
+                    f":{stamp.get('cnt')}:{stamp.get('max_pk')}")
+        except Exception:
+            return None
+
+    # ---- 读写 ----
+    def load(self, table: str, version: Optional[str]) -> Optional[pd.DataFrame]:
+        """版本一致且未过期时返回快照中的整表，否则返回 None。"""
+        if not self.enabled or not version:
+            return None
+        meta_path = self._meta_path(table)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        except Exception:
+            self._count('misses')
+            return None
+        if meta.get('version') != version or meta.get('table') != table:
+            self._count('stale')
+            return None
+        if self.max_age > 0 and time.time() - float(meta.get('created_at') or 0) > self.max_age:
+            self._count('stale')
+            return None
+        fmt = meta.get('format')
+        path = self._data_path(table, fmt)
+        started = time.perf_counter()
+        try:
+            if fmt == 'feather':
+                if not HAS_ARROW:
+                    self._count('misses')
+                    return None
+                # 内存映射读取：数值列直接引用映射页，无需先把整个文件读入内存
+                df = read_arrow_file(path)
+            else:
+                with open(path, 'rb') as f:
+                    df = pickle.load(f)
+        except Exception as e:
+            print(f"[TableSnapshot] 读取表 {table} 的快照失败，改为重新加载: {e}")
+            self._count('misses')
+            return None
+        self._count('hits')
+        self._count('load_seconds', time.perf_counter() - started)
+        return df
+
+    def save(self, table: str, version: Optional[str], df: pd.DataFrame, source: str = '') -> bool:
+        """写入（覆盖）表快照；失败时仅打印警告并返回 False。"""
+        if not self.enabled or not version or df is None:
+            return False
+        started = time.perf_counter()
+        fmt = self.format
+        path = self._data_path(table, fmt)
+        tmp = path.with_name(path.name + f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        try:
+            # 先删元数据：写入期间其它进程读不到半新半旧的快照
+            self._meta_path(table).unlink(missing_ok=True)
+            if fmt == 'feather':
+                write_arrow_file(df, tmp)
+            else:
+                with open(tmp, 'wb') as f:
+                    pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, path)
+            meta = {
+                'table': table,
+                'version': version,
+                'source': source,
+                'format': fmt,
+                'rows': int(len(df)),
+                'columns': [c if isinstance(c, (str, int, float)) else str(c) for c in df.columns],
+                'created_at': time.time(),
+            }
+            meta_tmp = self._meta_path(table).with_name(self._meta_path(table).name + '.tmp')
+            with open(meta_tmp, 'w', encoding='utf-8') as f:
+                json.dump(meta, f, ensure_ascii=False)
+            os.replace(meta_tmp, self._meta_path(table))
+        except Exception as e:
+            print(f"[TableSnapshot] 写入表 {table} 的快照失败（已跳过）: {e}")
+            try:
+                tmp.unlink(missing_ok=True)
+            except Exception:
+                pass
+            self._count('write_errors')
+            return False
+        self._count('writes')
+        self._count('write_seconds', time.perf_counter() - started)
+        return True
+
+    def invalidate(self, table: str) -> None:
+        """删除该表的快照（元数据先删，保证不会读到失效数据）。"""
+        if not self.enabled:
+            return
+        for p in (self._meta_path(table), self._data_path(table, 'feather'), self._data_path(table, 'pickle')):
+            try:
+                p.unlink(missing_ok=True)
+            except Exception as e:
+                print(f"[TableSnapshot] 删除快照文件 {p} 失败: {e}")
+        self._count('invalidations')
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+        out['load_seconds'] = round(out['load_seconds'], 4)
+        out['write_seconds'] = round(out['write_seconds'], 4)
+        out['enabled'] = self.enabled
+        out['format'] = self.format
+        out['dir'] = str(self.root)
+        try:
+            files = [p for p in self.root.glob('*.meta.json')] if self.enabled else []
+            out['snapshots'] = len(files)
+            out['bytes'] = sum(p.stat().st_size for p in self.root.iterdir()
+                               if p.suffix in ('.arrow', '.pkl')) if self.enabled else 0
+        except Exception:
+            out['snapshots'] = None
+            out['bytes'] = None
+        return out
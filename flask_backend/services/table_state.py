@@ -0,0 +1,50 @@
+"""
+分析接口的共享状态
+
+职责：
+- 替代 analysis_routes 中模块级的 global_data 字典，集中保存跨请求共享的少量状态：
+  - current_table：最近一次成功读取的表名（接口未指定 table 时的默认值）
+  - 列显示名缓存：表名 -> {存储列名: 显示名}（来自 table_column_mapping）
+- 多线程 WSGI 与采集器线程并发读写时不再出现 “先判断再写入” 的竞争和 KeyError
+
+注意：
+- 表数据缓存的失效（原 dirty_tables 集合）由 TableCache 的代数（generation）负责，这里不再维护脏标记
+- current_table 只做整体赋值/读取，单次属性赋值在 CPython 下是原子的，不加锁
+- 列显示名缓存的读取返回内部字典本身，调用方不得修改；更新时整体替换
+"""
+
+from __future__ import annotations
+import threading
+from typing import Optional, Dict
+
+
+class TableState:
+    _instance_lock = threading.Lock()
+    _instance: Optional['TableState'] = None
+
+    def __init__(self) -> None:
+        self.current_table: Optional[str] = None
+        self._lock = threading.Lock()
+        self._column_labels: Dict[str, Dict[str, str]] = {}
+
+    @classmethod
+    def instance(cls) -> 'TableState':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TableState()
+            return cls._instance
+
+    def current(self, default: Optional[str] = None) -> Optional[str]:
+        return self.current_table or default
+
+    def column_labels(self, table: str) -> Optional[Dict[str, str]]:
+        with self._lock:
+            return self._column_labels.get(table)
+
+    def set_column_labels(self, table: str, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self._column_labels[table] = dict(labels)
+
+    def drop_column_labels(self, table: str) -> None:
+        with self._lock:
+            self._column_labels.pop(table, None)
@@ -0,0 +1,398 @@
+"""
+后台训练任务队列
+
+职责：
+- 将耗时的训练/预测请求（/train、/predict-table）交给进程池异步执行，HTTP 请求只负责提交与轮询
+- 记录任务状态与进度（按模型/折汇报），支持取消，保存执行结果供轮询接口返回
+
+注意：
+- 工作进程数通过环境变量 TRAINING_JOB_WORKERS 配置（默认 2），进程池与共享状态在首次提交时惰性创建
+- 任务状态落库到 training_jobs 表（与 collection_tasks 风格一致）；数据库不可用时仅保存在内存
+- 进度与取消标记通过 multiprocessing.Manager 在主进程与工作进程间共享；
+  运行中的任务在下一次进度汇报时检查取消标记并中止
+- 工作进程在进度百分比变化时把 status/progress 写入 training_jobs（节流），并同时读取表中的
+  cancel_requested：取消请求落到其它 gunicorn worker 或服务重启后，仍能看到真实进度并取消任务
+- 工作进程统一以 spawn 方式启动（TRAINING_JOB_START_METHOD 可改），避免在含调度器线程的
+  Web 进程中 fork 继承到被占用的锁而卡死；任务函数以 'module:function' 字符串登记，供子进程导入
+"""
+
+from __future__ import annotations
+import os
+import json
+import uuid
+import time
+import threading
+import importlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
+
+from database import execute_query, fetch_all, fetch_one
+
+# 任务类型 -> 执行函数（签名：fn(payload: dict) -> (body: dict, http_status: int)）
+JOB_RUNNERS = {
+    'train': 'routes.training_routes:run_train',
+    'predict_table': 'routes.training_routes:run_predict_table',
+}
+
+FINAL_STATES = ('succeeded', 'failed', 'cancelled')
+
+
+class JobCancelled(Exception):
+    """任务被取消时在工作进程内抛出，用于中止模型搜索。"""
+
+
+def _now() -> str:
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _sync_job_row(job_id: str, pct: int) -> Optional[bool]:
+    """把运行中任务的进度写入 training_jobs，并返回表中是否已请求取消；数据库不可用时返回 None。"""
+    try:
+        row = fetch_one("SELECT status, cancel_requested FROM training_jobs WHERE id=%s", [job_id])
+        if row and (row.get('cancel_requested') or row.get('status') == 'cancelled'):
+            return True
+        execute_query(
+            "UPDATE training_jobs SET status='running', progress=%s WHERE id=%s AND status IN ('queued', 'running')",
+            [int(pct), job_id]
+        )
+    except Exception:
+        return None
+    return False
+
+
+def _execute_job(job_id: str, target: str, payload: Dict[str, Any], progress, cancel_flags) -> Tuple[Dict[str, Any], int]:
+    """工作进程入口：登记进度回调后执行任务函数。"""
+    from services.model_selection import set_progress_callback
+    state = {'pct': -1, 'db': True}
+
+    def sync(pct: int) -> None:
+        # 百分比变化时才写库；取消检查与进度写入共用这一次往返；数据库不可用后本任务不再尝试
+        if pct == state['pct'] or not state['db']:
+            return
+        state['pct'] = pct
+        cancelled = _sync_job_row(job_id, pct)
+        if cancelled is None:
+            state['db'] = False
+        elif cancelled:
+            cancel_flags[job_id] = True
+            raise JobCancelled('任务已取消')
+
+    def report(info: Dict[str, Any]) -> None:
+        if cancel_flags.get(job_id):
+            raise JobCancelled('任务已取消')
+        done = int(info.get('done') or 0)
+        total = int(info.get('total') or 0)
+        # 模型搜索占整体进度的 10%~90%，其余为数据准备与评估/可视化
+        pct = 10 + int(80 * done / total) if total else 10
+        sync(min(pct, 90))
+        progress[job_id] = {
+            'progress': min(pct, 90),
+            'stage': 'search',
+            'model': info.get('model'),
+            'fold': info.get('fold'),
+            'round': info.get('round'),
+            'fits_done': done,
+            'fits_total': total,
+        }
+
+    if cancel_flags.get(job_id):
+        raise JobCancelled('任务已取消')
+    sync(5)
+    progress[job_id] = {'progress': 5, 'stage': 'preparing'}
+    module_name, func_name = target.split(':', 1)
+    func = getattr(importlib.import_module(module_name), func_name)
+    set_progress_callback(report)
+    try:
+        result = func(payload)
+    finally:
+        set_progress_callback(None)
+    # 任务函数内部会捕获异常并返回错误响应，这里再确认一次是否因取消而中止
+    if cancel_flags.get(job_id):
+        raise JobCancelled('任务已取消')
+    return result
+
+
+class TrainingJobManager:
+    _instance_lock = threading.Lock()
+    _instance: Optional['TrainingJobManager'] = None
+
+    def __init__(self, max_workers: Optional[int] = None, max_results: int = 50) -> None:
+        if max_workers is None:
+            try:
+                max_workers = int(os.getenv('TRAINING_JOB_WORKERS', '2'))
+            except Exception:
+                max_workers = 2
+        self.max_workers = max(1, max_workers)
+        self.max_results = max_results
+        self._lock = threading.RLock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._progress = None
+        self._cancel_flags = None
+        self._jobs: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._results: Dict[str, Any] = {}
+        self._futures: Dict[str, Any] = {}
+        self._table_ready = False
+        self._table_retry_at = 0.0
+
+    @classmethod
+    def instance(cls) -> 'TrainingJobManager':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = TrainingJobManager()
+            return cls._instance
+
+    # ---- 进程池 / 持久化 ----
+    def _ensure_started(self) -> None:
+        if self._executor is not None:
+            return
+        ctx = multiprocessing.get_context(os.getenv('TRAINING_JOB_START_METHOD', 'spawn'))
+        self._manager = ctx.Manager()
+        self._progress = self._manager.dict()
+        self._cancel_flags = self._manager.dict()
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+        print(f'[TrainingJobs] 后台训练进程池已启动（{self.max_workers} 个工作进程）')
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            if self._manager is not None:
+                try:
+                    self._manager.shutdown()
+                except Exception:
+                    pass
+                self._manager = None
+
+    def _ensure_table(self) -> bool:
+        if self._table_ready:
+            return True
+        # 数据库不可用时每分钟最多重试一次建表，避免每次轮询都尝试连接
+        if time.monotonic() < self._table_retry_at:
+            return False
+        try:
+            execute_query(
+                """
+                CREATE TABLE IF NOT EXISTS training_jobs (
+                  id VARCHAR(36) PRIMARY KEY,
+                  kind VARCHAR(32) NOT NULL,
+                  status VARCHAR(16) NOT NULL DEFAULT 'queued',
+                  progress INT DEFAULT 0,
+                  message TEXT,
+                  params TEXT,
+                  result LONGTEXT,
+                  cancel_requested TINYINT(1) DEFAULT 0,
+                  created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+                """
+            )
+            # 旧库补充取消标记列（已存在时忽略）
+            try:
+                execute_query("ALTER TABLE training_jobs ADD COLUMN cancel_requested TINYINT(1) DEFAULT 0")
+            except Exception:
+                pass
+            self._table_ready = True
+        except Exception as e:
+            self._table_retry_at = time.monotonic() + 60
+            print(f'[TrainingJobs] 任务表不可用，任务状态仅保存在内存: {e}')
+        return self._table_ready
+
+    def _persist(self, job: Dict[str, Any], result: Any = None) -> None:
+        if not self._ensure_table():
+            return
+        try:
+            execute_query(
+                """
+                INSERT INTO training_jobs (id, kind, status, progress, message, params, result)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE status=VALUES(status), progress=VALUES(progress),
+                  message=VALUES(message), result=COALESCE(VALUES(result), result)
+                """,
+                [job['id'], job['kind'], job['status'], int(job.get('progress') or 0), job.get('message'),
+                 json.dumps(job.get('params') or {}, ensure_ascii=False, default=str),
+                 json.dumps(result, ensure_ascii=False, default=str) if result is not None else None]
+            )
+        except Exception as e:
+            print(f'[TrainingJobs] 保存任务状态失败: {e}')
+
+    # ---- 对外接口 ----
+    def submit(self, kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        target = JOB_RUNNERS.get(kind)
+        if not target:
+            raise ValueError(f'不支持的任务类型: {kind}')
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'status': 'queued',
+            'progress': 0,
+            'message': None,
+            'params': {k: v for k, v in (payload or {}).items() if k != 'async'},
+            'created_at': _now(),
+            'updated_at': _now(),
+        }
+        with self._lock:
+            self._ensure_started()
+            self._jobs[job_id] = job
+            self._progress[job_id] = {'progress': 0, 'stage': 'queued'}
+            future = self._executor.submit(_execute_job, job_id, target, payload, self._progress, self._cancel_flags)
+            self._futures[job_id] = future
+        self._persist(job)
+        future.add_done_callback(lambda f, jid=job_id: self._on_done(jid, f))
+        return self.get(job_id)
+
+    def _on_done(self, job_id: str, future) -> None:
+        result = None
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            self._futures.pop(job_id, None)
+            if future.cancelled():
+                job['status'] = 'cancelled'
+                job['message'] = '任务已取消'
+            else:
+                exc = future.exception()
+                if isinstance(exc, JobCancelled):
+                    job['status'] = 'cancelled'
+                    job['message'] = '任务已取消'
+                elif exc is not None:
+                    job['status'] = 'failed'
+                    job['message'] = str(exc)
+                else:
+                    body, code = future.result()
+                    result = {'body': body, 'http_status': code}
+                    ok = code < 400 and (body or {}).get('status') != 'error'
+                    job['status'] = 'succeeded' if ok else 'failed'
+                    job['message'] = (body or {}).get('message')
+                    job['progress'] = 100
+                    self._results[job_id] = result
+            job['updated_at'] = _now()
+            try:
+                self._progress.pop(job_id, None)
+                self._cancel_flags.pop(job_id, None)
+            except Exception:
+                pass
+            # 仅保留最近 max_results 个已结束任务的结果
+            finished = [jid for jid, j in self._jobs.items() if j['status'] in FINAL_STATES]
+            for jid in finished[:-self.max_results]:
+                self._jobs.pop(jid, None)
+                self._results.pop(jid, None)
+            snapshot = dict(job)
+        self._persist(snapshot, result)
+
+    def get(self, job_id: str, include_result: bool = True) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                out = dict(job)
+                live = None
+                if job['status'] not in FINAL_STATES and self._progress is not None:
+                    try:
+                        live = self._progress.get(job_id)
+                    except Exception:
+                        live = None
+                if live:
+                    out['progress'] = int(live.get('progress') or 0)
+                    out['detail'] = dict(live)
+                    if live.get('stage') not in ('queued',) and out['status'] == 'queued':
+                        out['status'] = 'running'
+                if include_result and job_id in self._results:
+                    out['result'] = self._results[job_id]
+                return out
+        # 不在本进程内存中（如服务重启或多进程部署）时查询任务表
+        if not self._ensure_table():
+            return None
+        try:
+            row = fetch_one(
+                "SELECT id, kind, status, progress, message, params, result, cancel_requested, created_at, updated_at "
+                "FROM training_jobs WHERE id=%s",
+                [job_id]
+            )
+        except Exception:
+            row = None
+        if not row:
+            return None
+        out = {
+            'id': row.get('id'),
+            'kind': row.get('kind'),
+            'status': row.get('status'),
+            'progress': int(row.get('progress') or 0),
+            'message': row.get('message'),
+            'params': json.loads(row.get('params') or '{}'),
+            'cancel_requested': bool(row.get('cancel_requested')),
+            'created_at': str(row.get('created_at')) if row.get('created_at') else None,
+            'updated_at': str(row.get('updated_at')) if row.get('updated_at') else None,
+        }
+        if include_result and row.get('result'):
+            try:
+                out['result'] = json.loads(row.get('result'))
+            except Exception:
+                pass
+        return out
+
+    def _request_cancel_in_table(self, job_id: str) -> bool:
+        """在任务表中置取消标记；运行该任务的工作进程（可能属于其它 worker）在下次汇报进度时中止。"""
+        if not self._ensure_table():
+            return False
+        try:
+            row = fetch_one("SELECT status FROM training_jobs WHERE id=%s", [job_id])
+            if not row:
+                return False
+            if row.get('status') not in FINAL_STATES:
+                execute_query(
+                    "UPDATE training_jobs SET cancel_requested=1, message=%s WHERE id=%s", ['正在取消', job_id]
+                )
+            return True
+        except Exception as e:
+            print(f'[TrainingJobs] 写入取消标记失败: {e}')
+            return False
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            # 任务由其它 worker 提交（或服务已重启）：只能通过任务表通知
+            if not self._request_cancel_in_table(job_id):
+                return None
+            return self.get(job_id, include_result=False)
+        with self._lock:
+            if job['status'] in FINAL_STATES:
+                return self.get(job_id, include_result=False)
+            future = self._futures.get(job_id)
+            # 尚未开始的任务直接撤销；运行中的任务置取消标记，由工作进程在下次汇报进度时中止
+            if future is not None and future.cancel():
+                return self.get(job_id, include_result=False)
+            self._cancel_flags[job_id] = True
+            job['message'] = '正在取消'
+        self._request_cancel_in_table(job_id)
+        return self.get(job_id, include_result=False)
+
+    def list(self, limit: int = 50) -> list:
+        with self._lock:
+            ids = list(self._jobs.keys())[-limit:][::-1]
+        jobs = [self.get(jid, include_result=False) for jid in ids]
+        if not ids and self._ensure_table():
+            try:
+                rows = fetch_all(
+                    "SELECT id, kind, status, progress, message, created_at, updated_at FROM training_jobs "
+                    "ORDER BY created_at DESC LIMIT %s",
+                    [limit]
+                ) or []
+                jobs = [{
+                    'id': r.get('id'),
+                    'kind': r.get('kind'),
+                    'status': r.get('status'),
+                    'progress': int(r.get('progress') or 0),
+                    'message': r.get('message'),
+                    'created_at': str(r.get('created_at')) if r.get('created_at') else None,
+                    'updated_at': str(r.get('updated_at')) if r.get('updated_at') else None,
+                } for r in rows]
+            except Exception:
+                pass
+        return [j for j in jobs if j]
@@ -0,0 +1,275 @@
+"""
+可断点续传的分块上传
+
+职责：
+- init：创建（或按 resumeKey 找回）上传会话，返回已接收的字节数，客户端从该偏移继续发送
+- append：按偏移顺序追加一个分块，写盘的同时增量计算 SHA-256
+- complete：校验大小（与可选的客户端哈希），把文件移动到正式上传目录并返回内容哈希
+
+注意：
+- 会话保存在 uploads/.sessions/<会话ID>/（meta.json + data.part），进程重启或连接中断后仍可续传
+- 增量哈希只保存在当前进程内存中；若缺失（如重启、多进程）则从已写入的文件重新计算一次
+- 分块偏移必须等于已接收的字节数，否则返回当前偏移（由调用方回 409），避免重复或跳过数据
+- 超过 UPLOAD_SESSION_TTL 秒（默认 86400）未更新的会话会在创建新会话时被清理
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Dict, Any, BinaryIO
+
+HASH_BLOCK = 1 << 20
+
+
+def hash_file(path: str, block_size: int = HASH_BLOCK) -> str:
+    """流式计算文件的 SHA-256。"""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+
+def save_stream(src: BinaryIO, target: str, block_size: int = HASH_BLOCK) -> str:
+    """把上传流写入 target，同时计算 SHA-256，返回十六进制哈希。"""
+    h = hashlib.sha256()
+    with open(target, 'wb') as out:
+        while True:
+            block = src.read(block_size)
+            if not block:
+                break
+            h.update(block)
+            out.write(block)
+    return h.hexdigest()
+
+
+class UploadSessionError(Exception):
+    """会话不存在、偏移不匹配或校验失败。status 为建议的 HTTP 状态码。"""
+
+    def __init__(self, message: str, status: int = 400, received: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status = status
+        self.received = received
+
+
+class UploadSessionStore:
+    _instance_lock = threading.Lock()
+    _instance: Optional['UploadSessionStore'] = None
+
+    def __init__(self, root: Optional[str] = None, chunk_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None) -> None:
+        self.root = Path(root or Path(__file__).resolve().parent.parent / 'uploads' / '.sessions')
+        self.root.mkdir(parents=True, exist_ok=True)
+        if chunk_bytes is None:
+            try:
+                chunk_bytes = int(os.getenv('UPLOAD_CHUNK_BYTES', str(5 * 1024 * 1024)))
+            except Exception:
+                chunk_bytes = 5 * 1024 * 1024
+        self.chunk_bytes = max(64 * 1024, chunk_bytes)
+        if ttl is None:
+            try:
+                ttl = float(os.getenv('UPLOAD_SESSION_TTL', '86400'))
+            except Exception:
+                ttl = 86400.0
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # 会话ID -> (增量哈希对象, 已哈希的字节数)
+        self._hashers: Dict[str, tuple] = {}
+        # 会话ID -> 该会话的写锁（同一会话的分块串行写入）
+        self._session_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def instance(cls) -> 'UploadSessionStore':
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = UploadSessionStore()
+            return cls._instance
+
+    # ---- 路径与元数据 ----
+    def _dir(self, upload_id: str) -> Path:
+        # 会话ID只允许十六进制字符，避免路径穿越
+        if not upload_id or any(c not in '0123456789abcdef' for c in upload_id):
+            raise UploadSessionError('无效的上传会话ID', 404)
+        return self.root / upload_id
+
+    def _part(self, upload_id: str) -> Path:
+        return self._dir(upload_id) / 'data.part'
+
+    def _read_meta(self, upload_id: str) -> Dict[str, Any]:
+        path = self._dir(upload_id) / 'meta.json'
+        if not path.exists():
+            raise UploadSessionError('上传会话不存在或已过期', 404)
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, upload_id: str, meta: Dict[str, Any]) -> None:
+        path = self._dir(upload_id) / 'meta.json'
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def _session_lock(self, upload_id: str) -> threading.Lock:
+        with self._lock:
+            lock = self._session_locks.get(upload_id)
+            if lock is None:
+                lock = self._session_locks[upload_id] = threading.Lock()
+            return lock
+
+    def _state(self, upload_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+        part = self._part(upload_id)
+        received = part.stat().st_size if part.exists() else 0
+        return {
+            'uploadId': upload_id,
+            'filename': meta.get('filename'),
+            'size': meta.get('size'),
+            'received': received,
+            'chunkSize': self.chunk_bytes,
+            'complete': received >= int(meta.get('size') or 0),
+        }
+
+    def purge_expired(self) -> int:
+        """清理超过 TTL 未更新的会话目录，返回清理数量。"""
+        if self.ttl <= 0:
+            return 0
+        removed = 0
+        now = time.time()
+        try:
+            for d in self.root.iterdir():
+                try:
+                    if d.is_dir() and now - d.stat().st_mtime > self.ttl:
+                        shutil.rmtree(d, ignore_errors=True)
+                        with self._lock:
+                            self._hashers.pop(d.name, None)
+                            self._session_locks.pop(d.name, None)
+                        removed += 1
+                except Exception:
+                    continue
+        except Exception as e:
+            print(f"[UploadSession] 清理过期会话失败: {e}")
+        return removed
+
+    # ---- 对外接口 ----
+    def init(self, filename: str, size: int, mime_type: Optional[str] = None,
+             resume_key: Optional[str] = None, expected_hash: Optional[str] = None) -> Dict[str, Any]:
+        """创建会话；提供 resume_key 且对应会话仍存在时直接返回其状态（断点续传）。"""
+        size = int(size)
+        if size < 0:
+            raise UploadSessionError('文件大小无效')
+        self.purge_expired()
+        if resume_key:
+            upload_id = hashlib.sha1(f"{resume_key}|{filename}|{size}".encode('utf-8')).hexdigest()
+        else:
+            upload_id = uuid.uuid4().hex
+        d = self._dir(upload_id)
+        if (d / 'meta.json').exists():
+            meta = self._read_meta(upload_id)
+            if meta.get('filename') == filename and int(meta.get('size') or 0) == size:
+                return self._state(upload_id, meta)
+            shutil.rmtree(d, ignore_errors=True)
+        d.mkdir(parents=True, exist_ok=True)
+        meta = {
+            'filename': filename,
+            'size': size,
+            'mime_type': mime_type,
+            'expected_hash': (expected_hash or '').lower() or None,
+            'created_at': time.time(),
+        }
+        self._write_meta(upload_id, meta)
+        self._part(upload_id).touch()
+        return self._state(upload_id, meta)
+
+    def state(self, upload_id: str) -> Dict[str, Any]:
+        return self._state(upload_id, self._read_meta(upload_id))
+
+    def append(self, upload_id: str, offset: int, stream: BinaryIO) -> Dict[str, Any]:
+        """在 offset 处追加一个分块（offset 必须等于已接收字节数），返回最新状态。"""
+        meta = self._read_meta(upload_id)
+        size = int(meta.get('size') or 0)
+        part = self._part(upload_id)
+        with self._session_lock(upload_id):
+            received = part.stat().st_size if part.exists() else 0
+            if int(offset) != received:
+                raise UploadSessionError(f'分块偏移不匹配：期望 {received}，收到 {offset}', 409, received)
+            hasher = self._hasher(upload_id, received)
+            written = 0
+            try:
+                with open(part, 'ab') as out:
+                    while True:
+                        block = stream.read(HASH_BLOCK)
+                        if not block:
+                            break
+                        if received + written + len(block) > size:
+                            raise UploadSessionError('上传数据超过声明的文件大小', 400)
+                        out.write(block)
+                        hasher.update(block)
+                        written += len(block)
+            except Exception:
+                # 分块写入不完整（如连接中断）：截断回本块起点，增量哈希作废，客户端从 received 重发
+                with open(part, 'ab') as out:
+                    out.truncate(received)
+                with self._lock:
+                    self._hashers.pop(upload_id, None)
+                raise
+            with self._lock:
+                self._hashers[upload_id] = (hasher, received + written)
+        return self._state(upload_id, meta)
+
+    def _hasher(self, upload_id: str, received: int):
+        with self._lock:
+            hit = self._hashers.get(upload_id)
+        if hit is not None and hit[1] == received:
+            return hit[0]
+        # 本进程没有该会话的增量哈希（重启/多进程），从已接收的数据重新计算
+        h = hashlib.sha256()
+        with open(self._part(upload_id), 'rb') as f:
+            remaining = received
+            while remaining > 0:
+                block = f.read(min(HASH_BLOCK, remaining))
+                if not block:
+                    break
+                h.update(block)
+                remaining -= len(block)
+        return h
+
+    def complete(self, upload_id: str, target: str) -> Dict[str, Any]:
+        """校验并把文件移动到 target，删除会话，返回 {filename, size, mime_type, sha256}。"""
+        meta = self._read_meta(upload_id)
+        size = int(meta.get('size') or 0)
+        part = self._part(upload_id)
+        with self._session_lock(upload_id):
+            received = part.stat().st_size if part.exists() else 0
+            if received != size:
+                raise UploadSessionError(f'文件尚未上传完整：{received}/{size} 字节', 409, received)
+            digest = self._hasher(upload_id, received).hexdigest()
+            expected = meta.get('expected_hash')
+            if expected and expected != digest:
+                raise UploadSessionError('文件内容哈希与声明不一致，请重新上传', 400)
+            Path(target).parent.mkdir(parents=True, exist_ok=True)
+            shutil.move(str(part), target)
+            shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+            with self._lock:
+                self._hashers.pop(upload_id, None)
+                self._session_locks.pop(upload_id, None)
+        return {
+            'filename': meta.get('filename'),
+            'size': size,
+            'mime_type': meta.get('mime_type'),
+            'sha256': digest,
+        }
+
+    def discard(self, upload_id: str) -> None:
+        d = self._dir(upload_id)
+        shutil.rmtree(d, ignore_errors=True)
+        with self._lock:
+            self._hashers.pop(upload_id, None)
+            self._session_locks.pop(upload_id, None)
@@ -0,0 +1,5 @@
+# 让测试以 flask_backend 为根导入（与 app.py 的运行方式一致：from services... / from database ...）
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
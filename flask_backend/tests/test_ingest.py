@@ -0,0 +1,69 @@
+"""上传流式入库：扫描窗口之后才出现的类型变化（无需数据库，写库与 ALTER 由替身记录）。"""
+
+import pytest
+
+from services import ingest
+
+
+class _RecordingLoader:
+    """替代 database.BulkLoader：只记录写入的行。"""
+
+    def __init__(self, table, columns, *args, **kwargs):
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def load(self, rows):
+        self.rows.extend(rows)
+        return len(rows)
+
+    def stats(self):
+        return {'method': 'test', 'rows': len(self.rows), 'rows_per_sec': None}
+
+
+@pytest.fixture
+def altered(monkeypatch):
+    sqls = []
+    monkeypatch.setattr(ingest, 'BulkLoader', _RecordingLoader)
+    monkeypatch.setattr(ingest, 'execute_query', lambda sql, params=None: sqls.append(sql))
+    return sqls
+
+
+def _write_csv(tmp_path, late_id):
+    path = tmp_path / 'late.csv'
+    lines = ['id,name'] + [f'{i},n{i}' for i in range(1, 51)] + [f'{late_id},late']
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return str(path)
+
+
+def _load(path, key_columns):
+    schema = ingest.infer_schema(ingest.iter_file_chunks(path, 'late.csv', chunk_rows=10), scan_rows=20)
+    assert not schema.complete
+    columns = [str(c) for c in schema.columns]
+    for p in schema.profiles:
+        p.declare()
+    progress = []
+    chunks = ingest.iter_file_chunks(path, 'late.csv', chunk_rows=10)
+    return schema, columns, progress, lambda: ingest.insert_chunks(
+        'late', columns, chunks, [0, 1], on_progress=progress.append, schema=schema, key_columns=key_columns)
+
+
+def test_text_primary_key_after_scan_window_fails_without_altering_key(tmp_path, altered):
+    schema, _, progress, run = _load(_write_csv(tmp_path, 'abc'), key_columns=['id'])
+    assert schema.profiles[0].declared_kind == 'int'
+    with pytest.raises(ValueError, match='主键列 `id`'):
+        run()
+    assert not any('`id`' in sql for sql in altered)
+    # 出问题之前的块已提交
+    assert progress and progress[-1] == 50
+
+
+def test_non_key_column_is_still_widened(tmp_path, altered):
+    _, _, progress, run = _load(_write_csv(tmp_path, 'abc'), key_columns=())
+    stats = run()
+    assert stats['rows'] == 51
+    assert any('MODIFY COLUMN `id`' in sql for sql in altered)